@@ -1,48 +1,72 @@
 """My Horses AI — 競馬予測公開ページ"""
 
+import bisect
 import datetime
+import functools
+import io
 import json
+import os
 import re
+import threading
+import uuid
+import zipfile
 from pathlib import Path
 
 import pandas as pd
 import streamlit as st
+import streamlit.components.v1 as components
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 try:
     from model.odds_signals import detect_odds_crash
 except ImportError:
     detect_odds_crash = None  # sync 前の環境でも起動できるようにフォールバック
+from model import bootstrap
+from model import calibration
+from model import compact_rows
+from model import confidence_rules
+from model import profiling
+from model.archive import day_horse_rows, day_race_rows, horse_frame, race_frame, race_summary
+from model.comment_index import CommentIndex
+from model.exotic_bets import BET_TYPES, rank_race
+from model.file_watch import FileWatcher
+from model.horse_index import HorseIndex
+from model.live_odds import LiveOddsFeed
+from model.mmap_store import MappedStore
+from model.perf_cube import PerfCube
+from model import market
+from model import mmap_store
+from model import perf_cube
+from model import pred_versions
+from model import race_store
+from model.race_index import STATUSES as RACE_STATUSES, RaceIndex
+from model import shap_factors
+from model import staking
+from model import threshold_search
+from model.prefetch import Prefetcher
+from model.pred_codec import SUFFIX as MHP_SUFFIX, find_prediction_files, load_prediction
+from model.race_signals import (
+    SIGNALS, blind_spot_check, is_dirt_chusho_agree, is_promising, scan_archive, summarize_hits,
+)
 
 APP_DIR = Path(__file__).resolve().parent
 PREDICTIONS_DIR = APP_DIR / "data" / "predictions"
 AI_COMMENTS_DIR = APP_DIR / "data" / "ai_comments"
 STRATEGY_DIR = APP_DIR / "data" / "strategy"
 SCHEDULE_PATH = APP_DIR / "data" / "2026重賞レーススケジュール.txt"
-
-
-def _blind_spot_check(predictions: list[dict]) -> list[dict]:
-    """AIの死角レース判定: キャリア5戦未満・5番人気以内なのにAI予測順位が著しく低い馬を返す。"""
-    result = []
-    for p in predictions:
-        try:
-            pop = int(p.get("人気") or 99)
-        except (TypeError, ValueError):
-            continue
-        if pop <= 0 or pop > 5:
-            continue
-        try:
-            pred_rank = int(p.get("予測順位") or 99)
-        except (TypeError, ValueError):
-            continue
-        if pred_rank - pop < 7:
-            continue
-        career = p.get("career", 99)
-        if career >= 5:
-            continue
-        result.append({**p, "_career": career, "_gap": pred_rank - pop})
-    return sorted(result, key=lambda x: x["_gap"], reverse=True)
-
-
+RACE_STORE_DIR = STRATEGY_DIR / ".race_store"
+RACE_INDEX_DIR = APP_DIR / "data" / ".race_index"
+PRED_VERSIONS_DIR = PREDICTIONS_DIR / pred_versions.VERSIONS_DIR
+LIVE_ODDS_DIR = APP_DIR / "data" / "live_odds"  # ライブオッズのスナップショット置き場
+LIVE_REFRESH_SEC = 10  # ライブオッズ表示の自動更新間隔
+COMMENT_SEARCH_LIMIT = 200  # AIコメント検索で表に出す最大件数
+# 重賞カレンダー（components/race_calendar/index.html。ビルド不要の素の JS）
+_race_calendar = components.declare_component("race_calendar", path=str(APP_DIR / "components" / "race_calendar"))
+# 全レプリカで共有する mmap ストア（共有ボリュームに置く場合は環境変数で指定）
+STORE_PATH = Path(os.environ.get("MYHORSES_STORE", APP_DIR / "data" / mmap_store.DEFAULT_NAME))
+
+
+@profiling.timed("signals.odds_crash")
 def _show_odds_crash(preds: list[dict]) -> None:
     """オッズ急落馬（前日夜→最終 40%以上下落）を警告表示する。"""
     if detect_odds_crash is None:
@@ -81,75 +105,465 @@ def _show_odds_crash(preds: list[dict]) -> None:
     )
 
 
+# ─── ライブオッズ ─────────────────────────────────────
+@st.cache_resource
+def _live_feed() -> LiveOddsFeed:
+    """全セッション共有のライブオッズ取り込み（asyncio ループは専用スレッドで動く）。"""
+    feed = LiveOddsFeed(LIVE_ODDS_DIR, interval=2.0)
+    feed.start()
+    return feed
+
+
+@st.fragment(run_every=LIVE_REFRESH_SEC)
+def _live_odds_panel(race_ids: tuple[str, ...]) -> None:
+    """ライブオッズで再計算した期待値・急落・推奨の変化（この部分だけ定期的に再描画する）。"""
+    results = _live_feed().results(race_ids)
+    if not results:
+        st.caption(
+            f"`data/live_odds/` にこの日のオッズのスナップショットが届くと表示します"
+            f"（{LIVE_REFRESH_SEC}秒ごとに確認）。"
+        )
+        return
+    for res in results:
+        with st.container(border=True):
+            st.markdown(f"**📡 {res['race_name']}**　オッズ取得 {res['fetched_at'] or '不明'}　（再計算 {res['updated_at'][11:]}）")
+            if res["added"]:
+                st.success("期待値 1.0 以上に浮上: " + "、".join(f"{n} {name}" for n, name in res["added"]))
+            if res["dropped"]:
+                st.warning("期待値 1.0 を割り込み: " + "、".join(f"{n} {name}" for n, name in res["dropped"]))
+            _show_odds_crash(res["predictions"])
+            live_df = pd.DataFrame(res["predictions"])
+            cols = [c for c in ["予測順位", "馬番", "馬名", "単勝_base", "単勝", "人気", "期待値_base", "期待値",
+                                "ΔEV", "ΔEV_前回", "kelly_f"] if c in live_df.columns]
+            live_df = live_df[cols].rename(columns={"単勝_base": "単勝(予測時)", "期待値_base": "期待値(予測時)"})
+            st.dataframe(
+                live_df.style.format(
+                    {"単勝(予測時)": "{:.1f}", "単勝": "{:.1f}", "期待値(予測時)": "{:.2f}", "期待値": "{:.2f}",
+                     "ΔEV": "{:+.2f}", "ΔEV_前回": "{:+.2f}", "kelly_f": "{:.4f}"},
+                    na_rep="-",
+                ).apply(
+                    lambda row: ["background-color: #d4edda" if (row.get("期待値") or 0) >= 1.0 else ""] * len(row),
+                    axis=1,
+                ),
+                use_container_width=True, hide_index=True,
+            )
+
+
+# ─── 予測の版（前日 → 10時 → 13時） ─────────────────────────
+def _version_label(v: dict) -> str:
+    return f"{v['label']}（生成 {v['generated_at'] or '不明'}）"
+
+
+def _version_choices(versions_file: str, pred_path: str) -> list[tuple[int | None, str]]:
+    """版の選択肢 [(版番号, 表示名)]。版番号 None は現在の予測ファイル（常に末尾）。
+
+    最後に記録した版が現在のファイルと同じならその版を現在のファイルとして扱い、
+    違えば（記録が失敗・省略された）「現在のファイル（未記録）」を末尾に足す。
+    """
+    watcher = _file_watcher()
+    versions = pred_versions.versions_of(_load_versions(versions_file))
+    choices: list[tuple[int | None, str]] = [(v["index"], _version_label(v)) for v in versions]
+    if choices and _latest_version_is_current(
+        versions_file, watcher.signature(Path(versions_file)), pred_path, watcher.signature(Path(pred_path)),
+    ):
+        choices[-1] = (None, choices[-1][1])
+    else:
+        choices.append((None, "現在のファイル（未記録）"))
+    return choices
+
+
+def _version_diff_view(date: str, path_str: str, choices: list[tuple[int | None, str]], current: dict) -> None:
+    """2つの版の勝負度・推奨と馬ごとの予測順位・勝率・オッズ・期待値の変化。"""
+    last = len(choices) - 1
+    c1, c2 = st.columns(2)
+    a = c1.selectbox("比較元", range(len(choices)), index=0, key=f"pred_diff_a_{date}",
+                     format_func=lambda i: choices[i][1])
+    b = c2.selectbox("比較先", range(len(choices)), index=last, key=f"pred_diff_b_{date}",
+                     format_func=lambda i: choices[i][1])
+    old = current if choices[a][0] is None else _load_pred_version(path_str, choices[a][0])
+    new = current if choices[b][0] is None else _load_pred_version(path_str, choices[b][0])
+    race_df = pd.DataFrame(pred_versions.race_changes(old, new))
+    if not race_df.empty:
+        race_df = race_df[(race_df["勝負度_前"] != race_df["勝負度_後"]) | (race_df["EV推奨_前"] != race_df["EV推奨_後"])]
+    if not race_df.empty:
+        st.markdown("**勝負度・EV推奨が変わったレース**")
+        st.dataframe(race_df.drop(columns=["race_id"]), use_container_width=True, hide_index=True)
+    horse_df = pd.DataFrame(pred_versions.horse_changes(old, new))
+    if horse_df.empty:
+        st.caption("比較できる馬がありません。")
+        return
+    changed = pd.Series(False, index=horse_df.index)
+    for field in ["予測順位", "勝率(%)", "calibrated_prob(%)", "単勝", "期待値"]:
+        a_col, b_col = horse_df[f"{field}_前"], horse_df[f"{field}_後"]
+        changed |= a_col.ne(b_col) & ~(a_col.isna() & b_col.isna())
+    horse_df = horse_df[changed]
+    if horse_df.empty:
+        st.caption("馬ごとの予測順位・勝率・オッズ・期待値に変化はありません。")
+        return
+    horse_df = horse_df.assign(
+        Δ順位=pd.to_numeric(horse_df["予測順位_後"], errors="coerce") - pd.to_numeric(horse_df["予測順位_前"], errors="coerce"),
+        Δ期待値=pd.to_numeric(horse_df["期待値_後"], errors="coerce") - pd.to_numeric(horse_df["期待値_前"], errors="coerce"),
+    )
+    st.markdown(f"**変化のあった馬（{len(horse_df)}頭）**")
+    st.dataframe(
+        horse_df.drop(columns=["race_id"]).style.format(
+            {"Δ順位": "{:+.0f}", "Δ期待値": "{:+.2f}", "単勝_前": "{:.1f}", "単勝_後": "{:.1f}",
+             "期待値_前": "{:.2f}", "期待値_後": "{:.2f}"},
+            na_rep="-",
+        ),
+        use_container_width=True, hide_index=True,
+    )
+
+
+# ─── ファイル単位キャッシュ（TTLなし・変更検知で該当エントリだけ破棄） ──────
+@st.cache_resource
+def _file_watcher() -> FileWatcher:
+    return FileWatcher([
+        (PREDICTIONS_DIR, "*.json"),
+        (PREDICTIONS_DIR, f"*{MHP_SUFFIX}"),
+        (PRED_VERSIONS_DIR, f"*{pred_versions.SUFFIX}"),
+        (AI_COMMENTS_DIR, "*.json"),
+        (SCHEDULE_PATH.parent, SCHEDULE_PATH.name),
+        (STRATEGY_DIR, "*.csv"),
+    ])
+
+
+@st.cache_resource
+def _mapped_store() -> MappedStore:
+    """プロセス共有の mmap ストア。開けなければ作ってみる（書き込めない環境では元ファイルを読む）。"""
+    store = MappedStore(STORE_PATH)
+    store.refresh()
+    if not store.active:
+        _rebuild_store()
+        store.refresh()
+    return store
+
+
+def _from_store(path: Path):
+    """path の中身をストアから取る。ストアが無い・元ファイルと鮮度が違うときは None。"""
+    try:
+        rel = path.relative_to(APP_DIR / "data").as_posix()
+    except ValueError:
+        return None
+    return _mapped_store().get(rel, _file_watcher().signature(path))
+
+
+@st.cache_resource
+def _prefetcher() -> Prefetcher:
+    """全セッション共有の先読みスレッドプール。"""
+    return Prefetcher(max_workers=2, max_pending=24)
+
+
+def _rebuild_store() -> None:
+    """ストアが古ければ作り直す。ロックを取った1プロセスだけが書き、他のレプリカは refresh() で拾う。"""
+    try:
+        mmap_store.build_if_stale(APP_DIR / "data", STORE_PATH)
+    except OSError:
+        pass
+
+
+@profiling.cache_probe("pred_file")
+@st.cache_data(show_spinner=False)
+def _load_pred_file(path_str: str) -> dict:
+    """予測ファイル1件を読み込む（.json / .mhp。鮮度の合う mmap ストアがあればそこから）。
+
+    馬・結果などの行は列指向の RowTable にして持つ（dict と同じく読める。キャッシュのコピーも小さい）。
+    """
+    profiling.record_miss("pred_file")
+    path = Path(path_str)
+    data = _from_store(path)
+    return compact_rows.compact(data if data is not None else load_prediction(path))
+
+
+@profiling.cache_probe("day_rows")
+@st.cache_data(show_spinner=False)
+def _load_day_rows(path_str: str) -> tuple[list[dict], list[dict]]:
+    """予測ファイル1件を分析用の (レース行, 馬行) に展開する。"""
+    profiling.record_miss("day_rows")
+    data = _load_pred_file(path_str)
+    date = Path(path_str).stem
+    return day_race_rows(date, data), day_horse_rows(date, data)
+
+
+@profiling.cache_probe("day_calibration")
+@st.cache_data(show_spinner=False)
+def _load_day_calibration(path_str: str) -> pd.DataFrame:
+    """予測ファイル1件分のキャリブレーション十分統計量（結果が無い日は空）。"""
+    profiling.record_miss("day_calibration")
+    race_rows, horse_rows = _load_day_rows(path_str)
+    return calibration.day_stats(horse_rows, race_rows)
+
+
+@profiling.cache_probe("day_factors")
+@st.cache_data(show_spinner=False)
+def _load_day_factors(path_str: str) -> dict[str, list]:
+    """予測ファイル1件分の SHAP 要因（1要因1行の列指向 dict）。"""
+    profiling.record_miss("day_factors")
+    return shap_factors.day_factor_rows(Path(path_str).stem, _load_pred_file(path_str))
+
+
+@profiling.cache_probe("day_race_flags")
+@st.cache_data(show_spinner=False)
+def _day_race_flags(path_str: str) -> dict[str, dict[str, bool]]:
+    """予測ファイル1件分のレース別シグナル判定 {race_id: {promising, dirt_agree}}（カレンダー表示用）。"""
+    profiling.record_miss("day_race_flags")
+    return {
+        race.get("race_id", ""): {
+            "promising": is_promising(race),
+            "dirt_agree": is_dirt_chusho_agree(race),
+        }
+        for race in _load_pred_file(path_str).get("races") or []
+    }
+
+
+@profiling.cache_probe("pred_versions")
+@st.cache_data(show_spinner=False)
+def _load_versions(path_str: str) -> dict:
+    """予測の版ファイル1件（1日分。無ければ版なし）。"""
+    profiling.record_miss("pred_versions")
+    return pred_versions.read_file(Path(path_str))
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _latest_version_is_current(versions_file: str, versions_sig: tuple | None, pred_path: str, pred_sig: tuple | None) -> bool:
+    """最後に記録した版が現在の予測ファイルと同じか（両ファイルのシグネチャがキー）。"""
+    latest = pred_versions.load_version(_load_versions(versions_file))
+    return latest is not None and latest == load_prediction(Path(pred_path))
+
+
+@profiling.cache_probe("pred_version")
+@st.cache_data(show_spinner=False, max_entries=32)
+def _load_pred_version(path_str: str, index: int) -> dict:
+    """版ファイルの index 番目の版を復元する。"""
+    profiling.record_miss("pred_version")
+    return compact_rows.compact(pred_versions.load_version(_load_versions(path_str), index))
+
+
+def _day_market(date: str, data: dict) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """予測データ1日分の市場確率・エッジ（馬単位, レース単位）。"""
+    horses = market.market_frame(horse_frame([day_horse_rows(date, data)]))
+    return horses, market.race_market(horses)
+
+
+@profiling.cache_probe("day_market")
+@st.cache_data(show_spinner=False)
+def _load_day_market(path_str: str) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """予測ファイル1件分の市場確率・オーバーラウンド・エッジ・kelly_f（全レース一括で計算）。"""
+    profiling.record_miss("day_market")
+    return _day_market(Path(path_str).stem, _load_pred_file(path_str))
+
+
+# 組み合わせ確率の表の数値書式（Styler より描画が軽い）
+EXOTIC_COLUMN_CONFIG = {
+    "確率(%)": st.column_config.NumberColumn(format="%.2f"),
+    "理論オッズ": st.column_config.NumberColumn(format="%.1f"),
+    "オッズ": st.column_config.NumberColumn(format="%.1f"),
+    "期待値": st.column_config.NumberColumn(format="%.2f"),
+}
+
+
+@profiling.cache_probe("race_exotics")
+@st.cache_data(show_spinner=False, max_entries=256)
+def _race_exotics(path_str: str, sig: tuple | None, version: int | None, race_id: str, prob_key: str) -> pd.DataFrame:
+    """1レースの組み合わせ確率上位（rank_race）。version が None なら予測ファイル、そうでなければ版ファイルの版。
+
+    sig（ファイルシグネチャ）をキーに含めるので、ファイルが変われば別エントリになる。
+    """
+    profiling.record_miss("race_exotics")
+    # 予測ファイルはストアからそのレースだけを読む（日付1件分を展開しない）
+    race = _mapped_store().race(Path(path_str).stem, race_id, sig) if version is None else None
+    if race is None:
+        data = _load_pred_file(path_str) if version is None else _load_pred_version(path_str, version)
+        race = next((r for r in data.get("races") or [] if str(r.get("race_id", "")) == race_id), {})
+    return rank_race(race.get("predictions") or [], prob_key=prob_key)
+
+
+def _race_market_cols(day_market: pd.DataFrame, race_id: str, umaban: pd.Series) -> pd.DataFrame:
+    """1レース分の市場列を馬番で引いて umaban の並びに合わせる。"""
+    rows = day_market[day_market["race_id"] == race_id].drop_duplicates("馬番").set_index("馬番")
+    key = pd.to_numeric(umaban, errors="coerce")
+    return pd.DataFrame(
+        {c: key.map(rows[c]).to_numpy() for c in ["市場確率(%)", "エッジ(%)", "kelly_f"]}, index=umaban.index,
+    )
+
+
+def _edge_caption(race_row: dict | None) -> str:
+    """レース単位の市場指標の1行表示（単勝が無ければ空文字）。"""
+    if not race_row or pd.isna(race_row.get("オーバーラウンド")):
+        return ""
+    text = f"オーバーラウンド {race_row['オーバーラウンド']:.3f}（控除率 {race_row['控除率(%)']:.1f}%）"
+    if pd.notna(race_row.get("最大エッジ(%)")):
+        text += (f"　最大エッジ: {int(race_row['最大エッジ馬番'])} {race_row['最大エッジ馬名']}"
+                 f"（{race_row['最大エッジ(%)']:+.1f}pt）")
+    return text
+
+
+@profiling.cache_probe("ai_comments_file")
+@st.cache_data(show_spinner=False)
+def _load_ai_comments_file(path_str: str) -> dict:
+    """AIコメントファイル1件を読み込む。形式: {race_id: {馬名: コメント}}"""
+    profiling.record_miss("ai_comments_file")
+    data = _from_store(Path(path_str))
+    if data is not None:
+        return data
+    try:
+        with open(path_str, encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+# ─── スケジュール解析（インライン） ──────────────────────────
+@profiling.cache_probe("schedule")
+@st.cache_data(show_spinner=False)
+def _load_schedule() -> list[dict]:
+    """TSVスケジュールファイルをパースして返す"""
+    profiling.record_miss("schedule")
+    races: list[dict] = []
+    raw = _from_store(SCHEDULE_PATH)
+    if raw is not None:
+        lines = raw.decode("utf-8").splitlines()
+    elif SCHEDULE_PATH.exists():
+        lines = SCHEDULE_PATH.read_text(encoding="utf-8").splitlines()
+    else:
+        return races
+    for i, line in enumerate(lines):
+        if i == 0 or not line.strip():
+            continue
+        parts = line.split("\t")
+        if len(parts) < 7:
+            continue
+        date_str, race_name, grade, venue, distance, condition, weight = parts[:7]
+        m = re.match(r"(\d{2})/(\d{2})", date_str)
+        if not m:
+            continue
+        month_n, day_n = int(m.group(1)), int(m.group(2))
+        races.append({
+            "date": datetime.date(2026, month_n, day_n),
+            "race_name": race_name,
+            "grade": grade,
+            "venue": venue,
+            "distance": distance,
+        })
+    return races
+
+
+def _invalidate_changed_files() -> None:
+    """前回のリラン以降に変わったファイルのキャッシュだけを破棄する。
+
+    変更があれば mmap ストアも裏で作り直す（作り直すまでは変わったファイルだけ元ファイルを読む）。
+    作り直しは build_if_stale なので、同じ変更を見たレプリカのうち実際に書くのは1つだけ。
+    """
+    store = _mapped_store()
+    store.refresh()  # 他のプロセス（sync_and_push.sh・別レプリカ）が差し替えたストアに切り替える
+    changed = _file_watcher().poll()
+    if changed and store.active:
+        token = tuple(sorted((str(p), _file_watcher().signature(p)) for p in changed))
+        _prefetcher().request("mmap_store", [("mmap_store", token, _rebuild_store)])
+    for path in changed:
+        if path == SCHEDULE_PATH:
+            _load_schedule.clear()
+        elif path.parent == AI_COMMENTS_DIR:
+            _load_ai_comments_file.clear(str(path))
+        elif path.parent == PRED_VERSIONS_DIR:
+            _load_versions.clear(str(path))
+            _load_pred_version.clear()  # 版番号もキーなので1日分だけは消せない（更新は1日数回）
+        elif path.parent == PREDICTIONS_DIR:
+            _load_pred_file.clear(str(path))
+            _load_day_rows.clear(str(path))
+            _load_day_calibration.clear(str(path))
+            _load_day_factors.clear(str(path))
+            _day_race_flags.clear(str(path))
+            _load_day_market.clear(str(path))
+        # 戦略CSVはシグネチャをキーにしたキャッシュなので破棄不要
+
+
+@profiling.cache_probe("filter_results")
+@st.cache_data(show_spinner=False, max_entries=2)
+def _load_filter_results(csv_sig: tuple | None) -> pd.DataFrame:
+    """filter_results.csv（csv_sig はキャッシュキー用のファイルシグネチャ）。"""
+    profiling.record_miss("filter_results")
+    csv_path = STRATEGY_DIR / "filter_results.csv"
+    raw = _from_store(csv_path)
+    return pd.read_csv(io.BytesIO(raw) if raw is not None else csv_path)
+
+
+@profiling.cache_probe("race_store")
+@st.cache_data(show_spinner=False, max_entries=2)
+def _race_store_manifest(csv_sig: tuple | None) -> dict:
+    """race_analysis.csv の新規行だけをカラムナストアに取り込み、累計集計を返す。"""
+    profiling.record_miss("race_store")
+    csv_path = STRATEGY_DIR / "race_analysis.csv"
+    try:
+        return race_store.sync(csv_path, RACE_STORE_DIR)
+    except OSError:
+        return race_store.summarize_frame(pd.read_csv(csv_path))  # 書き込めない環境
+
+
+def _load_race_analysis(race_sig: tuple | None) -> pd.DataFrame:
+    """race_analysis.csv の全レース（カラムナストアから。使えなければ CSV を直接読む）。"""
+    csv_path = STRATEGY_DIR / "race_analysis.csv"
+    manifest = _race_store_manifest(race_sig)
+    if race_store.read_manifest(RACE_STORE_DIR) is not None:
+        try:
+            return race_store.load_frame(RACE_STORE_DIR, manifest)
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            pass
+    return pd.read_csv(csv_path)
+
+
+@profiling.cache_probe("roi_bootstrap")
+@st.cache_data(show_spinner="回収率の信頼区間を計算中...", max_entries=2)
+def _roi_intervals(filter_sig: tuple | None, race_sig: tuple | None) -> pd.DataFrame:
+    """filter_results の全条件に回収率の95%信頼区間を付与（両CSVのシグネチャ = データ版でキャッシュ）。"""
+    profiling.record_miss("roi_bootstrap")
+    return bootstrap.roi_intervals(_load_race_analysis(race_sig), _load_filter_results(filter_sig))
+
+
+@st.cache_resource
+def _comment_index() -> CommentIndex:
+    """全セッション共有の AIコメント n-gram インデックス（sync で変更ファイル分だけ更新）。"""
+    return CommentIndex()
+
+
+@profiling.timed("load.comment_index")
+def _synced_comment_index() -> CommentIndex:
+    index = _comment_index()
+    if AI_COMMENTS_DIR.exists():
+        watcher = _file_watcher()
+        files_sig = tuple((str(p), watcher.signature(p)) for p in sorted(AI_COMMENTS_DIR.glob("*.json")))
+        index.sync(files_sig, _load_ai_comments_file)
+    return index
+
+
+@profiling.timed("load.ai_comments_for_race")
 def _load_ai_comments_for_race(race_id: str) -> dict:
     """race_idに対応するAIコメントを全ファイルから検索する。形式: {馬名: コメント}"""
     if not AI_COMMENTS_DIR.exists():
         return {}
     for path in sorted(AI_COMMENTS_DIR.glob("*.json"), reverse=True):
-        try:
-            with open(path, encoding="utf-8") as f:
-                data = json.load(f)
-            if race_id in data:
-                return data[race_id]
-        except Exception:
-            continue
+        data = _load_ai_comments_file(str(path))
+        if race_id in data:
+            return data[race_id]
     return {}
 
 st.set_page_config(page_title="My Horses AI 予測", page_icon="🏇", layout="wide")
 
+# ─── リラン計測（?admin=<MYHORSES_ADMIN_TOKEN> で管理パネル、MYHORSES_PROFILE=1 で構造化ログ） ──
+_admin_mode = profiling.admin_allowed(st.query_params.get("admin"))
+prof = profiling.activate(_admin_mode or profiling.env_enabled())
+
 # ─── モバイル対応CSS ──────────────────────────────────────────
 st.markdown(
     """
 <style>
-div[data-testid="column"] .stButton > button {
-    padding: 2px 0 !important;
-    font-size: 0.72rem !important;
-    line-height: 1.35 !important;
-    white-space: pre-wrap !important;
-    text-align: center !important;
-    min-height: 48px !important;
-}
-/* カレンダー：土曜（6列目）→ 青枠 */
-div[data-testid="column"]:nth-child(6) .stButton > button,
-[data-testid="stColumn"]:nth-child(6) .stButton > button {
-    border: 2px solid #1565c0 !important;
-}
-/* カレンダー：日曜（7列目）→ 赤枠 */
-div[data-testid="column"]:nth-child(7) .stButton > button,
-[data-testid="stColumn"]:nth-child(7) .stButton > button {
-    border: 2px solid #c62828 !important;
-}
-/* 曜日ヘッダー */
-.cal-week-header {
-    display: grid;
-    grid-template-columns: repeat(7, 1fr);
-    gap: 0.5rem;
-    margin-bottom: 4px;
-}
 @media (max-width: 640px) {
     .block-container {
         padding-left: 0.5rem !important;
         padding-right: 0.5rem !important;
         padding-top: 0.5rem !important;
     }
-    div[data-testid="column"] .stButton > button {
-        font-size: 0.6rem !important;
-        min-height: 44px !important;
-    }
     h1 { font-size: 1.3rem !important; }
-    /* スマホでは曜日ヘッダーを非表示 */
-    .cal-week-header { display: none !important; }
-    /* カレンダーナビ行のみ横並び固定 */
-    div:has(.cal-nav-anchor) + div [data-testid="stHorizontalBlock"],
-    div:has(.cal-nav-anchor) + div [data-testid="stColumns"] {
-        flex-direction: row !important;
-        flex-wrap: nowrap !important;
-        align-items: center !important;
-    }
-    div:has(.cal-nav-anchor) + div [data-testid="column"],
-    div:has(.cal-nav-anchor) + div [data-testid="stColumn"] {
-        min-width: 0 !important;
-    }
 }
 </style>
 """,
@@ -165,33 +579,302 @@ if "cal_selected" not in st.session_state:
     st.session_state.cal_selected = today.isoformat()
 
 # ── タブ構成 ──
-tab_pred, tab_fight, tab_cal, tab_bt = st.tabs(
-    ["📁 予測一覧", "🔥 勝負レース", "📅 カレンダー", "📈 バックテスト成績"]
+tab_pred, tab_fight, tab_cal, tab_bt, tab_arc = st.tabs(
+    ["📁 予測一覧", "🔥 勝負レース", "📅 カレンダー", "📈 バックテスト成績", "🔍 アーカイブ分析"]
 )
 
 # ====================================================================
 # 共通: 予測JSON読み込み
 # ====================================================================
-if PREDICTIONS_DIR.exists():
-    json_files = sorted(PREDICTIONS_DIR.glob("*.json"), reverse=True)
-else:
-    json_files = []
+with prof.span("load.invalidate"):
+    _invalidate_changed_files()
+
+# {日付: パス}。コンパクト形式（.mhp）が JSON と鮮度一致していればそちらを読む
+with prof.span("load.list_files"):
+    pred_files = find_prediction_files(PREDICTIONS_DIR)
+json_files = sorted(pred_files.values(), key=lambda p: p.stem, reverse=True)
+
+
+def _archive_signature() -> tuple:
+    """全予測ファイルの (パス, (mtime_ns, size))。アーカイブ全体の派生データのキャッシュキー。"""
+    watcher = _file_watcher()
+    return tuple((str(p), watcher.signature(p)) for p in pred_files.values())
+
+
+@profiling.cache_probe("archive_frames")
+@st.cache_data(show_spinner=False, max_entries=4)
+def _archive_frames(archive_sig: tuple) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """全期間の (レースサマリー, 馬テーブル)。日別の展開はファイル単位キャッシュを再利用する。"""
+    profiling.record_miss("archive_frames")
+    day_rows = [_load_day_rows(path_str) for path_str, _ in archive_sig]
+    races = race_frame(r for r, _ in day_rows)
+    horses = horse_frame(h for _, h in day_rows)
+    return race_summary(races, horses), horses
+
+
+@profiling.cache_probe("signal_hits")
+@st.cache_data(show_spinner=False, max_entries=4)
+def _signal_hits(archive_sig: tuple) -> pd.DataFrame:
+    """全登録シグナルの全期間ヒット表。"""
+    profiling.record_miss("signal_hits")
+    summary, horses = _archive_frames(archive_sig)
+    return scan_archive(summary, horses)
+
+
+@profiling.cache_probe("threshold_search")
+@st.cache_data(show_spinner="閾値の全組み合わせを評価中...", max_entries=8)
+def _threshold_search(archive_sig: tuple, signal: str, train_frac: float) -> tuple[pd.DataFrame, str]:
+    """シグナル閾値のグリッドサーチ結果（アプリ内ではプロセスを起こさずその場で評価する）。"""
+    profiling.record_miss("threshold_search")
+    summary, horses = _archive_frames(archive_sig)
+    return threshold_search.search(summary, horses, signal, train_frac, workers=1)
+
+
+def _heat(df: pd.DataFrame) -> pd.DataFrame:
+    """値の大小を緑の濃さで表すセルスタイル（NaN は無色）。"""
+    lo, hi = df.min().min(), df.max().max()
+    span = hi - lo if hi > lo else 1.0
+    return df.apply(lambda col: [
+        "" if pd.isna(v) else f"background-color: rgba(40, 167, 69, {0.1 + 0.6 * (v - lo) / span:.2f})"
+        for v in col
+    ])
+
+
+@profiling.cache_probe("confidence_rescore")
+@st.cache_data(show_spinner=False, max_entries=2)
+def _confidence_rescore(archive_sig: tuple, filter_sig: tuple | None) -> pd.DataFrame:
+    """全期間のレースを filter_results.csv の現行条件で勝負度を付け直した表（どちらかが変われば再計算）。"""
+    profiling.record_miss("confidence_rescore")
+    summary, _ = _archive_frames(archive_sig)
+    rules = confidence_rules.compile_rules(_load_filter_results(filter_sig))
+    return confidence_rules.rescore(summary, rules)
+
+
+@st.cache_resource
+def _horse_index() -> HorseIndex:
+    """全セッション共有の 馬名 → 出走履歴 インデックス（sync で変更ファイル分だけ更新）。"""
+    return HorseIndex()
+
+
+@profiling.timed("load.horse_index")
+def _synced_horse_index() -> HorseIndex:
+    index = _horse_index()
+    index.sync(_archive_signature(), _load_day_rows)
+    return index
+
+
+@st.cache_resource
+def _race_index() -> RaceIndex:
+    """全セッション共有のレース範囲インデックス（ディスクに保存。sync で変更ファイル分だけ更新）。"""
+    return RaceIndex(RACE_INDEX_DIR)
+
+
+@profiling.timed("load.race_index")
+def _synced_race_index() -> RaceIndex:
+    index = _race_index()
+    index.sync(_archive_signature(), _load_pred_file)
+    return index
+
+
+@st.cache_resource
+def _perf_cube() -> PerfCube:
+    """全セッション共有の成績キューブ（sync で変更ファイル分だけ足し引きする）。"""
+    return PerfCube()
+
+
+@profiling.timed("load.perf_cube")
+def _synced_perf_cube() -> PerfCube:
+    cube = _perf_cube()
+    cube.sync(_archive_signature(), _load_day_rows)
+    return cube
+
+
+CUBE_DIM_LABELS = {"venue": "競馬場", "grade": "グレード"}
+
+
+def _cube_dim_label(dim: str) -> str:
+    return CUBE_DIM_LABELS.get(dim, dim)
+
+
+FIGHT_PAGE_SIZE = 20
+CONF_ICONS = {3: "🔥", 2: "⚡", 1: "💧", 0: "❄️"}
+
+
+def _fight_range_view() -> None:
+    """複数日の勝負レース（レース範囲インデックスで検索し、表示するページの日だけ予測ファイルを読む）。"""
+    index = _synced_race_index()
+    span = index.date_range()
+    if span is None:
+        st.info("予測データがありません。")
+        return
+    first, last = (datetime.date.fromisoformat(d) for d in span)
+    c1, c2, c3 = st.columns([2, 1, 1])
+    picked = c1.date_input(
+        "期間", value=(max(first, last.replace(day=1)), last), min_value=first, max_value=last,
+        key="fight_range_dates",
+    )
+    min_level = c2.slider("最低勝負度", 0, 3, 2, key="fight_range_min_conf")
+    status = c3.selectbox("結果", ["すべて"] + RACE_STATUSES, key="fight_range_status")
+    c4, c5 = st.columns(2)
+    grade_opts = [g for g in index.values("grade") if g]
+    grades = c4.multiselect("グレード", grade_opts, default=grade_opts, key="fight_range_grades")
+    surface_opts = [s for s in index.values("芝ダ") if s]
+    surfaces = c5.multiselect("芝ダ", surface_opts, default=surface_opts, key="fight_range_surfaces")
+    if not isinstance(picked, (tuple, list)) or len(picked) != 2:
+        st.caption("期間の終わりの日付を選んでください。")
+        return
+
+    query = dict(
+        start=picked[0].isoformat(), end=picked[1].isoformat(), min_level=min_level,
+        grades=set(grades) | ({""} if len(grades) == len(grade_opts) else set()),  # 全選択ならグレード無しも含める
+        surfaces=set(surfaces) | ({""} if len(surfaces) == len(surface_opts) else set()),
+        status=None if status == "すべて" else status,
+    )
+    total, _ = index.query(**query, limit=0)
+    if total == 0:
+        st.info("条件に合うレースはありません。")
+        return
+    pages = -(-total // FIGHT_PAGE_SIZE)
+    if st.session_state.get("fight_range_page", 1) > pages:  # 条件を絞ってページ数が減った
+        st.session_state["fight_range_page"] = 1
+    # 値は session_state だけで持つ（上で書き換えるので、default 付きで作ると Streamlit が警告する）
+    page = st.number_input(f"ページ（全{pages}）", 1, pages, key="fight_range_page") if pages > 1 else 1
+    _, rows = index.query(**query, offset=(page - 1) * FIGHT_PAGE_SIZE, limit=FIGHT_PAGE_SIZE)
+    st.caption(f"{total}レース（{(page - 1) * FIGHT_PAGE_SIZE + 1}〜{(page - 1) * FIGHT_PAGE_SIZE + len(rows)}件目）")
+
+    for row in rows:
+        header = f"{CONF_ICONS.get(row['level'], '')} {row['label']} — {row['date']} {row['race_name']}"
+        if row["grade"]:
+            header += f" ({row['grade']})"
+        header += f" {row['distance']}　{'✅' if row['status'] == RACE_STATUSES[0] else '⏳'}{row['status']}"
+        with st.expander(header):
+            if row["reason"]:
+                st.caption(row["reason"])
+            path = pred_files.get(row["date"])
+            race = next(
+                (r for r in _load_pred_file(str(path)).get("races") or [] if str(r.get("race_id")) == row["race_id"]),
+                None,
+            ) if path is not None else None
+            if race is None:
+                continue
+            preds = pd.DataFrame(race.get("predictions") or [])
+            if not preds.empty:
+                cols = [c for c in ["予測順位", "馬番", "馬名", "勝率(%)", "単勝", "人気", "期待値"] if c in preds.columns]
+                st.dataframe(
+                    preds[cols].sort_values("予測順位").head(5).style.format(
+                        {"単勝": "{:.1f}", "期待値": "{:.2f}"}, na_rep="-",
+                    ),
+                    use_container_width=True, hide_index=True,
+                )
+            result = race.get("result") or []
+            if result:
+                st.caption("結果: " + " / ".join(
+                    f"{r.get('着順')}着 {r.get('馬番')} {r.get('馬名')}" for r in result[:3]
+                ))
+
+
+@profiling.cache_probe("factor_frame")
+@st.cache_data(show_spinner=False, max_entries=4)
+def _factor_frame(archive_sig: tuple) -> pd.DataFrame:
+    """全期間の SHAP 要因テーブル（日別の展開はファイル単位キャッシュを再利用する）。"""
+    profiling.record_miss("factor_frame")
+    return shap_factors.factor_frame(_load_day_factors(path_str) for path_str, _ in archive_sig)
+
+
+@profiling.cache_probe("shap_drift")
+@st.cache_data(show_spinner=False, max_entries=8)
+def _shap_drift(archive_sig: tuple, a: str, b: str) -> tuple[pd.DataFrame, dict]:
+    """時点 a → b の SHAP 要因の入れ替わり（全期間）。"""
+    profiling.record_miss("shap_drift")
+    return shap_factors.snapshot_drift(_factor_frame(archive_sig), a, b)
+
+
+@profiling.cache_probe("calibration")
+@st.cache_data(show_spinner=False, max_entries=4)
+def _calibration_stats(archive_sig: tuple) -> pd.DataFrame:
+    """全期間のキャリブレーション統計（日別統計の合計。変更のあった日だけ再計算される）。"""
+    profiling.record_miss("calibration")
+    return calibration.merge_stats(_load_day_calibration(path_str) for path_str, _ in archive_sig)
+
+
+def _staking_bets(source: str, data_sig: tuple | None) -> pd.DataFrame:
+    """シミュレーション対象の賭けの表（source: race_analysis / archive）。"""
+    if source == "archive":
+        summary, _ = _archive_frames(data_sig)
+        return staking.bets_from_archive(summary)
+    return staking.bets_from_race_analysis(_load_race_analysis(data_sig))
+
+
+@profiling.cache_probe("staking_sim")
+@st.cache_data(show_spinner="資金推移をシミュレーション中...", max_entries=16)
+def _staking_sim(
+    source: str, data_sig: tuple | None, policies: dict, bankroll: float, n_paths: int, horizon: int,
+) -> tuple[pd.DataFrame, dict[str, pd.DataFrame], dict[str, pd.DataFrame]]:
+    """(賭け方別の統計表, 賭け方別の分位点バンド, 賭け方別の履歴順リプレイ)。"""
+    profiling.record_miss("staking_sim")
+    bets = _staking_bets(source, data_sig)
+    rows, bands, replays = [], {}, {}
+    for policy, params in policies.items():
+        bands[policy], stats = staking.monte_carlo(bets, policy, bankroll, n_paths, horizon, **params)
+        rows.append({"賭け方": staking.POLICIES[policy]["name"], **stats})
+        replays[policy] = staking.replay(bets, policy, bankroll, **params)
+    return pd.DataFrame(rows), bands, replays
+
+
+def _show_section(key: str, label: str = "表示する") -> bool:
+    """重い分析セクションの表示スイッチ（既定オフ）。
+
+    Streamlit は開いていないタブのスクリプトもリランのたびに実行するので、
+    表・図・その元になる集計はスイッチを入れている間だけ作る。
+    """
+    return st.toggle(label, key=key)
+
+
+def _color_roi(val):
+    if val >= 100:
+        return "background-color: #e6f4ea; color: #1a1a1a"
+    elif val >= 80:
+        return "background-color: #fff8e1; color: #1a1a1a"
+    return "background-color: #ffffff; color: #1a1a1a"
+
 
 # ====================================================================
 # タブ1: 予測一覧（既存機能）
 # ====================================================================
-with tab_pred:
+with tab_pred, prof.span("tab.pred"):
     if not json_files:
         st.info("予測データはまだありません。")
     else:
         date_labels = [f.stem for f in json_files]
         selected_date = st.selectbox("日付を選択", date_labels, key="pred_date")
+        exotic_src = st.radio(
+            "組み合わせ確率の元データ", ["勝率(%)", "calibrated_prob(%)"],
+            horizontal=True, key="pred_exotic_src",
+        )
 
         if selected_date:
-            pred_path = PREDICTIONS_DIR / f"{selected_date}.json"
-            with open(pred_path, encoding="utf-8") as f:
-                pred_data = json.load(f)
-
+            pred_data = _load_pred_file(str(pred_files[selected_date]))
+            pred_market = _load_day_market(str(pred_files[selected_date]))
+            pred_source = (str(pred_files[selected_date]), None)  # 表示中のデータの (パス, 版)
+
+            # 版（前日 → 10時 → 13時）。現在の予測ファイルは常に選択肢の末尾（未記録なら別の選択肢として足す）
+            versions_file = str(pred_versions.versions_path(PREDICTIONS_DIR, selected_date))
+            version_choices = _version_choices(versions_file, str(pred_files[selected_date]))
+            if len(version_choices) > 1:
+                last_choice = len(version_choices) - 1
+                version = version_choices[st.selectbox(
+                    "予測の版", range(len(version_choices)), index=last_choice, key=f"pred_version_{selected_date}",
+                    format_func=lambda i: version_choices[i][1] + ("　← 最新" if i == last_choice else ""),
+                    help="公開のたびに記録した予測の版です。前日予測の時点の順位・確率・推奨を表示できます。",
+                )][0]
+                if version is not None:
+                    pred_data = _load_pred_version(versions_file, version)
+                    pred_market = _day_market(selected_date, pred_data)
+                    pred_source = (versions_file, version)
+                with st.expander("🕰 版の比較"):
+                    _version_diff_view(
+                        selected_date, versions_file, version_choices, _load_pred_file(str(pred_files[selected_date])),
+                    )
 
             # モードバッジ
             pred_mode = pred_data.get("mode", "")
@@ -205,6 +888,13 @@ with tab_pred:
             else:
                 st.caption(f"生成日時: {generated_at}")
 
+            if pred_data.get("races") and st.toggle(
+                "📡 ライブオッズ", key="pred_live",
+                help=f"data/live_odds/ に届いたオッズで期待値・急落・推奨を再計算し、{LIVE_REFRESH_SEC}秒ごとに更新します。",
+            ):
+                _live_feed().register(pred_data["races"])
+                _live_odds_panel(tuple(str(r.get("race_id", "")) for r in pred_data["races"]))
+
             if not pred_data.get("races"):
                 st.warning("この日の予測データにレースが含まれていません。")
             else:
@@ -251,28 +941,38 @@ with tab_pred:
                         # 予測結果テーブル
                         preds = race.get("predictions", [])
                         if preds:
-                            pred_df = pd.DataFrame(preds)
-                            pred_df = pred_df.sort_values("予測順位").reset_index(drop=True)
-                            if "単勝" in pred_df.columns:
-                                pred_df["単勝"] = pd.to_numeric(pred_df["単勝"], errors="coerce")
-                            if "期待値" in pred_df.columns:
-                                pred_df["期待値"] = pd.to_numeric(pred_df["期待値"], errors="coerce")
-                            elif "単勝" in pred_df.columns:
-                                pred_df["期待値"] = ((pred_df["勝率(%)"] / 100) * pred_df["単勝"]).round(2)
-                            if "人気" in pred_df.columns:
-                                pred_df["人気"] = pd.to_numeric(pred_df["人気"], errors="coerce")
-                            disp_cols = [c for c in ["予測順位", "馬番", "馬名", "勝率(%)", "単勝", "人気", "スコア", "相対評価", "トレンド", "コンビ", "期待値"] if c in pred_df.columns]
-                            disp_df = pred_df[disp_cols].copy()
-                            if "単勝" in disp_df.columns:
-                                disp_df = disp_df.rename(columns={"単勝": "単勝オッズ"})
-                            fmt = {}
-                            if "単勝オッズ" in disp_df.columns:
-                                fmt["単勝オッズ"] = "{:.1f}"
-                            if "スコア" in disp_df.columns:
-                                fmt["スコア"] = "{:.3f}"
-                            if "期待値" in disp_df.columns:
-                                fmt["期待値"] = "{:.2f}"
-                            st.dataframe(disp_df.style.format(fmt, na_rep="-"), use_container_width=True, hide_index=True)
+                            with prof.span("render.pred_table"):
+                                pred_df = pd.DataFrame(preds)
+                                pred_df = pred_df.sort_values("予測順位").reset_index(drop=True)
+                                if "単勝" in pred_df.columns:
+                                    pred_df["単勝"] = pd.to_numeric(pred_df["単勝"], errors="coerce")
+                                if "期待値" in pred_df.columns:
+                                    pred_df["期待値"] = pd.to_numeric(pred_df["期待値"], errors="coerce")
+                                elif "単勝" in pred_df.columns:
+                                    pred_df["期待値"] = ((pred_df["勝率(%)"] / 100) * pred_df["単勝"]).round(2)
+                                if "人気" in pred_df.columns:
+                                    pred_df["人気"] = pd.to_numeric(pred_df["人気"], errors="coerce")
+                                if "馬番" in pred_df.columns:
+                                    pred_df = pred_df.join(_race_market_cols(pred_market[0], race.get("race_id", ""), pred_df["馬番"]))
+                                disp_cols = [c for c in ["予測順位", "馬番", "馬名", "勝率(%)", "単勝", "人気", "スコア", "相対評価", "トレンド", "コンビ", "期待値", "市場確率(%)", "エッジ(%)", "kelly_f"] if c in pred_df.columns]
+                                disp_df = pred_df[disp_cols].copy()
+                                if "単勝" in disp_df.columns:
+                                    disp_df = disp_df.rename(columns={"単勝": "単勝オッズ"})
+                                fmt = {}
+                                if "単勝オッズ" in disp_df.columns:
+                                    fmt["単勝オッズ"] = "{:.1f}"
+                                if "スコア" in disp_df.columns:
+                                    fmt["スコア"] = "{:.3f}"
+                                if "期待値" in disp_df.columns:
+                                    fmt["期待値"] = "{:.2f}"
+                                for col, f in {"市場確率(%)": "{:.1f}", "エッジ(%)": "{:+.1f}", "kelly_f": "{:.4f}"}.items():
+                                    if col in disp_df.columns:
+                                        fmt[col] = f
+                                st.dataframe(disp_df.style.format(fmt, na_rep="-"), use_container_width=True, hide_index=True)
+                                race_mkt = pred_market[1][pred_market[1]["race_id"] == race.get("race_id", "")]
+                                edge_text = _edge_caption(race_mkt.iloc[0].to_dict() if not race_mkt.empty else None)
+                                if edge_text:
+                                    st.caption(edge_text + "　※エッジ = モデル確率 − 市場確率（単勝から控除を除いた確率）")
 
                             # 出走取消馬（欄外）
                             scratched = race.get("scratched", [])
@@ -281,7 +981,8 @@ with tab_pred:
                                 st.caption(f"取消: {names}")
 
                             # AIの死角レースチェック
-                            blind_spots = _blind_spot_check(preds)
+                            with prof.span("signals.blind_spot"):
+                                blind_spots = blind_spot_check(preds)
                             if blind_spots:
                                 for b in blind_spots:
                                     st.warning(
@@ -318,30 +1019,51 @@ with tab_pred:
                             ev_list = rec.get("期待値一覧", [])
                             if ev_list:
                                 st.markdown("**各馬の期待値一覧**")
-                                ev_df = pd.DataFrame(ev_list).sort_values("予測順位")
-                                ev_cols = [c for c in ["予測順位", "馬番", "馬名", "勝率(%)", "単勝", "期待値"] if c in ev_df.columns]
-                                ev_disp = ev_df[ev_cols].copy()
-                                if "単勝" in ev_disp.columns:
-                                    ev_disp["単勝"] = pd.to_numeric(ev_disp["単勝"], errors="coerce")
-                                    ev_disp = ev_disp.rename(columns={"単勝": "単勝オッズ"})
-                                if "期待値" in ev_disp.columns:
-                                    ev_disp["期待値"] = pd.to_numeric(ev_disp["期待値"], errors="coerce")
-                                ev_fmt = {}
-                                if "単勝オッズ" in ev_disp.columns:
-                                    ev_fmt["単勝オッズ"] = "{:.1f}"
-                                if "期待値" in ev_disp.columns:
-                                    ev_fmt["期待値"] = "{:.2f}"
-                                st.dataframe(
-                                    ev_disp.style
-                                    .apply(
-                                        lambda row: ["background-color: #e6f4ea; color: #1a1a1a"] * len(row)
-                                        if pd.notna(row.get("期待値")) and row["期待値"] > 1.0
-                                        else ["background-color: #ffffff; color: #1a1a1a"] * len(row),
-                                        axis=1,
+                                with prof.span("render.ev_table"):
+                                    ev_df = pd.DataFrame(ev_list).sort_values("予測順位")
+                                    ev_cols = [c for c in ["予測順位", "馬番", "馬名", "勝率(%)", "単勝", "期待値"] if c in ev_df.columns]
+                                    ev_disp = ev_df[ev_cols].copy()
+                                    if "単勝" in ev_disp.columns:
+                                        ev_disp["単勝"] = pd.to_numeric(ev_disp["単勝"], errors="coerce")
+                                        ev_disp = ev_disp.rename(columns={"単勝": "単勝オッズ"})
+                                    if "期待値" in ev_disp.columns:
+                                        ev_disp["期待値"] = pd.to_numeric(ev_disp["期待値"], errors="coerce")
+                                    ev_fmt = {}
+                                    if "単勝オッズ" in ev_disp.columns:
+                                        ev_fmt["単勝オッズ"] = "{:.1f}"
+                                    if "期待値" in ev_disp.columns:
+                                        ev_fmt["期待値"] = "{:.2f}"
+                                    st.dataframe(
+                                        ev_disp.style
+                                        .apply(
+                                            lambda row: ["background-color: #e6f4ea; color: #1a1a1a"] * len(row)
+                                            if pd.notna(row.get("期待値")) and row["期待値"] > 1.0
+                                            else ["background-color: #ffffff; color: #1a1a1a"] * len(row),
+                                            axis=1,
+                                        )
+                                        .format(ev_fmt, na_rep="-"),
+                                        use_container_width=True, hide_index=True,
                                     )
-                                    .format(ev_fmt, na_rep="-"),
-                                    use_container_width=True, hide_index=True,
-                                )
+
+                        # 組み合わせ確率（Harville モデル）
+                        if len(preds) >= 3:
+                            with st.expander("🎲 組み合わせ確率（Harville・各券種上位10点）", expanded=False):
+                                with prof.span("render.exotic"):
+                                    combos = _race_exotics(
+                                        pred_source[0], _file_watcher().signature(Path(pred_source[0])),
+                                        pred_source[1], str(race.get("race_id", "")), exotic_src,
+                                    )
+                                    st.caption(
+                                        f"{exotic_src} を正規化し、1着→2着→3着を順に条件付きで掛け合わせた確率です。"
+                                        "理論オッズ = 100 ÷ 確率(%)。実オッズがこれより高ければ期待値 1.0 超。"
+                                    )
+                                    for bet_tab, bet_type in zip(st.tabs(list(BET_TYPES)), BET_TYPES):
+                                        with bet_tab:
+                                            combo_df = combos[combos["券種"] == bet_type].dropna(axis=1, how="all")
+                                            st.dataframe(
+                                                combo_df.drop(columns=["券種"]), column_config=EXOTIC_COLUMN_CONFIG,
+                                                use_container_width=True, hide_index=True,
+                                            )
 
                         # 期待値の見方
                         with st.expander("💡 期待値の見方"):
@@ -357,6 +1079,13 @@ with tab_pred:
 | **1.0 以上** | モデルがオッズより高く評価 → 購入価値あり |
 | **1.0 未満** | オッズ相応か過大評価 → 見送り推奨 |
 
+**エッジ・オーバーラウンド**
+- 単勝オッズには控除（JRA 単勝で約20%）が含まれ、全馬の `1 ÷ 単勝` の合計（オーバーラウンド）は 1 を超えます
+- `市場確率 = (1 ÷ 単勝) ÷ オーバーラウンド`。控除を除いた市場の評価で、レース内の合計が100%になります
+- `モデル確率` は補正後勝率をレース内の合計が100%になるよう割り直したもの（市場確率と同じ土俵で比べるため）
+- `エッジ = モデル確率 − 市場確率`。プラスの馬は市場より高く評価しています（期待値 1.0 超にはさらに控除ぶんの差が必要）
+- `kelly_f` は実際のオッズに対する 1/4 ケリーの賭け率（上限5%。割り直す前の補正後勝率で計算）
+
 **注意点**
 - 期待値はあくまでモデルの推定値です。モデルの勝率予測が外れれば期待値通りにはなりません
 - 単勝オッズが確定していない前日予測では、期待値の精度が下がります
@@ -482,34 +1211,69 @@ with tab_pred:
 # ====================================================================
 # タブ2: 本日の勝負レース
 # ====================================================================
-with tab_fight:
+with tab_fight, prof.span("tab.fight"):
     st.subheader("勝負レース")
 
     if not json_files:
         st.info("予測データがありません。")
+    elif st.radio("表示", ["1日", "期間"], horizontal=True, key="fight_view") == "期間":
+        _fight_range_view()
     else:
         date_labels_f = [f.stem for f in json_files]
         selected_f = st.selectbox("日付", date_labels_f, key="fight_date")
 
-        pred_path_f = PREDICTIONS_DIR / f"{selected_f}.json"
-        with open(pred_path_f, encoding="utf-8") as f:
-            pred_data_f = json.load(f)
+        pred_data_f = _load_pred_file(str(pred_files[selected_f]))
 
         races_f = pred_data_f.get("races", [])
         if not races_f:
             st.warning("この日のレースデータがありません。")
         else:
+            filter_csv_f = STRATEGY_DIR / "filter_results.csv"
+            rescored = {}
+            if filter_csv_f.exists() and st.toggle(
+                "バックテスト条件で勝負度を再計算", value=True, key="fight_rescore",
+                help="予測時点で固定された勝負度ではなく、現在の filter_results.csv の条件で付け直します。",
+            ):
+                rescore_df = _confidence_rescore(_archive_signature(), _file_watcher().signature(filter_csv_f))
+                rescored = rescore_df[rescore_df["date"] == selected_f].set_index("race_id").to_dict("index")
             for r in races_f:
-                r["_conf_level"] = r.get("confidence", {}).get("level", 0)
-            races_sorted = sorted(races_f, key=lambda x: x["_conf_level"], reverse=True)
+                conf = r.get("confidence") or {}
+                re_row = rescored.get(r.get("race_id", ""))
+                if re_row is not None:
+                    r["_conf"] = {
+                        "level": int(re_row["勝負度_再"]),
+                        "label": re_row["ラベル_再"],
+                        "reason": re_row["根拠"],
+                        "original": conf.get("label") or "−",
+                    }
+                else:
+                    r["_conf"] = conf
+                r["_conf_level"] = r["_conf"].get("level") or 0
+            day_market_f, race_market_f = _load_day_market(str(pred_files[selected_f]))
+            race_market_f = race_market_f.drop_duplicates("race_id").set_index("race_id").to_dict("index")
+            sort_f = st.radio("並び順", ["勝負度", "最大エッジ"], horizontal=True, key="fight_sort",
+                              help="最大エッジ = レース内で「モデル確率 − 市場確率」が最も大きい馬の値")
+            if sort_f == "最大エッジ":
+                def _max_edge(r):
+                    v = race_market_f.get(r.get("race_id", ""), {}).get("最大エッジ(%)")
+                    return (pd.notna(v), v if pd.notna(v) else 0.0)  # 単勝の無いレースは最後
+
+                races_sorted = sorted(races_f, key=_max_edge, reverse=True)
+            else:
+                races_sorted = sorted(races_f, key=lambda x: x["_conf_level"], reverse=True)
+            if rescored:
+                changed = sum(
+                    1 for r in races_f
+                    if "original" in r["_conf"] and r["_conf"]["label"] != r["_conf"]["original"]
+                )
+                st.caption(f"再計算で勝負度が変わったレース: {changed} / {len(races_f)}")
 
             min_level = st.slider("最低勝負度", 0, 3, 2, key="fight_min_conf")
 
-            conf_icons = {3: "🔥", 2: "⚡", 1: "💧", 0: "❄️"}
             shown = 0
             for race in races_sorted:
-                conf = race.get("confidence", {})
-                level = conf.get("level", 0)
+                conf = race["_conf"]
+                level = race["_conf_level"]
                 if level < min_level:
                     continue
                 shown += 1
@@ -519,43 +1283,57 @@ with tab_fight:
                 race_name = race.get("race_name", race.get("race_id", ""))
                 grade = race.get("grade", "")
                 distance = race.get("distance", "")
-                icon = conf_icons.get(level, "")
+                icon = CONF_ICONS.get(level, "")
 
                 header = f"{icon} {label} — {race_name}"
                 if grade:
                     header += f" ({grade})"
                 if distance:
                     header += f" {distance}"
+                race_mkt = race_market_f.get(race.get("race_id", ""))
+                if race_mkt and pd.notna(race_mkt.get("最大エッジ(%)")):
+                    header += f"　エッジ{race_mkt['最大エッジ(%)']:+.1f}pt"
 
                 with st.expander(header, expanded=(level >= 3)):
-                    if reason:
+                    if "original" in conf:
+                        st.caption(f"再計算: {label}（予測時: {conf['original']}）— {reason or '該当条件なし'}")
+                    elif reason:
                         st.caption(reason)
+                    edge_text = _edge_caption(race_mkt)
+                    if edge_text:
+                        st.caption(edge_text)
 
                     preds = race.get("predictions", [])
                     if preds:
-                        pred_df = pd.DataFrame(preds).sort_values("予測順位").reset_index(drop=True)
-                        if "単勝" in pred_df.columns:
-                            pred_df["単勝"] = pd.to_numeric(pred_df["単勝"], errors="coerce")
-                        if "期待値" in pred_df.columns:
-                            pred_df["期待値"] = pd.to_numeric(pred_df["期待値"], errors="coerce")
-                        elif "単勝" in pred_df.columns:
-                            pred_df["期待値"] = ((pred_df["勝率(%)"] / 100) * pred_df["単勝"]).round(2)
-                        if "人気" in pred_df.columns:
-                            pred_df["人気"] = pd.to_numeric(pred_df["人気"], errors="coerce")
-
-                        disp_cols = [c for c in ["予測順位", "馬番", "馬名", "勝率(%)", "単勝", "人気", "期待値"] if c in pred_df.columns]
-                        disp = pred_df[disp_cols].copy()
-                        if "単勝" in disp.columns:
-                            disp = disp.rename(columns={"単勝": "単勝オッズ"})
-                        fmt = {}
-                        if "単勝オッズ" in disp.columns:
-                            fmt["単勝オッズ"] = "{:.1f}"
-                        if "期待値" in disp.columns:
-                            fmt["期待値"] = "{:.2f}"
-                        st.dataframe(disp.style.format(fmt, na_rep="-"), use_container_width=True, hide_index=True)
+                        with prof.span("render.fight_table"):
+                            pred_df = pd.DataFrame(preds).sort_values("予測順位").reset_index(drop=True)
+                            if "単勝" in pred_df.columns:
+                                pred_df["単勝"] = pd.to_numeric(pred_df["単勝"], errors="coerce")
+                            if "期待値" in pred_df.columns:
+                                pred_df["期待値"] = pd.to_numeric(pred_df["期待値"], errors="coerce")
+                            elif "単勝" in pred_df.columns:
+                                pred_df["期待値"] = ((pred_df["勝率(%)"] / 100) * pred_df["単勝"]).round(2)
+                            if "人気" in pred_df.columns:
+                                pred_df["人気"] = pd.to_numeric(pred_df["人気"], errors="coerce")
+                            if "馬番" in pred_df.columns:
+                                pred_df = pred_df.join(_race_market_cols(day_market_f, race.get("race_id", ""), pred_df["馬番"]))
+
+                            disp_cols = [c for c in ["予測順位", "馬番", "馬名", "勝率(%)", "単勝", "人気", "期待値", "エッジ(%)", "kelly_f"] if c in pred_df.columns]
+                            disp = pred_df[disp_cols].copy()
+                            if "単勝" in disp.columns:
+                                disp = disp.rename(columns={"単勝": "単勝オッズ"})
+                            fmt = {}
+                            if "単勝オッズ" in disp.columns:
+                                fmt["単勝オッズ"] = "{:.1f}"
+                            if "期待値" in disp.columns:
+                                fmt["期待値"] = "{:.2f}"
+                            if "エッジ(%)" in disp.columns:
+                                fmt.update({"エッジ(%)": "{:+.1f}", "kelly_f": "{:.4f}"})
+                            st.dataframe(disp.style.format(fmt, na_rep="-"), use_container_width=True, hide_index=True)
 
                         # AIの死角レースチェック
-                        blind_spots = _blind_spot_check(preds)
+                        with prof.span("signals.blind_spot"):
+                            blind_spots = blind_spot_check(preds)
                         if blind_spots:
                             for b in blind_spots:
                                 st.warning(
@@ -593,12 +1371,18 @@ with tab_fight:
 - 勝率差 < 5%（回収率89.4%）
 - 中距離1800〜2200m（回収率86.8%）
 - オッズ3〜30倍帯（回収率87.2%）
+
+**再計算**（「バックテスト条件で勝負度を再計算」がオンのとき）:
+現在の `filter_results.csv` の2軸以上の条件のうち、そのレースが該当するものの回収率（件数が少ない条件は全体平均に寄せて補正）
+が最も高いものを採り、該当した条件の数に応じて割り引いた値で付け直します。1レースは数十の重なり合う条件に該当するため、
+その最大値は偶然だけでも高めに出ます（該当条件の回収率のばらつき × √(2 ln 該当数) を差し引きます）。
+★ = 割引後 90%以上、★★ = 100%以上、★★★ = 110%以上。
 """)
 
 # ====================================================================
 # タブ3: バックテスト成績
 # ====================================================================
-with tab_bt:
+with tab_bt, prof.span("tab.bt"):
     st.subheader("バックテスト成績")
 
     filter_csv = STRATEGY_DIR / "filter_results.csv"
@@ -607,15 +1391,17 @@ with tab_bt:
     if not filter_csv.exists():
         st.info("バックテスト分析データはまだありません。")
     else:
-        filter_df = pd.read_csv(filter_csv)
+        filter_sig = _file_watcher().signature(filter_csv)
+        race_sig = _file_watcher().signature(race_csv) if race_csv.exists() else None
+        filter_df = _load_filter_results(filter_sig)
         st.caption(f"合計 {len(filter_df)} 条件を分析")
 
-        # 全体ベースライン
-        if race_csv.exists():
-            race_df = pd.read_csv(race_csv)
-            total = len(race_df)
-            hits = race_df["的中"].sum()
-            payout = race_df["払戻額"].sum()
+        # 全体ベースライン（追記分だけ取り込んだ累計集計を使う）
+        race_manifest = _race_store_manifest(race_sig) if race_csv.exists() else None
+        if race_manifest and race_manifest["total"]["races"]:
+            total = race_manifest["total"]["races"]
+            hits = race_manifest["total"]["hits"]
+            payout = race_manifest["total"]["payout"]
             inv = total * 100
 
             col1, col2, col3, col4 = st.columns(4)
@@ -626,130 +1412,234 @@ with tab_bt:
 
         # 軸数フィルタ
         st.markdown("---")
-        axes_filter = st.multiselect("軸数フィルタ", [1, 2, 3], default=[1, 2], key="bt_axes")
-        min_races_filter = st.slider("最低レース数", 10, 200, 30, key="bt_min_races")
-
-        filtered = filter_df[
-            (filter_df["軸数"].isin(axes_filter)) & (filter_df["レース数"] >= min_races_filter)
-        ].copy()
-
-        st.markdown(f"**条件数: {len(filtered)}**")
-
-        top_n = st.slider("表示件数", 10, 100, 30, key="bt_top_n")
-        display = filtered.head(top_n)[["軸数", "条件", "値", "レース数", "的中率", "回収率", "収支"]].copy()
-
-        def _color_roi(val):
-            if val >= 100:
-                return "background-color: #e6f4ea; color: #1a1a1a"
-            elif val >= 80:
-                return "background-color: #fff8e1; color: #1a1a1a"
-            return "background-color: #ffffff; color: #1a1a1a"
-
-        st.dataframe(
-            display.style
-            .map(_color_roi, subset=["回収率"])
-            .format({"的中率": "{:.1f}%", "回収率": "{:.1f}%", "収支": "{:+,}円"}),
-            use_container_width=True, hide_index=True,
-        )
+        if _show_section("bt_show_filters", "条件別の成績を表示する"):
+            axes_filter = st.multiselect("軸数フィルタ", [1, 2, 3], default=[1, 2], key="bt_axes")
+            min_races_filter = st.slider("最低レース数", 10, 200, 30, key="bt_min_races")
+
+            # 回収率の信頼区間（ブートストラップ。少数レースの高回収率はノイズの可能性が高い）
+            use_ci = race_manifest is not None and st.toggle(
+                "回収率の95%信頼区間を表示（ブートストラップ）", value=True, key="bt_ci",
+            )
+            ci_cols: list[str] = []
+            if use_ci:
+                with prof.span("render.bt_bootstrap"):
+                    filter_df = _roi_intervals(filter_sig, race_sig)
+                ci_cols = ["回収率下限", "回収率上限", "P(回収率>100%)"]
+                cc1, cc2 = st.columns(2)
+                with cc1:
+                    sort_key = st.radio(
+                        "並び順", ["回収率", "回収率下限", "P(回収率>100%)"], horizontal=True, key="bt_sort",
+                    )
+                with cc2:
+                    min_lower = st.slider("回収率下限の最低値 (%)", 0, 120, 0, step=5, key="bt_min_lower")
+                if min_lower > 0:  # 区間の出ない行（NaN）は下限 0 のときは残す
+                    filter_df = filter_df[filter_df["回収率下限"] >= min_lower]
+                filter_df = filter_df.sort_values(sort_key, ascending=False)
+
+            filtered = filter_df[
+                (filter_df["軸数"].isin(axes_filter)) & (filter_df["レース数"] >= min_races_filter)
+            ].copy()
+
+            st.markdown(f"**条件数: {len(filtered)}**")
+
+            top_n = st.slider("表示件数", 10, 100, 30, key="bt_top_n")
+            display = filtered.head(top_n)[
+                ["軸数", "条件", "値", "レース数", "的中率", "回収率", *ci_cols, "収支"]
+            ].copy()
 
-        # 月別回収率チャート
-        if race_csv.exists():
-            st.markdown("---")
-            st.subheader("月別回収率推移")
-            race_df["race_date"] = pd.to_datetime(race_df["race_date"], errors="coerce")
-            race_df["月"] = race_df["race_date"].dt.to_period("M").astype(str)
-            monthly = race_df.groupby("月").agg(
-                レース数=("的中", "count"),
-                的中数=("的中", "sum"),
-                払戻額=("払戻額", "sum"),
-            ).reset_index()
-            monthly["投資額"] = monthly["レース数"] * 100
-            monthly["回収率"] = (monthly["払戻額"] / monthly["投資額"] * 100).round(1)
-            monthly["的中率"] = (monthly["的中数"] / monthly["レース数"] * 100).round(1)
-
-            st.bar_chart(monthly.set_index("月")["回収率"])
             st.dataframe(
-                monthly[["月", "レース数", "的中数", "的中率", "回収率"]].style.format(
-                    {"的中率": "{:.1f}%", "回収率": "{:.1f}%"}
-                ),
+                display.style
+                .map(_color_roi, subset=["回収率", *ci_cols[:1]])
+                .format({"的中率": "{:.1f}%", "回収率": "{:.1f}%", "収支": "{:+,}円",
+                         "回収率下限": "{:.1f}%", "回収率上限": "{:.1f}%", "P(回収率>100%)": "{:.1f}%"}),
                 use_container_width=True, hide_index=True,
             )
 
+        # 月別回収率チャート
+        if race_manifest and race_manifest["total"]["races"]:
+            st.markdown("---")
+            st.subheader("月別回収率推移")
+            if _show_section("bt_show_monthly"):
+                monthly = race_store.monthly_frame(race_manifest)
+
+                st.bar_chart(monthly.set_index("月")["回収率"])
+                st.dataframe(
+                    monthly[["月", "レース数", "的中数", "的中率", "回収率"]].style.format(
+                        {"的中率": "{:.1f}%", "回収率": "{:.1f}%"}
+                    ),
+                    use_container_width=True, hide_index=True,
+                )
+
+                st.subheader("帯別回収率")
+                band_col = st.selectbox("帯", race_store.BAND_COLUMNS, key="bt_band")
+                band = race_store.band_frame(race_manifest, band_col)
+                st.dataframe(
+                    band[[band_col, "レース数", "的中数", "的中率", "回収率"]].style
+                    .map(_color_roi, subset=["回収率"])
+                    .format({"的中率": "{:.1f}%", "回収率": "{:.1f}%"}),
+                    use_container_width=True, hide_index=True,
+                )
+
+    # ─── 予測アーカイブの成績キューブ ───
+    if pred_files:
+        st.markdown("---")
+        st.subheader("予測アーカイブの成績（キューブ）")
+        st.caption(
+            "結果の出たレースで Top1 の単勝を100円ずつ買った成績を、競馬場・芝ダ・距離帯・グレード・勝負度・パターン・月の"
+            "組み合わせごとに事前集計しています。結果が追加された日の分だけ差し替えて更新します。"
+        )
+        if _show_section("bt_show_cube"):
+            cube = _synced_perf_cube()
+            cc1, cc2, cc3 = st.columns([2, 1, 1])
+            cube_rows = cc1.multiselect("行", perf_cube.DIMENSIONS, default=["venue"], key="bt_cube_rows", format_func=_cube_dim_label)
+            cube_col = cc2.selectbox("列", ["（なし）"] + perf_cube.DIMENSIONS, index=2, key="bt_cube_col",
+                                     format_func=_cube_dim_label)
+            cube_measure = cc3.selectbox("値", ["回収率", "的中率", "レース数", "的中数"], key="bt_cube_measure")
+            cube_cells = cube.frame()
+            with st.expander("絞り込み（ドリルダウン）"):
+                fcols = st.columns(4)
+                cube_filters = {
+                    dim: fcols[i % 4].multiselect(
+                        _cube_dim_label(dim), sorted(cube_cells[dim].unique()), key=f"bt_cube_f_{dim}",
+                    )
+                    for i, dim in enumerate(perf_cube.DIMENSIONS)
+                }
+            with prof.span("render.perf_cube"):
+                if cube_col != "（なし）" and cube_col not in cube_rows and cube_rows:
+                    table = cube.pivot(cube_rows, cube_col, cube_measure, cube_filters)
+                    fmt = "{:.1f}%" if cube_measure in ("回収率", "的中率") else "{:.0f}"
+                    st.dataframe(table.style.format(fmt, na_rep="-"), use_container_width=True)
+                else:
+                    table = cube.rollup(cube_rows, cube_filters)
+                    st.dataframe(
+                        table.rename(columns=CUBE_DIM_LABELS).style
+                        .format({"レース数": "{:.0f}", "的中数": "{:.0f}", "払戻額": "{:,.0f}円",
+                                 "的中率": "{:.1f}%", "回収率": "{:.1f}%"}),
+                        use_container_width=True, hide_index=True,
+                    )
+
+    # ─── 資金管理シミュレーション ───
+    st.markdown("---")
+    st.subheader("資金管理シミュレーション")
+    st.caption(
+        "Top1 の単勝を買い続けたときの資金推移を、賭け方ごとに比較します。"
+        "履歴のレースを復元抽出して並べ替えたパスを多数生成し（モンテカルロ）、"
+        f"最終資金の分布・最大ドローダウン・破産確率（資金が初期の{staking.RUIN_LEVEL:.0%}未満）を出します。"
+    )
+    if _show_section("bt_show_sim"):
+        sim_sources = {}
+        if race_csv.exists():
+            sim_sources["バックテスト（race_analysis.csv）"] = ("race_analysis", _file_watcher().signature(race_csv))
+        if pred_files:
+            sim_sources["予測アーカイブ（結果確定レース・勝負度あり）"] = ("archive", _archive_signature())
+        if not sim_sources:
+            st.info("シミュレーション対象のデータがありません。")
+        else:
+            sc1, sc2 = st.columns(2)
+            with sc1:
+                sim_label = st.radio("対象データ", list(sim_sources), key="bt_sim_source")
+                sim_source, sim_sig = sim_sources[sim_label]
+                policy_opts = ["flat", "kelly"] + (["level"] if sim_source == "archive" else [])
+                sim_policies = st.multiselect(
+                    "賭け方", policy_opts, default=policy_opts,
+                    format_func=lambda k: staking.POLICIES[k]["name"], key=f"bt_sim_policies_{sim_source}",
+                )
+                bankroll = st.number_input("初期資金（円）", 1_000, 1_000_000, 10_000, step=1_000, key="bt_sim_bankroll")
+            with sc2:
+                kelly_mult = st.slider("ケリー係数", 0.05, 1.0, 0.25, step=0.05, key="bt_sim_kelly")
+                kelly_cap = st.slider("1レースの上限（資金比%）", 1, 20, 5, key="bt_sim_cap")
+                level_unit = st.number_input("勝負度★1あたりの賭け金（円）", 100, 10_000, 100, step=100, key="bt_sim_unit")
+                n_paths = st.select_slider("パス数", [500, 1000, 2000, 5000], value=2000, key="bt_sim_paths")
+                horizon = st.select_slider("1パスのレース数", [100, 250, 500, 1000, 2000], value=500, key="bt_sim_horizon")
+                sim_paths = staking.capped_paths(int(n_paths), int(horizon))
+                if sim_paths < n_paths:
+                    st.caption(f"パス数 × レース数の上限（{staking.MAX_CELLS:,}）のため {sim_paths:,} パスで計算します。")
+
+            params = {
+                "flat": {},
+                "kelly": {"multiplier": kelly_mult, "cap": kelly_cap / 100},
+                "level": {"level_stakes": {lv: lv * level_unit for lv in range(4)}},
+            }
+            if sim_policies:
+                with prof.span("render.bt_staking"):
+                    sim_table, sim_bands, sim_replays = _staking_sim(
+                        sim_source, sim_sig, {p: params[p] for p in sim_policies},
+                        float(bankroll), sim_paths, int(horizon),
+                    )
+                st.dataframe(
+                    sim_table.style.format({
+                        "最終資金(中央値)": "{:,.0f}円", "最終資金(5%)": "{:,.0f}円", "最終資金(95%)": "{:,.0f}円",
+                        "増加確率(%)": "{:.1f}%", "最大DD(中央値%)": "{:.1f}%", "破産確率(%)": "{:.1f}%",
+                    }),
+                    use_container_width=True, hide_index=True,
+                )
+                st.markdown("**モンテカルロ資金推移（中央値）**")
+                st.line_chart(pd.DataFrame({
+                    staking.POLICIES[p]["name"]: band.set_index("レース")["中央値"] for p, band in sim_bands.items()
+                }))
+                band_policy = st.selectbox(
+                    "分位点バンドを見る賭け方", sim_policies,
+                    format_func=lambda k: staking.POLICIES[k]["name"], key="bt_sim_band",
+                )
+                st.line_chart(sim_bands[band_policy].set_index("レース")[["5%", "25%", "中央値", "75%", "95%"]])
+                st.markdown("**履歴どおりの順番で賭けた場合**")
+                st.line_chart(pd.DataFrame({
+                    staking.POLICIES[p]["name"]: rep.set_index("レース")["資金"] for p, rep in sim_replays.items()
+                }))
+
 # ====================================================================
 # タブ4: レースカレンダー
 # ====================================================================
 
-# ─── スケジュール解析（インライン） ──────────────────────────
-@st.cache_data(ttl=3600)
-def _load_schedule() -> list[dict]:
-    """TSVスケジュールファイルをパースして返す"""
-    races: list[dict] = []
-    if not SCHEDULE_PATH.exists():
-        return races
-    with open(SCHEDULE_PATH, encoding="utf-8") as f:
-        for i, line in enumerate(f):
-            line = line.rstrip("\n")
-            if i == 0 or not line.strip():
-                continue
-            parts = line.split("\t")
-            if len(parts) < 7:
-                continue
-            date_str, race_name, grade, venue, distance, condition, weight = parts[:7]
-            m = re.match(r"(\d{2})/(\d{2})", date_str)
-            if not m:
-                continue
-            month_n, day_n = int(m.group(1)), int(m.group(2))
-            races.append({
-                "date": datetime.date(2026, month_n, day_n),
-                "race_name": race_name,
-                "grade": grade,
-                "venue": venue,
-                "distance": distance,
-            })
-    return races
-
-
-@st.cache_data(ttl=300)
-def _load_pred_map() -> dict[str, dict]:
-    result: dict[str, dict] = {}
-    if not PREDICTIONS_DIR.exists():
-        return result
-    for jf in sorted(PREDICTIONS_DIR.glob("*.json")):
-        try:
-            with open(jf, encoding="utf-8") as f:
-                result[jf.stem] = json.load(f)
-        except Exception:
-            pass
-    return result
+PREFETCH_NEIGHBOR_DAYS = 3  # 選択日の前後それぞれ何日分の予測を先読みするか
 
 
-def _parse_dist_num(dist_str: str) -> int:
-    m = re.search(r"(\d+)", dist_str or "")
-    return int(m.group(1)) if m else 0
+def _warm_day(ctx, path_str: str) -> None:
+    """先読みスレッドで1日分のキャッシュを温める。
 
+    st.cache_data をスレッドから呼ぶので、要求したセッションの ScriptRunContext を付けてから呼ぶ
+    （付けないと「missing ScriptRunContext」の警告が出る）。次のタスクが付け替えるので、
+    プールのスレッドが持ち続けるのはスレッドごとに直近の1つだけ。
+    """
+    add_script_run_ctx(threading.current_thread(), ctx)
+    _load_pred_file(path_str)
+    _day_race_flags(path_str)
 
-def _is_promising(pred_race: dict) -> bool:
-    dist_str = pred_race.get("distance", "")
-    if not dist_str.startswith("芝") or _parse_dist_num(dist_str) < 1800:
-        return False
-    for p in pred_race.get("predictions", []):
-        if p.get("人気") == 1:
-            return (p.get("予測順位") or 99) >= 4
-    return False
 
+def _prefetch_calendar(selected: str) -> None:
+    """選択日の前後の予測日を裏で読み込んでおく。
 
-def _is_dirt_chusho_agree(pred_race: dict) -> bool:
-    """ダート×1801〜2200m×一致（1番人気がモデルTop2以内）シグナル判定。"""
-    dist_str = pred_race.get("distance", "")
-    if not dist_str.startswith("ダート"):
-        return False
-    dist_num = _parse_dist_num(dist_str)
-    if not (1801 <= dist_num <= 2200):
-        return False
-    for p in pred_race.get("predictions", []):
-        if p.get("人気") == 1:
-            return (p.get("予測順位") or 99) <= 2
-    return False
+    表示月の移動はブラウザ内（カレンダーのコンポーネント）で完結しサーバーには届かないので、
+    月単位の先読みはしない。要求はセッションごとに差し替えるので、遠くの日付へ移動すると
+    未着手の古い先読みは捨てられる。
+    """
+    stems = sorted(pred_files)
+    i = bisect.bisect_left(stems, selected)
+    near = stems[max(0, i - PREFETCH_NEIGHBOR_DAYS):i + PREFETCH_NEIGHBOR_DAYS + 1]
+    watcher = _file_watcher()
+    ctx = get_script_run_ctx()
+    tasks = []
+    for stem in near:
+        if stem == selected:
+            continue
+        path_str = str(pred_files[stem])
+        tasks.append((path_str, watcher.signature(pred_files[stem]), functools.partial(_warm_day, ctx, path_str)))
+    owner = st.session_state.setdefault("_prefetch_owner", uuid.uuid4().hex)
+    _prefetcher().request(owner, tasks)
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _calendar_payload(grades: tuple, surface: str, pred_dates: tuple, schedule_sig: tuple | None) -> dict:
+    """カレンダーに渡す全期間の日付データ（フィルター・予測日・スケジュールが変わったときだけ作り直す）。"""
+    days: dict[str, dict] = {ds: {"p": 1} for ds in pred_dates}
+    for r in _load_schedule():
+        if r.get("grade") not in grades or (surface != "全" and surface not in r.get("distance", "")):
+            continue
+        day = days.setdefault(r["date"].isoformat(), {})
+        day.setdefault("g", []).append(r.get("grade", ""))
+        day.setdefault("n", []).append(f"{r.get('grade', '')} {r['race_name']}")
+    months = sorted(ds[:7] for ds in days)
+    return {"days": days, "first": months[0] if months else "", "last": months[-1] if months else ""}
 
 
 def _get_status(pred_race: dict | None) -> str:
@@ -779,15 +1669,14 @@ GRADE_COLORS = {
 }
 
 
-with tab_cal:
+with tab_cal, prof.span("tab.cal"):
     schedule_list = _load_schedule()
-    pred_map_cal = _load_pred_map()
 
     schedule_by_date: dict[str, list[dict]] = {}
     for r in schedule_list:
         ds = r["date"].isoformat()
         schedule_by_date.setdefault(ds, []).append(r)
-    pred_dates = set(pred_map_cal.keys())
+    pred_dates = set(pred_files)
 
     # フィルター
     cf1, cf2 = st.columns(2)
@@ -798,14 +1687,37 @@ with tab_cal:
     with cf2:
         surface_filter = st.selectbox("馬場", ["全", "芝", "ダート"], key="cal_surface")
 
-    # 選択日データを先に計算（2タブ共有）
+    # ── 月次カレンダー（月の移動はブラウザ内。日付を押したときだけリラン1回） ──
+    picked = st.session_state.get("cal")  # 今回のリランを起こした選択（描画前に反映する）
+    if isinstance(picked, dict) and picked.get("date"):
+        st.session_state.cal_selected = picked["date"]
     sel = st.session_state.cal_selected
+    cal_payload = _calendar_payload(
+        tuple(grade_filter), surface_filter, tuple(sorted(pred_dates)), _file_watcher().signature(SCHEDULE_PATH),
+    )
+    _race_calendar(
+        payload={
+            **cal_payload,
+            "selected": sel,
+            "first": min(filter(None, [cal_payload["first"], sel[:7]])),
+            "last": max(filter(None, [cal_payload["last"], sel[:7]])),
+        },
+        key="cal", default=None,
+    )
+    _prefetch_calendar(sel)
+
+    # 選択日データ
     day_sched_filtered = [
         r for r in schedule_by_date.get(sel, [])
         if r.get("grade") in grade_filter
         and (surface_filter == "全" or surface_filter in r.get("distance", ""))
     ]
-    day_pred_data = pred_map_cal.get(sel)
+    day_pred_data = _load_pred_file(str(pred_files[sel])) if sel in pred_files else None
+    day_flags = _day_race_flags(str(pred_files[sel])) if sel in pred_files else {}
+    day_edges = (
+        _load_day_market(str(pred_files[sel]))[1].drop_duplicates("race_id").set_index("race_id").to_dict("index")
+        if sel in pred_files else {}
+    )
     pred_races = (day_pred_data or {}).get("races", [])
 
     merged: list[dict] = []
@@ -824,81 +1736,6 @@ with tab_cal:
         merged.append({"sched": None, "pred": pr})
         used_pred_ids.add(rid)
 
-    # ── 月次カレンダー（ボタングリッド） ──
-    import calendar as _cal_module
-
-    if "cal_month" not in st.session_state:
-        st.session_state.cal_month = (today.year, today.month)
-    cal_y, cal_m = st.session_state.cal_month
-
-    st.markdown('<div class="cal-nav-anchor"></div>', unsafe_allow_html=True)
-    nav1, nav2, nav3 = st.columns([1, 3, 1])
-    with nav1:
-        if st.button("◀", key="cal_prev"):
-            m, y = cal_m - 1, cal_y
-            if m < 1:
-                m, y = 12, y - 1
-            st.session_state.cal_month = (y, m)
-            st.rerun()
-    with nav2:
-        st.markdown(
-            f"<div style='text-align:center;font-size:1rem;font-weight:bold;padding:6px 0;'>"
-            f"{cal_y}年{cal_m}月</div>",
-            unsafe_allow_html=True,
-        )
-    with nav3:
-        if st.button("▶", key="cal_next"):
-            m, y = cal_m + 1, cal_y
-            if m > 12:
-                m, y = 1, y + 1
-            st.session_state.cal_month = (y, m)
-            st.rerun()
-
-    # 曜日ヘッダー（スマホでは非表示）
-    st.markdown(
-        """<div class="cal-week-header">
-<div style="text-align:center;font-size:0.72rem;color:#666;padding:2px 0;">月</div>
-<div style="text-align:center;font-size:0.72rem;color:#666;padding:2px 0;">火</div>
-<div style="text-align:center;font-size:0.72rem;color:#666;padding:2px 0;">水</div>
-<div style="text-align:center;font-size:0.72rem;color:#666;padding:2px 0;">木</div>
-<div style="text-align:center;font-size:0.72rem;color:#666;padding:2px 0;">金</div>
-<div style="text-align:center;font-size:0.72rem;color:#1565c0;font-weight:bold;padding:2px 0;">土</div>
-<div style="text-align:center;font-size:0.72rem;color:#c62828;font-weight:bold;padding:2px 0;">日</div>
-</div>""",
-        unsafe_allow_html=True,
-    )
-
-    # カレンダーグリッド（各日をボタンで表示）
-    for week in _cal_module.monthcalendar(cal_y, cal_m):
-        wcols = st.columns(7)
-        for i, day in enumerate(week):
-            if day == 0:
-                wcols[i].empty()
-                continue
-            ds = f"{cal_y}-{cal_m:02d}-{day:02d}"
-            day_races = [
-                r for r in schedule_by_date.get(ds, [])
-                if r.get("grade") in grade_filter
-                and (surface_filter == "全" or surface_filter in r.get("distance", ""))
-            ]
-            label_lines = [str(day)]
-            if ds in pred_dates:
-                label_lines.append("●")
-            if day_races:
-                label_lines.append(" ".join(r.get("grade", "") for r in day_races))
-            label = "\n".join(label_lines)
-
-            btn_type = "primary" if ds == sel else "secondary"
-            if wcols[i].button(
-                label, key=f"cal_btn_{ds}",
-                type=btn_type, use_container_width=True,
-            ):
-                st.session_state.cal_selected = ds
-                st.session_state.cal_month = (cal_y, cal_m)
-                st.rerun()
-
-    st.caption("● 予測済み ／ 青ボタン＝選択中 ／ G1・G2・G3＝当日の重賞")
-
     # ── レース一覧 ──
     st.divider()
     st.subheader(f"📋 {sel} のレース")
@@ -917,32 +1754,38 @@ with tab_cal:
         st.info("この日の対象レースはありません（重賞スケジュール未登録 / 予測なし）。")
     else:
         # サマリーテーブル
-        table_rows = []
-        for item in merged:
-            sched = item["sched"]
-            pred = item["pred"]
-            name = (sched or {}).get("race_name") or (pred or {}).get("race_name", "−")
-            grade = (sched or {}).get("grade") or (pred or {}).get("grade", "")
-            venue = (sched or {}).get("venue") or (pred or {}).get("venue", "")
-            distance = (sched or {}).get("distance") or (pred or {}).get("distance", "")
-            status = _get_status(pred)
-            conf_label = (pred or {}).get("confidence", {}).get("label", "−") if pred else "−"
-            promising = "🔥" if (pred and _is_promising(pred)) else ""
-            table_rows.append({
-                "レース名": name, "G": grade, "場": venue,
-                "距離": distance, "状態": status, "自信度": conf_label, "有望": promising,
-            })
-
-        table_df = pd.DataFrame(table_rows)
-
-        def _style_status(val: str) -> str:
-            bg = STATUS_BG.get(val, "white")
-            return f"background-color: {bg}; color: #1a1a1a"
-
-        st.dataframe(
-            table_df.style.map(_style_status, subset=["状態"]),
-            use_container_width=True, hide_index=True,
-        )
+        with prof.span("render.cal_summary"):
+            table_rows = []
+            for item in merged:
+                sched = item["sched"]
+                pred = item["pred"]
+                name = (sched or {}).get("race_name") or (pred or {}).get("race_name", "−")
+                grade = (sched or {}).get("grade") or (pred or {}).get("grade", "")
+                venue = (sched or {}).get("venue") or (pred or {}).get("venue", "")
+                distance = (sched or {}).get("distance") or (pred or {}).get("distance", "")
+                status = _get_status(pred)
+                conf_label = (pred or {}).get("confidence", {}).get("label", "−") if pred else "−"
+                promising = "🔥" if (pred and day_flags.get(pred.get("race_id", ""), {}).get("promising")) else ""
+                edge = day_edges.get((pred or {}).get("race_id", ""), {})
+                table_rows.append({
+                    "レース名": name, "G": grade, "場": venue,
+                    "距離": distance, "状態": status, "自信度": conf_label, "有望": promising,
+                    "最大エッジ": (
+                        f"{int(edge['最大エッジ馬番'])} {edge['最大エッジ馬名']} {edge['最大エッジ(%)']:+.1f}pt"
+                        if pd.notna(edge.get("最大エッジ(%)")) else ""
+                    ),
+                })
+
+            table_df = pd.DataFrame(table_rows)
+
+            def _style_status(val: str) -> str:
+                bg = STATUS_BG.get(val, "white")
+                return f"background-color: {bg}; color: #1a1a1a"
+
+            st.dataframe(
+                table_df.style.map(_style_status, subset=["状態"]),
+                use_container_width=True, hide_index=True,
+            )
 
         st.markdown("---")
         st.markdown("**詳細**")
@@ -955,8 +1798,9 @@ with tab_cal:
             venue = (sched or {}).get("venue") or (pred or {}).get("venue", "")
             distance = (sched or {}).get("distance") or (pred or {}).get("distance", "")
             status = _get_status(pred)
-            promising_flag = pred and _is_promising(pred)
-            dirt_chusho_flag = pred and _is_dirt_chusho_agree(pred)
+            flags = day_flags.get((pred or {}).get("race_id", ""), {})
+            promising_flag = pred and flags.get("promising")
+            dirt_chusho_flag = pred and flags.get("dirt_agree")
 
             exp_header = f"{'🔥 ' if promising_flag else ('💎 ' if dirt_chusho_flag else '')}{name}"
             if grade:
@@ -1034,36 +1878,38 @@ with tab_cal:
 
                 preds = pred.get("predictions", [])
                 if preds:
-                    pred_df = (
-                        pd.DataFrame(preds)
-                        .sort_values("予測順位")
-                        .reset_index(drop=True)
-                    )
-                    for col in ["単勝", "期待値", "人気"]:
-                        if col in pred_df.columns:
-                            pred_df[col] = pd.to_numeric(pred_df[col], errors="coerce")
-
-                    disp_cols = [
-                        c for c in
-                        ["予測順位", "馬番", "馬名", "勝率(%)", "単勝", "人気", "期待値"]
-                        if c in pred_df.columns
-                    ]
-                    disp_df = pred_df[disp_cols].head(5).copy()
-                    if "単勝" in disp_df.columns:
-                        disp_df = disp_df.rename(columns={"単勝": "単勝オッズ"})
-                    fmt: dict[str, str] = {}
-                    if "単勝オッズ" in disp_df.columns:
-                        fmt["単勝オッズ"] = "{:.1f}"
-                    if "期待値" in disp_df.columns:
-                        fmt["期待値"] = "{:.2f}"
+                    with prof.span("render.cal_table"):
+                        pred_df = (
+                            pd.DataFrame(preds)
+                            .sort_values("予測順位")
+                            .reset_index(drop=True)
+                        )
+                        for col in ["単勝", "期待値", "人気"]:
+                            if col in pred_df.columns:
+                                pred_df[col] = pd.to_numeric(pred_df[col], errors="coerce")
+
+                        disp_cols = [
+                            c for c in
+                            ["予測順位", "馬番", "馬名", "勝率(%)", "単勝", "人気", "期待値"]
+                            if c in pred_df.columns
+                        ]
+                        disp_df = pred_df[disp_cols].head(5).copy()
+                        if "単勝" in disp_df.columns:
+                            disp_df = disp_df.rename(columns={"単勝": "単勝オッズ"})
+                        fmt: dict[str, str] = {}
+                        if "単勝オッズ" in disp_df.columns:
+                            fmt["単勝オッズ"] = "{:.1f}"
+                        if "期待値" in disp_df.columns:
+                            fmt["期待値"] = "{:.2f}"
 
-                    st.dataframe(
-                        disp_df.style.format(fmt, na_rep="-"),
-                        use_container_width=True, hide_index=True,
-                    )
+                        st.dataframe(
+                            disp_df.style.format(fmt, na_rep="-"),
+                            use_container_width=True, hide_index=True,
+                        )
 
                     # AIの死角レースチェック
-                    blind_spots = _blind_spot_check(preds)
+                    with prof.span("signals.blind_spot"):
+                        blind_spots = blind_spot_check(preds)
                     if blind_spots:
                         for b in blind_spots:
                             st.warning(
@@ -1208,3 +2054,298 @@ with tab_cal:
                                     f"（馬番{pred_umaban}）→ {rank}着 / "
                                     f"1着: {winner['馬名']}（馬番{win_umaban}）"
                                 )
+
+# ====================================================================
+# タブ5: アーカイブ分析（全期間）
+# ====================================================================
+with tab_arc, prof.span("tab.arc"):
+    st.subheader("シグナル検証（全期間）")
+    st.caption(
+        "登録シグナルを全予測アーカイブに一括適用し、埋め込み結果で答え合わせします。"
+        "ワイドの払戻は結果データに含まれないため、ワイド系シグナルは的中率のみ検証できます。"
+    )
+
+    if not pred_files:
+        st.info("予測データがありません。")
+    else:
+        if _show_section("arc_show_signals", "シグナルのヒット一覧を表示する"):
+            hits_all = _signal_hits(_archive_signature())
+            sig_names = [s["name"] for s in SIGNALS.values()]
+            sc1, sc2, sc3 = st.columns([2, 2, 1])
+            with sc1:
+                sig_filter = st.multiselect("シグナル", sig_names, default=sig_names, key="arc_sig")
+            with sc2:
+                sig_query = st.text_input("レース名・馬名・場で絞り込み", key="arc_sig_q")
+            with sc3:
+                settled_only = st.checkbox("結果確定のみ", value=False, key="arc_sig_settled")
+
+            hits_view = hits_all[hits_all["signal"].isin(sig_filter)]
+            if settled_only:
+                hits_view = hits_view[hits_view["的中"].notna()]
+            if sig_query:
+                text = hits_view["race_name"] + " " + hits_view["買い目"] + " " + hits_view["venue"]
+                hits_view = hits_view[text.str.contains(sig_query, regex=False, na=False)]
+
+            if hits_view.empty:
+                st.info("条件に合うシグナルはありません。")
+            else:
+                st.dataframe(
+                    summarize_hits(hits_view).style.format(
+                        {"的中率": "{:.1f}%", "回収率": "{:.1f}%"}, na_rep="-"
+                    ),
+                    use_container_width=True, hide_index=True,
+                )
+                hits_disp = hits_view.rename(columns={
+                    "date": "日付", "race_name": "レース名", "grade": "G", "venue": "場",
+                    "distance": "距離", "signal": "シグナル",
+                })
+                hits_disp["的中"] = hits_disp["的中"].map({True: "✅", False: "❌"}).fillna("未確定")
+                st.dataframe(
+                    hits_disp[["日付", "レース名", "G", "場", "距離", "シグナル", "馬券", "買い目", "着順", "的中", "払戻"]]
+                    .style.format({"払戻": "{:,.0f}円"}, na_rep="-"),
+                    use_container_width=True, hide_index=True,
+                )
+
+        # ─── 閾値の最適化 ───
+        if st.toggle("🎛 シグナル閾値の最適化（グリッドサーチ・時系列の学習/検証）", key="arc_show_opt"):
+            st.caption(
+                "各シグナルの閾値を全組み合わせで評価し、日付順の前半（学習）で最良の組み合わせを選んで"
+                "後半（検証）で採点します。単勝系は回収率、ワイド系は的中率（払戻データなし）で選びます。"
+            )
+            oc1, oc2, oc3 = st.columns(3)
+            with oc1:
+                opt_signal = st.selectbox(
+                    "シグナル", list(threshold_search.PARAM_GRIDS),
+                    format_func=lambda k: SIGNALS[k]["name"], key="arc_opt_signal",
+                )
+            with oc2:
+                opt_train = st.slider("学習期間の割合 (%)", 50, 90, 70, step=5, key="arc_opt_train")
+            with oc3:
+                opt_min_n = st.slider("学習期間の最低件数", 1, 30, 5, key="arc_opt_min_n")
+            opt_table, opt_cut = _threshold_search(_archive_signature(), opt_signal, opt_train / 100)
+            params = list(threshold_search.PARAM_GRIDS[opt_signal])
+            metric_cols = [f"{p}_{m}" for p in ("学習", "検証") for m in threshold_search.METRICS]
+            best = threshold_search.pick_best(opt_table, opt_signal, opt_min_n)
+            rows = {"現行": threshold_search.current_row(opt_table, opt_signal), "最良（学習期間）": best}
+            rows = {k: v[params + metric_cols] for k, v in rows.items() if v is not None}
+            st.caption(f"{len(opt_table):,} 通りを評価・検証期間は {opt_cut} 以降")
+            if best is None:
+                st.info("学習期間の件数が最低件数に届く組み合わせがありません。")
+            st.dataframe(
+                pd.DataFrame(rows).T.style.format(
+                    {c: "{:.1f}%" for c in metric_cols if c.endswith("率")}, na_rep="-", precision=2,
+                ),
+                use_container_width=True,
+            )
+            sc_x, sc_y, sc_v = st.columns(3)
+            with sc_x:
+                surf_x = st.selectbox("横軸", params, key="arc_opt_x")
+            with sc_y:
+                surf_y = st.selectbox("縦軸", [p for p in params if p != surf_x], key="arc_opt_y")
+            with sc_v:
+                surf_value = st.selectbox(
+                    "値", [f"{p}_{m}" for p in ("学習", "検証", "全期間") for m in ("的中率", "回収率", "件数")],
+                    index=1 if opt_signal in threshold_search.WIN_SIGNALS else 0, key="arc_opt_value",
+                )
+            fixed = (best if best is not None else pd.Series(threshold_search.CURRENT[opt_signal]))[params]
+            others = [p for p in params if p not in (surf_x, surf_y)]
+            if others:
+                st.caption("固定: " + "、".join(f"{p} = {fixed[p]:g}" for p in others))
+            surf = threshold_search.surface(opt_table, surf_x, surf_y, surf_value, fixed.to_dict())
+            st.dataframe(
+                surf.style.apply(_heat, axis=None).format(precision=1, na_rep="-"),
+                use_container_width=True,
+            )
+
+        # ─── 馬の履歴 ───
+        st.markdown("---")
+        st.subheader("🐎 馬の出走履歴")
+        horse_index = _synced_horse_index()
+        horse_q = st.text_input(
+            f"馬名（前方一致・{len(horse_index):,}頭）", value=st.query_params.get("horse", ""), key="arc_horse_q",
+        )
+        horse_hits = horse_index.search(horse_q)
+        if horse_q and not horse_hits:
+            st.info("該当する馬はいません。")
+        elif horse_hits:
+            horse_counts = horse_index.counts(horse_hits)
+            horse_name = st.selectbox(
+                "馬を選択", horse_hits, key="arc_horse",
+                format_func=lambda n: f"{n}（{horse_counts[n]}走）",
+            )
+            with prof.span("render.horse_history"):
+                hist = pd.DataFrame(horse_index.history(horse_name))
+                hc1, hc2, hc3 = st.columns(3)
+                settled_hist = hist[hist["着順"].notna()]
+                hc1.metric("予測対象レース", len(hist))
+                hc2.metric("勝利", int((settled_hist["着順"] == 1).sum()))
+                hc3.metric("平均 予測順位", f"{hist['予測順位'].mean():.1f}")
+                st.dataframe(
+                    hist.rename(columns={
+                        "date": "日付", "race_name": "レース名", "grade": "G", "venue": "場", "distance": "距離",
+                    })[["日付", "レース名", "G", "場", "距離", "予測順位", "勝率(%)", "単勝", "人気", "着順"]]
+                    .style.format({
+                        "予測順位": "{:.0f}", "勝率(%)": "{:.1f}", "単勝": "{:.1f}", "人気": "{:.0f}", "着順": "{:.0f}",
+                    }, na_rep="-"),
+                    use_container_width=True, hide_index=True,
+                )
+
+        # ─── AIコメント検索 ───
+        st.markdown("---")
+        st.subheader("💬 AIコメント検索")
+        comment_index = _synced_comment_index()
+        comment_q = st.text_input(
+            f"キーワード（空白区切りで AND・{len(comment_index):,}件のコメント）",
+            placeholder="例: タイム偏差 マイナス", key="arc_comment_q",
+        )
+        if comment_q:
+            with prof.span("render.comment_search"):
+                comment_total, comment_rows = comment_index.search(comment_q, limit=COMMENT_SEARCH_LIMIT)
+                comment_hits = pd.DataFrame(comment_rows)
+            if comment_hits.empty:
+                st.info("該当するコメントはありません。")
+            else:
+                race_info = (
+                    _archive_frames(_archive_signature())[0]
+                    .sort_values("date", ascending=False)
+                    .drop_duplicates("race_id")[["race_id", "date", "race_name", "grade"]]
+                )
+                comment_hits = comment_hits.merge(race_info, on="race_id", how="left")
+                comment_hits["date"] = comment_hits["date"].fillna(
+                    comment_hits["file"].map(lambda p: Path(p).stem)
+                )
+                comment_hits["race_name"] = comment_hits["race_name"].fillna(comment_hits["race_id"])
+                st.caption(
+                    f"{comment_total}件ヒット"
+                    + (f"（先頭{len(comment_hits)}件を表示。語を足して絞り込んでください）" if comment_total > len(comment_hits) else "")
+                )
+                st.dataframe(
+                    comment_hits.rename(columns={"date": "日付", "race_name": "レース名", "grade": "G"})
+                    .sort_values("日付", ascending=False)[["日付", "レース名", "G", "馬名", "コメント"]],
+                    use_container_width=True, hide_index=True,
+                )
+
+        # ─── SHAP 要因の全期間集計 ───
+        st.markdown("---")
+        st.subheader("📊 SHAP要因の全期間集計")
+        if _show_section("arc_show_shap"):
+            factors_all = _factor_frame(_archive_signature())
+            if factors_all.empty:
+                st.info("SHAP要因を含む予測データがありません。")
+            else:
+                snap_names = {k: v[0] for k, v in shap_factors.SNAPSHOTS.items()}
+                snap_avail = [k for k in snap_names if (factors_all["snapshot"] == k).any()]
+                factor_snap = st.radio(
+                    "時点", snap_avail, format_func=snap_names.get, horizontal=True, key="arc_shap_snap",
+                )
+                st.caption(
+                    "各馬の上位5要因にそのラベルがプラス/マイナスとして現れた回数と、その馬の1着率・3着内率（結果確定分）。"
+                    "「3着内率の差」が大きいほど、その要因の向きが結果と整合しています。"
+                )
+                with prof.span("render.shap_summary"):
+                    factor_summary = shap_factors.label_summary(factors_all, factor_snap)
+                st.dataframe(
+                    factor_summary.rename(columns={"label": "要因"}).style.format(
+                        {c: "{:.1f}" for c in factor_summary.columns if c.endswith(("(%)", "(pt)"))}, na_rep="-",
+                    ),
+                    use_container_width=True, hide_index=True,
+                )
+
+                if len(snap_avail) >= 2:
+                    st.markdown("**時点間の要因の入れ替わり**")
+                    dc1, dc2 = st.columns(2)
+                    with dc1:
+                        drift_a = st.selectbox("変化前", snap_avail, format_func=snap_names.get, key="arc_shap_a")
+                    with dc2:
+                        drift_b = st.selectbox(
+                            "変化後", snap_avail, index=len(snap_avail) - 1,
+                            format_func=snap_names.get, key="arc_shap_b",
+                        )
+                    if drift_a == drift_b:
+                        st.info("異なる時点を選んでください。")
+                    else:
+                        with prof.span("render.shap_drift"):
+                            drift_table, drift_overall = _shap_drift(_archive_signature(), drift_a, drift_b)
+                        if not drift_overall:
+                            st.info("両方の時点の SHAP 要因がある馬がいません。")
+                        else:
+                            mc = st.columns(5)
+                            mc[0].metric("対象馬", drift_overall["対象馬"])
+                            for col, key in zip(mc[1:], ["符号反転", "新規", "圏外へ"]):
+                                col.metric(f"{key}(%)", f"{drift_overall.get(key, 0.0):.1f}")
+                            mc[4].metric("平均順位変化", f"{drift_overall['平均順位変化']:.2f}")
+                            st.dataframe(
+                                drift_table.rename(columns={"label": "要因"}).style.format(
+                                    {"変動率(%)": "{:.1f}", "平均順位変化": "{:.2f}"}, na_rep="-",
+                                ),
+                                use_container_width=True, hide_index=True,
+                            )
+
+        # ─── 確率キャリブレーション ───
+        st.markdown("---")
+        st.subheader("確率キャリブレーション（勝率 vs calibrated_prob）")
+        st.caption(
+            "結果のある全レースで、予測確率と実際の1着率を比べます。Brier・LogLoss は小さいほど良く、"
+            "ECE は確率帯ごとの「予測平均と実際のずれ」の加重平均です。両方の確率がある馬だけで比較しています。"
+        )
+        if _show_section("arc_show_calib"):
+            with prof.span("render.calibration"):
+                calib = _calibration_stats(_archive_signature())
+            if calib.empty:
+                st.info("結果付きの予測データがまだありません。")
+            else:
+                cc1, cc2 = st.columns(2)
+                with cc1:
+                    calib_slice = st.selectbox(
+                        "切り口", calibration.SLICES, key="arc_calib_slice",
+                        format_func=lambda s: {"venue": "競馬場", "grade": "グレード"}.get(s, s),
+                    )
+                slice_values = sorted(calib.loc[calib["slice"] == calib_slice, "value"].unique())
+                with cc2:
+                    calib_value = st.selectbox("対象", slice_values, key=f"arc_calib_value_{calib_slice}")
+
+                score_df = calibration.scores(calib, calib_slice)
+                st.dataframe(
+                    score_df.rename(columns={"value": "対象", "source": "確率"}).style.format({
+                        "Brier": "{:.4f}", "LogLoss": "{:.4f}", "予測平均(%)": "{:.2f}",
+                        "実際の勝率(%)": "{:.2f}", "ECE(%)": "{:.2f}",
+                    }),
+                    use_container_width=True, hide_index=True,
+                )
+
+                rel = calibration.reliability(calib, calib_slice, calib_value)
+                st.markdown(f"**信頼性曲線（{calib_value}）** — 対角線（予測=実際）に近いほど確率が正確")
+                diag_max = float(rel["予測平均"].max()) if not rel.empty else 0.0
+                diag = pd.DataFrame({"source": "予測=実際", "予測平均": [0.0, diag_max], "実際の勝率": [0.0, diag_max]})
+                st.line_chart(
+                    pd.concat([rel[["source", "予測平均", "実際の勝率"]], diag], ignore_index=True),
+                    x="予測平均", y="実際の勝率", color="source",
+                )
+                st.dataframe(
+                    rel.pivot_table(index="区間", columns="source", values=["件数", "予測平均", "実際の勝率"])
+                    .sort_index(key=lambda idx: idx.map(lambda s: float(s.split("%")[0])))
+                    .round(2),
+                    use_container_width=True,
+                )
+
+# ====================================================================
+# 管理パネル（?admin= がトークンと一致するときだけサイドバーに表示）
+# ====================================================================
+prof.log()
+if _admin_mode:
+    with st.sidebar.expander("⏱ リラン計測", expanded=True):
+        _prof_history = st.session_state.setdefault("_prof_history", [])
+        _prof_history.append(round(prof.total_ms(), 1))
+        del _prof_history[:-30]
+        st.metric("このリラン", f"{_prof_history[-1]:.1f} ms")
+        st.line_chart(_prof_history, height=120)
+        if prof.span_rows():
+            st.dataframe(pd.DataFrame(prof.span_rows()), use_container_width=True, hide_index=True)
+        if prof.cache_rows():
+            st.dataframe(pd.DataFrame(prof.cache_rows()), use_container_width=True, hide_index=True)
+        st.caption("先読み: " + " / ".join(f"{k} {v}" for k, v in _prefetcher().stats.items()))
+        _store_info = _mapped_store().info()
+        st.caption(
+            "mmap ストア: " + " / ".join(f"{k} {v}" for k, v in _store_info.items())
+            if _store_info else "mmap ストア: なし（元ファイルを読み込み中）"
+        )
@@ -0,0 +1,147 @@
+"""予測アーカイブ（data/predictions）を分析用のフラットなテーブルに展開する。
+
+1日分の予測データ（load_prediction の戻り値）から
+    - day_horse_rows: 1頭1行（予測値 + 埋め込み結果の着順）
+    - day_race_rows:  1レース1行（レース属性 + 勝負度・パターン）
+を作り、horse_frame / race_frame で全日付を DataFrame にまとめる。
+1日単位で完結しているので、呼び出し側はファイル単位でキャッシュして連結すればよい。
+"""
+from __future__ import annotations
+
+import re
+from typing import Iterable
+
+import pandas as pd
+
+RACE_KEY = ["date", "race_id"]
+
+HORSE_COLUMNS = [
+    "date", "race_id", "予測順位", "馬番", "馬名", "horse_id", "勝率(%)", "calibrated_prob(%)",
+    "スコア", "単勝", "単勝_evening", "単勝_morning_early", "人気", "期待値", "career",
+    "着順", "確定単勝",
+]
+RACE_COLUMNS = [
+    "date", "race_id", "race_name", "grade", "venue", "distance", "芝ダ", "距離", "頭数",
+    "パターン", "勝負度", "勝負度ラベル", "結果あり",
+]
+
+
+def parse_surface(distance: str) -> str:
+    """'芝1800m' / 'ダ1400m' / 'ダート1800m' / '障3000m' → 芝 / ダート / 障害（不明は空文字）。"""
+    distance = distance or ""
+    if distance.startswith("芝"):
+        return "芝"
+    if distance.startswith("ダ"):
+        return "ダート"
+    if distance.startswith("障"):
+        return "障害"
+    return ""
+
+
+def parse_distance_m(distance: str) -> int:
+    m = re.search(r"(\d+)", distance or "")
+    return int(m.group(1)) if m else 0
+
+
+def _num(v):
+    try:
+        return float(v) if v is not None and v != "" else None
+    except (TypeError, ValueError):
+        return None
+
+
+def day_horse_rows(date: str, data: dict) -> list[dict]:
+    """1日分の予測データを 1頭1行に展開する。
+
+    着順・確定単勝は埋め込み結果から馬番で引く。結果が無い／取消・中止なら None。
+    """
+    rows = []
+    for race in data.get("races") or []:
+        finish, final_odds = {}, {}
+        for r in race.get("result") or []:
+            umaban = _num(r.get("馬番"))
+            if umaban is not None:
+                finish[int(umaban)] = _num(r.get("着順"))
+                final_odds[int(umaban)] = _num(r.get("単勝"))
+        for p in race.get("predictions") or []:
+            umaban = _num(p.get("馬番"))
+            rows.append({
+                "date": date,
+                "race_id": race.get("race_id", ""),
+                "予測順位": _num(p.get("予測順位")),
+                "馬番": umaban,
+                "馬名": p.get("馬名") or "",
+                "horse_id": p.get("horse_id") or "",
+                "勝率(%)": _num(p.get("勝率(%)")),
+                "calibrated_prob(%)": _num(p.get("calibrated_prob(%)")),
+                "スコア": _num(p.get("スコア")),
+                "単勝": _num(p.get("単勝")),
+                "単勝_evening": _num(p.get("単勝_evening")),
+                "単勝_morning_early": _num(p.get("単勝_morning_early")),
+                "人気": _num(p.get("人気")),
+                "期待値": _num(p.get("期待値")),
+                "career": _num(p.get("career")),
+                "着順": finish.get(int(umaban)) if umaban is not None else None,
+                "確定単勝": final_odds.get(int(umaban)) if umaban is not None else None,
+            })
+    return rows
+
+
+def day_race_rows(date: str, data: dict) -> list[dict]:
+    """1日分の予測データを 1レース1行に展開する。"""
+    rows = []
+    for race in data.get("races") or []:
+        distance = race.get("distance", "")
+        conf = race.get("confidence") or {}
+        rec = race.get("recommendation") or {}
+        rows.append({
+            "date": date,
+            "race_id": race.get("race_id", ""),
+            "race_name": race.get("race_name", race.get("race_id", "")),
+            "grade": race.get("grade", ""),
+            "venue": race.get("venue", ""),
+            "distance": distance,
+            "芝ダ": parse_surface(distance),
+            "距離": parse_distance_m(distance),
+            "頭数": len(race.get("predictions") or []),
+            "パターン": rec.get("パターン", ""),
+            "勝負度": int(conf.get("level", 0) or 0),
+            "勝負度ラベル": conf.get("label", "−"),
+            "結果あり": bool(race.get("result")),
+        })
+    return rows
+
+
+def horse_frame(horse_rows: Iterable[list[dict]]) -> pd.DataFrame:
+    """日別の day_horse_rows を連結した DataFrame（列は HORSE_COLUMNS 固定）。"""
+    rows = [r for day in horse_rows for r in day]
+    return pd.DataFrame(rows, columns=HORSE_COLUMNS)
+
+
+def race_frame(race_rows: Iterable[list[dict]]) -> pd.DataFrame:
+    """日別の day_race_rows を連結した DataFrame（列は RACE_COLUMNS 固定）。"""
+    rows = [r for day in race_rows for r in day]
+    return pd.DataFrame(rows, columns=RACE_COLUMNS)
+
+
+def _pick(horses: pd.DataFrame, mask: pd.Series, prefix: str, cols: list[str]) -> pd.DataFrame:
+    """レースごとに mask を満たす先頭の馬を選び、列名に prefix を付けて返す。"""
+    picked = horses.loc[mask, RACE_KEY + cols].drop_duplicates(RACE_KEY)
+    return picked.rename(columns={c: f"{prefix}{c}" for c in cols})
+
+
+def race_summary(races: pd.DataFrame, horses: pd.DataFrame) -> pd.DataFrame:
+    """レース行に Top1・1番人気・2番人気・勝ち馬の情報を横持ちで付与する（全レース一括）。"""
+    cols = ["馬番", "馬名", "人気", "予測順位", "勝率(%)", "単勝", "着順", "確定単勝"]
+    ordered = horses.sort_values(RACE_KEY + ["予測順位"])
+    out = races
+    for prefix, mask in [
+        ("Top1", ordered["予測順位"] == 1),
+        ("Top2", ordered["予測順位"] == 2),
+        ("1人気", ordered["人気"] == 1),
+        ("2人気", ordered["人気"] == 2),
+        ("勝ち馬", ordered["着順"] == 1),
+    ]:
+        out = out.merge(_pick(ordered, mask, prefix, cols), on=RACE_KEY, how="left")
+    out["単勝配当"] = out["勝ち馬確定単勝"] * 100
+    return out
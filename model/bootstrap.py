@@ -0,0 +1,109 @@
+"""filter_results.csv の各条件について、回収率のブートストラップ信頼区間を一括計算する。
+
+条件（「勝率差帯 × オッズ帯 × 距離帯」= 「差<3% / 10〜30倍 / 中距離」など）を
+race_analysis.csv の帯列に対する (R, C) の 0/1 行列にし、
+ブートストラップの重みは Poisson(1) に従う (B, R) 行列で表す（Poisson ブートストラップ）。
+    レース数の再標本 = W @ M,  払戻額の再標本 = W @ (M * 払戻額)
+という行列積 2 回で、B 回 × 全条件の回収率が Python ループなしで出る。
+B はメモリを抑えるため BATCH 行ずつ処理する。乱数の seed は固定なので同じデータなら同じ結果。
+
+使い方:
+    python -m model.bootstrap data/strategy   # 全条件の計算時間と下限上位を表示
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+N_BOOT = 1000
+BATCH = 250
+SEED = 20240101
+STAKE = 100
+
+
+def parse_conditions(filter_df: pd.DataFrame) -> list[dict[str, str]]:
+    """条件・値の列を {帯列名: 値} のリストにする。"""
+    conds = []
+    for cols, vals in zip(filter_df["条件"], filter_df["値"]):
+        names = [c.strip() for c in str(cols).split("×")]
+        values = [v.strip() for v in str(vals).split(" / ")]
+        conds.append(dict(zip(names, values)))
+    return conds
+
+
+def condition_matrix(races: pd.DataFrame, conditions: list[dict[str, str]]) -> np.ndarray:
+    """(R, C) の float32 行列。races の行 r が条件 c に該当すれば 1。
+
+    帯列ごとに値をコード化し、(R, 1) と (1, C) の比較を列数ぶん AND するだけで作る。
+    """
+    mask = np.ones((len(races), len(conditions)), dtype=bool)
+    columns = sorted({c for cond in conditions for c in cond})
+    for col in columns:
+        if col not in races.columns:
+            raise KeyError(f"race_analysis に列がありません: {col}")
+        codes, uniques = pd.factorize(races[col].astype(str))
+        lookup = {v: i for i, v in enumerate(uniques)}
+        # 条件にこの列が無ければ -1（全行該当）、値がデータに無ければ -2（該当なし）
+        wanted = np.array([
+            lookup.get(cond[col], -2) if col in cond else -1 for cond in conditions
+        ])
+        mask &= (codes[:, None] == wanted[None, :]) | (wanted[None, :] == -1)
+    return mask.astype(np.float32)
+
+
+def bootstrap_roi(
+    payout: np.ndarray,
+    mask: np.ndarray,
+    n_boot: int = N_BOOT,
+    seed: int = SEED,
+) -> np.ndarray:
+    """(B, C) の回収率(%) 再標本。該当レースが再標本で 0 件の要素は NaN。"""
+    payout = np.asarray(payout, dtype=np.float32)
+    weighted_payout = mask * payout[:, None]
+    rng = np.random.default_rng(seed)
+    out = np.empty((n_boot, mask.shape[1]), dtype=np.float32)
+    for start in range(0, n_boot, BATCH):
+        stop = min(start + BATCH, n_boot)
+        w = rng.poisson(1.0, size=(stop - start, mask.shape[0])).astype(np.float32)
+        races = w @ mask
+        returns = w @ weighted_payout
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out[start:stop] = np.where(races > 0, returns / (races * STAKE) * 100, np.nan)
+    return out
+
+
+def roi_intervals(
+    races: pd.DataFrame,
+    filter_df: pd.DataFrame,
+    n_boot: int = N_BOOT,
+    ci: float = 0.95,
+    seed: int = SEED,
+) -> pd.DataFrame:
+    """filter_df の各行に 回収率下限・回収率上限・P(回収率>100%) を付けて返す。"""
+    mask = condition_matrix(races, parse_conditions(filter_df))
+    samples = bootstrap_roi(races["払戻額"].to_numpy(), mask, n_boot=n_boot, seed=seed)
+    alpha = (1 - ci) / 2 * 100
+    lo, hi = np.nanpercentile(samples, [alpha, 100 - alpha], axis=0)
+    valid = np.isfinite(samples).sum(axis=0)
+    p_win = np.where(valid > 0, (samples > 100).sum(axis=0) / np.maximum(valid, 1), np.nan)
+    return filter_df.assign(
+        回収率下限=np.round(lo, 1),
+        回収率上限=np.round(hi, 1),
+        **{"P(回収率>100%)": np.round(p_win * 100, 1)},
+    )
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from pathlib import Path
+
+    strategy_dir = Path(sys.argv[1] if len(sys.argv) > 1 else "data/strategy")
+    race_df = pd.read_csv(strategy_dir / "race_analysis.csv")
+    cond_df = pd.read_csv(strategy_dir / "filter_results.csv")
+    t0 = time.perf_counter()
+    result = roi_intervals(race_df, cond_df)
+    elapsed = time.perf_counter() - t0
+    print(f"{len(cond_df)} conditions x {N_BOOT} resamples over {len(race_df)} races in {elapsed * 1000:.0f} ms")
+    cols = ["条件", "値", "レース数", "回収率", "回収率下限", "回収率上限", "P(回収率>100%)"]
+    print(result.sort_values("回収率下限", ascending=False)[cols].head(10).to_string(index=False))
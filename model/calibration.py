@@ -0,0 +1,122 @@
+"""勝率(%) と calibrated_prob(%) のキャリブレーション（確率の当たり具合）評価。
+
+1日分の予測（archive.day_horse_rows / day_race_rows）から、確率の出どころ（SOURCES）×
+切り口（SLICES: 全体・競馬場・芝ダ・距離帯・グレード）× 確率ビンごとの十分統計量
+    件数 n, Σp, Σy（1着=1）, Σ(p−y)², Σ対数損失
+を作る（day_stats）。どれも足し算で合成できるので、日別に一度だけ計算してキャッシュし、
+全期間の値は日別統計を合計するだけ（merge_stats）。新しい結果日が来ても再計算はその日の分だけ。
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+SOURCES = {"勝率(%)": "勝率(%)", "calibrated_prob(%)": "calibrated_prob(%)"}
+SLICES = ["全体", "venue", "芝ダ", "距離帯", "grade"]
+BIN_EDGES = [0.0, 0.02, 0.05, 0.10, 0.15, 0.20, 0.30, 0.50, 1.0]
+STAT_COLUMNS = ["source", "slice", "value", "bin", "n", "sum_p", "sum_y", "sum_sq", "sum_ll"]
+_EPS = 1e-6
+
+
+def distance_band(distance_m: float) -> str:
+    """距離(m) → 短距離 / マイル / 中距離 / 長距離（race_analysis.csv の距離帯と同じ区切り）。"""
+    if not distance_m:
+        return ""
+    if distance_m <= 1400:
+        return "短距離"
+    if distance_m <= 1600:
+        return "マイル"
+    if distance_m <= 2200:
+        return "中距離"
+    return "長距離"
+
+
+def _settled_frame(horse_rows: list[dict], race_rows: list[dict]) -> pd.DataFrame:
+    """結果のある出走馬だけに絞り、切り口の列を付けた表。"""
+    horses = pd.DataFrame(horse_rows)
+    if horses.empty or "着順" not in horses.columns:
+        return pd.DataFrame()
+    horses = horses[horses["着順"].notna()]
+    races = pd.DataFrame(race_rows)
+    if horses.empty or races.empty:
+        return pd.DataFrame()
+    races = races.assign(距離帯=races["距離"].map(distance_band), 全体="全体")
+    return horses.merge(races[["race_id", *SLICES]], on="race_id", how="inner")
+
+
+def day_stats(horse_rows: list[dict], race_rows: list[dict]) -> pd.DataFrame:
+    """1日分の十分統計量（列は STAT_COLUMNS）。結果の無い日は空。"""
+    df = _settled_frame(horse_rows, race_rows)
+    if df.empty:
+        return pd.DataFrame(columns=STAT_COLUMNS)
+    # 両方の確率が揃った馬だけで比べる（片方だけ欠けた馬で件数がずれないように）
+    probs = {s: pd.to_numeric(df[col], errors="coerce").to_numpy(float) / 100 for s, col in SOURCES.items()}
+    ok = np.logical_and.reduce([~np.isnan(p) for p in probs.values()])
+    if not ok.any():
+        return pd.DataFrame(columns=STAT_COLUMNS)
+    yy = (df["着順"] == 1).to_numpy(float)[ok]
+    values = np.concatenate([df.loc[ok, c].astype(str).to_numpy() for c in SLICES])
+    parts = []
+    for source, p in probs.items():
+        p = p[ok]
+        pc = p.clip(_EPS, 1 - _EPS)
+        base = {
+            "bin": np.searchsorted(BIN_EDGES, p, side="right").clip(1, len(BIN_EDGES) - 1) - 1,
+            "n": np.ones(len(p), dtype=np.int64),
+            "sum_p": p,
+            "sum_y": yy,
+            "sum_sq": (p - yy) ** 2,
+            "sum_ll": -(yy * np.log(pc) + (1 - yy) * np.log(1 - pc)),
+        }
+        # 切り口ごとに同じ行を縦に積み、groupby 1回で全切り口を集計する
+        parts.append(pd.DataFrame({
+            "source": source,
+            "slice": np.repeat(SLICES, len(p)),
+            "value": values,
+            **{k: np.tile(v, len(SLICES)) for k, v in base.items()},
+        }))
+    long = pd.concat(parts, ignore_index=True)
+    return long.groupby(["source", "slice", "value", "bin"], as_index=False)[
+        ["n", "sum_p", "sum_y", "sum_sq", "sum_ll"]
+    ].sum()[STAT_COLUMNS]
+
+
+def merge_stats(frames) -> pd.DataFrame:
+    """日別の day_stats を合計する（足し算で合成できる統計量なので順序は問わない）。"""
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=STAT_COLUMNS)
+    return pd.concat(frames, ignore_index=True).groupby(
+        ["source", "slice", "value", "bin"], as_index=False,
+    )[["n", "sum_p", "sum_y", "sum_sq", "sum_ll"]].sum()
+
+
+def reliability(stats: pd.DataFrame, slice_col: str = "全体", value: str = "全体") -> pd.DataFrame:
+    """信頼性曲線の点（source, bin, 件数, 予測平均(%), 実際の勝率(%)）。"""
+    sel = stats[(stats["slice"] == slice_col) & (stats["value"] == value)]
+    out = sel.assign(
+        予測平均=sel["sum_p"] / sel["n"] * 100,
+        実際の勝率=sel["sum_y"] / sel["n"] * 100,
+    )
+    out["区間"] = [f"{BIN_EDGES[int(b)]:.0%}〜{BIN_EDGES[int(b) + 1]:.0%}" for b in out["bin"]]
+    return out[["source", "bin", "区間", "n", "予測平均", "実際の勝率"]].rename(columns={"n": "件数"})
+
+
+def scores(stats: pd.DataFrame, slice_col: str = "全体") -> pd.DataFrame:
+    """切り口の値 × source ごとの Brier・対数損失・予測平均と実際の勝率・ECE。"""
+    sel = stats[stats["slice"] == slice_col]
+    if sel.empty:
+        return pd.DataFrame(columns=["value", "source", "件数", "Brier", "LogLoss", "予測平均(%)", "実際の勝率(%)", "ECE(%)"])
+    gap = (sel["sum_p"] - sel["sum_y"]).abs()
+    sel = sel.assign(_gap=gap)
+    g = sel.groupby(["value", "source"])
+    n = g["n"].sum()
+    out = pd.DataFrame({
+        "件数": n,
+        "Brier": g["sum_sq"].sum() / n,
+        "LogLoss": g["sum_ll"].sum() / n,
+        "予測平均(%)": g["sum_p"].sum() / n * 100,
+        "実際の勝率(%)": g["sum_y"].sum() / n * 100,
+        "ECE(%)": g["_gap"].sum() / n * 100,  # ビンごとの |Σp − Σy| の合計 / 件数
+    })
+    return out.reset_index()
@@ -0,0 +1,112 @@
+"""AIコメント（data/ai_comments/*.json）の全文検索用 n-gram インデックス。
+
+日本語の分かち書きに依存しないよう、コメントを文字 bigram に分解して
+bigram → コメントID の転置リストを持つ。検索語も bigram に分け、転置リストの
+積集合で候補を絞ってから実際の部分一致で確認する（bigram の並び違いによる誤ヒットを除く）。
+空白は「5 走」「5走」の揺れを吸収するため索引・検索の両方で取り除く。
+
+コメントファイル単位でシグネチャを覚えておき、変わったファイル・消えたファイルだけを
+差し替える（sync）。更新はロックで直列化し、検索も同じロックの中で読む。
+"""
+from __future__ import annotations
+
+import re
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Callable
+
+NGRAM = 2
+_SPACE = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    """索引・検索共通の正規化（NFKC・空白除去・英字は小文字）。"""
+    return _SPACE.sub("", unicodedata.normalize("NFKC", text or "")).lower()
+
+
+def ngrams(text: str, n: int = NGRAM) -> set[str]:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class CommentIndex:
+    """コメントファイル単位で差分更新する n-gram 転置インデックス。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sigs: dict[str, tuple | None] = {}     # ファイル → 登録時のシグネチャ
+        self._file_docs: dict[str, list[int]] = {}   # ファイル → コメントID
+        self._docs: dict[int, tuple[str, str, str, str]] = {}  # ID → (ファイル, race_id, 馬名, コメント)
+        self._norm: dict[int, str] = {}              # ID → 正規化済みコメント
+        self._postings: dict[str, set[int]] = {}     # n-gram → コメントID
+        self._next_id = 0
+
+    def sync(self, files_sig: tuple, load_file: Callable[[str], dict]) -> int:
+        """files_sig（(パス, シグネチャ) の並び）に合わせて増減分だけ登録し直す。変更ファイル数を返す。"""
+        wanted = dict(files_sig)
+        with self._lock:
+            stale = [p for p, sig in self._sigs.items() if wanted.get(p, ...) != sig]
+            fresh = [p for p, sig in wanted.items() if self._sigs.get(p, ...) != sig]
+            for path_str in stale:
+                self._remove(path_str)
+            for path_str in fresh:
+                self._add(path_str, wanted[path_str], load_file(path_str))
+            return len(set(stale) | set(fresh))
+
+    def _add(self, path_str: str, sig: tuple | None, data: dict) -> None:
+        ids = []
+        for race_id, comments in (data or {}).items():
+            if not isinstance(comments, dict):
+                continue
+            for name, text in comments.items():
+                if not text:
+                    continue
+                doc_id = self._next_id
+                self._next_id += 1
+                norm = normalize(text)
+                self._docs[doc_id] = (path_str, str(race_id), name, text)
+                self._norm[doc_id] = norm
+                for gram in ngrams(norm):
+                    self._postings.setdefault(gram, set()).add(doc_id)
+                ids.append(doc_id)
+        self._file_docs[path_str] = ids
+        self._sigs[path_str] = sig
+
+    def _remove(self, path_str: str) -> None:
+        for doc_id in self._file_docs.pop(path_str, []):
+            for gram in ngrams(self._norm.pop(doc_id)):
+                ids = self._postings.get(gram)
+                if ids is not None:
+                    ids.discard(doc_id)
+                    if not ids:
+                        del self._postings[gram]
+            del self._docs[doc_id]
+        self._sigs.pop(path_str, None)
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def search(self, query: str, limit: int = 200) -> tuple[int, list[dict]]:
+        """空白区切りの全語を含むコメント（AND 検索）の総件数と先頭 limit 件 [{file, race_id, 馬名, コメント}]。
+
+        並びは新しいコメントファイル（ファイル名 = 日付）順なので、limit で切られるのは古いコメント。
+        """
+        terms = [normalize(t) for t in query.split()]
+        terms = [t for t in terms if t]
+        if not terms:
+            return 0, []
+        grams = set().union(*(ngrams(t) for t in terms))
+        with self._lock:  # sync が転置リスト・コメントを書き換えている途中を読まない
+            if grams:
+                postings = sorted((self._postings.get(g, set()) for g in grams), key=len)
+                candidates = set(postings[0]).intersection(*postings[1:])
+            else:  # 1文字だけの検索語は転置リストを使えないので全件を確認する
+                candidates = set(self._docs)
+            hits = [i for i in sorted(candidates) if all(t in self._norm[i] for t in terms)]
+            # 同じファイル内は登録順のまま（reverse でも安定ソート）
+            hits.sort(key=lambda i: Path(self._docs[i][0]).stem, reverse=True)
+            docs = [self._docs[i] for i in hits[:limit]]
+        return len(hits), [
+            {"file": path_str, "race_id": race_id, "馬名": name, "コメント": text}
+            for path_str, race_id, name, text in docs
+        ]
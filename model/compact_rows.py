@@ -0,0 +1,258 @@
+"""予測データのコンパクトなメモリ表現（列指向の行テーブル + 文字列の intern）。
+
+予測ファイルの馬（predictions）・期待値一覧・結果・SHAP 要因などは「同じキーを持つ dict のリスト」で、
+1頭ごとに dict 本体・キー参照・float オブジェクトを持つ。アーカイブ全体ではこれが数万個になり、
+st.cache_data から返るコピーごとに同じだけ増える。compact() はこれを次の形に置き換える:
+    RowTable   リスト1つ分の列指向テーブル。列は型ごとに
+                 int   → array('q')   float → array('d')   それ以外 → list（文字列は sys.intern）
+               None・キーの欠けは列ごとの bytearray（MASK_*）で持つ（全行そろった列には無い）
+    Row        RowTable の i 行目を dict のように読むビュー（__slots__。参照時に作るだけで保持しない）
+Row は collections.abc.Mapping なので p["馬名"] / p.get(...) / {**p} / pd.DataFrame(rows) は
+dict のときと同じく動く。RowTable は Sequence（len・添字・スライス・反復・==）。
+元の dict/list に戻すときは plain()。
+
+    python -m model.compact_rows bench data/predictions   # dict のままとの常駐メモリ・pickle サイズの比較
+"""
+from __future__ import annotations
+
+import gc
+import pickle
+import sys
+import time
+import tracemalloc
+from array import array
+from collections.abc import Mapping, Sequence
+from pathlib import Path
+
+MASK_VALUE, MASK_NONE, MASK_MISSING = 0, 1, 2
+MIN_ROWS = 2  # これ未満のリストは dict のまま
+
+
+class _Missing:
+    __slots__ = ()
+
+    def __repr__(self):
+        return "<missing>"
+
+
+_MISSING = _Missing()
+
+
+def _intern(v):
+    return sys.intern(v) if isinstance(v, str) else v
+
+
+def _flat_dict(x) -> bool:
+    """値が入れ子でない dict か（テーブル化の対象）。"""
+    return type(x) is dict and not any(isinstance(v, (dict, list)) for v in x.values())
+
+
+class _Column:
+    __slots__ = ("data", "mask")
+
+    def __init__(self, data, mask: bytearray | None):
+        self.data = data
+        self.mask = mask
+
+    def __getstate__(self):
+        return self.data, self.mask
+
+    def __setstate__(self, state):
+        self.data, self.mask = state
+
+
+def _build_column(values: list) -> _Column:
+    """1列分の値（欠けは _MISSING）から型に合った列を作る。"""
+    present = [v for v in values if v is not None and v is not _MISSING]
+    if present and all(type(v) is int for v in present):
+        data, fill = array("q"), 0
+    elif present and all(type(v) is float for v in present):
+        data, fill = array("d"), 0.0
+    else:
+        data, fill = None, None
+    if len(present) == len(values):
+        mask = None
+    else:
+        mask = bytearray(
+            MASK_MISSING if v is _MISSING else MASK_NONE if v is None else MASK_VALUE for v in values
+        )
+    if data is None:
+        return _Column([None if v is _MISSING else _intern(v) for v in values], mask)
+    data.extend(fill if v is None or v is _MISSING else v for v in values)
+    return _Column(data, mask)
+
+
+class RowTable(Sequence):
+    """同じキーを持つ dict のリストの列指向表現。"""
+
+    __slots__ = ("keys", "_index", "_cols", "_n")
+
+    def __init__(self, rows: list[dict]):
+        keys: dict[str, None] = {}
+        for r in rows:
+            keys.update(dict.fromkeys(r))
+        self.keys = tuple(sys.intern(k) for k in keys)
+        self._index = {k: i for i, k in enumerate(self.keys)}
+        self._cols = tuple(_build_column([r.get(k, _MISSING) for r in rows]) for k in self.keys)
+        self._n = len(rows)
+
+    def __getstate__(self):
+        return self.keys, self._cols, self._n
+
+    def __setstate__(self, state):
+        self.keys, self._cols, self._n = state
+        self._index = {k: i for i, k in enumerate(self.keys)}
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [Row(self, j) for j in range(*i.indices(self._n))]
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError("RowTable index out of range")
+        return Row(self, i)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (RowTable, list)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"RowTable({self._n} rows × {len(self.keys)} keys)"
+
+    def _value(self, c: int, i: int):
+        """c 列 i 行の値。キーが無い行は _MISSING。"""
+        col = self._cols[c]
+        if col.mask is not None and col.mask[i] != MASK_VALUE:
+            return None if col.mask[i] == MASK_NONE else _MISSING
+        return col.data[i]
+
+    def column(self, key: str) -> list:
+        """1列分の値のリスト（キーが無い行は None）。"""
+        c = self._index[key]
+        return [None if (v := self._value(c, i)) is _MISSING else v for i in range(self._n)]
+
+    def to_list(self) -> list[dict]:
+        return [dict(r) for r in self]
+
+
+class Row(Mapping):
+    """RowTable の1行を dict として読むビュー。"""
+
+    __slots__ = ("_t", "_i")
+
+    def __init__(self, table: RowTable, i: int):
+        self._t = table
+        self._i = i
+
+    def __getitem__(self, key):
+        c = self._t._index.get(key)
+        if c is None:
+            raise KeyError(key)
+        v = self._t._value(c, self._i)
+        if v is _MISSING:
+            raise KeyError(key)
+        return v
+
+    def get(self, key, default=None):
+        c = self._t._index.get(key)
+        if c is None:
+            return default
+        v = self._t._value(c, self._i)
+        return default if v is _MISSING else v
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __iter__(self):
+        t, i = self._t, self._i
+        return (k for c, k in enumerate(t.keys) if t._value(c, i) is not _MISSING)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+def compact(obj):
+    """dict/list の木のうち「入れ子の無い dict のリスト」を RowTable に置き換え、文字列を intern する。"""
+    if isinstance(obj, str):
+        return sys.intern(obj)
+    if type(obj) is dict:
+        return {sys.intern(k) if isinstance(k, str) else k: compact(v) for k, v in obj.items()}
+    if type(obj) is list:
+        if len(obj) >= MIN_ROWS and all(_flat_dict(x) for x in obj):
+            return RowTable(obj)
+        return [compact(v) for v in obj]
+    return obj
+
+
+def plain(obj):
+    """compact の逆（RowTable・Row を dict/list に戻す）。"""
+    if isinstance(obj, RowTable):
+        return obj.to_list()
+    if isinstance(obj, Row):
+        return dict(obj)
+    if isinstance(obj, dict):
+        return {k: plain(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [plain(v) for v in obj]
+    return obj
+
+
+# ─── ベンチマーク ─────────────────────────────────────────
+def _resident(load) -> tuple[int, object]:
+    """load() の結果が保持しているメモリ（tracemalloc の増分）。"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = load()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return size, obj
+
+
+def bench(pred_dir: Path) -> None:
+    """アーカイブ全体を dict のまま / compact で持ったときの常駐メモリ・pickle サイズ・読み出し時間。"""
+    from model.pred_codec import find_prediction_files, load_prediction
+
+    paths = list(find_prediction_files(pred_dir).values())
+    raw_bytes, plain_data = _resident(lambda: [load_prediction(p) for p in paths])
+    compact_bytes, compact_data = _resident(lambda: [compact(load_prediction(p)) for p in paths])
+    horses = sum(len(r.get("predictions") or []) for d in plain_data for r in d.get("races") or [])
+    pred_lists = [pickle.dumps(r.get("predictions") or []) for d in plain_data for r in d.get("races") or []]
+    rows_bytes, _ = _resident(lambda: [pickle.loads(b) for b in pred_lists])
+    table_bytes, _ = _resident(lambda: [compact(pickle.loads(b)) for b in pred_lists])
+
+    def _pickle_stats(data):
+        blob = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+        t0 = time.perf_counter()
+        pickle.loads(blob)
+        return len(blob), time.perf_counter() - t0
+
+    p_size, p_time = _pickle_stats(plain_data)
+    c_size, c_time = _pickle_stats(compact_data)
+    assert plain(compact_data) == plain_data, "compact → plain が元と一致しません"
+    print(f"{len(paths)} ファイル・{horses} 頭")
+    print(f"常駐メモリ  dict {raw_bytes / 2**20:8.2f} MB   compact {compact_bytes / 2**20:8.2f} MB"
+          f"   ({raw_bytes / max(compact_bytes, 1):.1f}x)")
+    print(f"馬の行のみ  dict {rows_bytes / 2**20:8.2f} MB   compact {table_bytes / 2**20:8.2f} MB"
+          f"   ({rows_bytes / max(table_bytes, 1):.1f}x・1頭 {rows_bytes / max(horses, 1):.0f}B → {table_bytes / max(horses, 1):.0f}B)")
+    print(f"pickle     dict {p_size / 2**20:8.2f} MB   compact {c_size / 2**20:8.2f} MB"
+          f"   （st.cache_data がセッションに返すコピー1回分）")
+    print(f"unpickle   dict {p_time * 1000:8.1f} ms   compact {c_time * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        bench(Path(sys.argv[2] if len(sys.argv) > 2 else "data/predictions"))
+    else:
+        print("usage: python -m model.compact_rows bench <predictions_dir>")
+        sys.exit(1)
@@ -0,0 +1,112 @@
+"""勝負度の再計算（filter_results.csv の条件をルールとして全レースに一括適用）。
+
+予測ファイルの confidence（level / label / reason）は予測時点のルールで固定されている。
+ここでは filter_results.csv の各条件（「人気帯 × オッズ帯 = 2〜3番人気 / 3〜10倍」など）を
+ルールとし、アーカイブ全レースの帯（race_bands）に対する該当行列を bootstrap.condition_matrix で
+1回で作る。レースごとに該当ルール（MIN_AXES 軸以上）のうち「件数で縮小した回収率」が最大のものを採り、
+該当ルール数に応じて割り引いた値（評価回収率）を LEVEL_CUTS で勝負度 0〜3 に写す。
+    縮小回収率 = (件数 × 回収率 + SHRINK_N × 全体回収率) / (件数 + SHRINK_N)
+    評価回収率 = 最大の縮小回収率 − 該当ルールの縮小回収率の標準偏差 × √(2 ln 該当ルール数)
+縮小は件数の少ない条件の高回収率をそのまま信じないための補正。割引は、1レースが互いに重なる
+数十の条件に該当するので、その最大値が偶然だけでも平均より上振れする分（k 個の推定値の最大は
+平均より概ね 標準偏差 × √(2 ln k) 大きい）を差し引くもの。1軸条件は全レースの半分近くを含み
+レースの特徴を表さないので使わない。全体回収率は filter_results の1軸条件
+（どの帯列も全レースを分割する）から求めるので、filter_results.csv だけで再計算が完結する。
+
+帯の区切りは race_analysis.csv と同じ。パターン（本命型・混戦型・波乱型）は予測ファイルの値を使い、
+無い場合は勝率差だけで決まる範囲（10%以上 = 本命型、5〜10% = 混戦型）だけ補う。
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from model.bootstrap import condition_matrix, parse_conditions
+from model.calibration import distance_band
+from model.race_store import BAND_COLUMNS
+
+SHRINK_N = 50                  # 縮小の強さ（この件数ぶん全体回収率を混ぜる）
+MIN_RACES = 20                 # これ未満の条件はルールにしない
+MIN_AXES = 2                   # これ未満の軸数の条件はレースの評価に使わない
+LEVEL_CUTS = (90.0, 100.0, 110.0)  # 評価回収率がこれ以上で ★ / ★★ / ★★★
+LABELS = {0: "−", 1: "★", 2: "★★", 3: "★★★"}
+
+
+def _band(values: pd.Series, edges: list[float], labels: list[str]) -> pd.Series:
+    """values を右開区間 [edges[i], edges[i+1]) で labels に振り分ける（NaN は空文字）。"""
+    out = pd.cut(values, bins=edges, labels=labels, right=False).astype(object)
+    return out.where(values.notna(), "").fillna("")
+
+
+def race_bands(summary: pd.DataFrame) -> pd.DataFrame:
+    """archive.race_summary に race_analysis と同じ帯列（BAND_COLUMNS）を付ける。"""
+    gap = summary["Top1勝率(%)"] - summary["Top2勝率(%)"]
+    inf = np.inf
+    pattern = summary["パターン"].fillna("")
+    fallback = np.select([gap >= 10, gap >= 5], ["本命型", "混戦型"], default="")
+    return summary.assign(
+        人気帯=_band(summary["Top1人気"], [1, 2, 4, 7, inf], ["1番人気", "2〜3番人気", "4〜6番人気", "7番人気〜"]),
+        勝率差帯=_band(gap.round(2), [-inf, 3, 5, 10, inf], ["差<3%", "差3〜5%", "差5〜10%", "差10%〜"]),
+        頭数帯=_band(summary["頭数"].astype(float), [0, 11, 15, inf], ["〜10頭", "11〜14頭", "15頭〜"]),
+        オッズ帯=_band(summary["Top1単勝"], [0, 3, 10, 30, inf], ["〜3倍", "3〜10倍", "10〜30倍", "30倍〜"]),
+        距離帯=summary["距離"].map(distance_band),
+        パターン=pattern.where(pattern != "", fallback),
+    )
+
+
+def base_roi(filter_df: pd.DataFrame) -> float:
+    """全レースの回収率(%)。1軸条件のうち合計件数が最大の帯列（= 全レースの分割）の払戻合計から求める。"""
+    single = filter_df[filter_df["軸数"] == 1]
+    if single.empty:
+        return float(np.average(filter_df["回収率"], weights=filter_df["レース数"]))
+    totals = single.groupby("条件")[["レース数", "払戻額", "投資額"]].sum()
+    top = totals.loc[totals["レース数"].idxmax()]
+    return float(top["払戻額"] / top["投資額"] * 100)
+
+
+def compile_rules(filter_df: pd.DataFrame, min_races: int = MIN_RACES) -> pd.DataFrame:
+    """filter_results をルール表にする（条件・値・件数・回収率・縮小回収率・conditions）。"""
+    base = base_roi(filter_df)
+    rules = filter_df[filter_df["レース数"] >= min_races].reset_index(drop=True)
+    shrunk = (rules["レース数"] * rules["回収率"] + SHRINK_N * base) / (rules["レース数"] + SHRINK_N)
+    return rules.assign(縮小回収率=shrunk, conditions=parse_conditions(rules))
+
+
+def rescore(summary: pd.DataFrame, rules: pd.DataFrame) -> pd.DataFrame:
+    """全レースの再計算後の勝負度。
+
+    Returns:
+        RACE_KEY + [勝負度_元, 勝負度_再, ラベル_再, 根拠, 該当ルール数, 縮小回収率, 評価回収率]
+        （縮小回収率は最大のルールの値、評価回収率はそれを該当ルール数で割り引いた値）
+    """
+    bands = race_bands(summary)
+    out = bands[["date", "race_id"]].assign(勝負度_元=summary["勝負度"].to_numpy())
+    rules = rules[rules["軸数"] >= MIN_AXES].reset_index(drop=True)
+    if rules.empty or bands.empty:
+        return out.assign(勝負度_再=0, ラベル_再=LABELS[0], 根拠="", 該当ルール数=0,
+                          縮小回収率=np.nan, 評価回収率=np.nan)
+    hit = condition_matrix(bands[BAND_COLUMNS], list(rules["conditions"])).astype(bool)  # (R, C)
+    shrunk = np.where(hit, rules["縮小回収率"].to_numpy(float)[None, :], np.nan)
+    matched = hit.any(axis=1)
+    n_hit = hit.sum(axis=1)
+    best = np.where(hit, shrunk, -np.inf).argmax(axis=1)
+    best_score = shrunk[np.arange(len(bands)), best]
+    spread = np.nanstd(np.where(matched[:, None], shrunk, 0.0), axis=1)
+    score = best_score - spread * np.sqrt(2 * np.log(np.maximum(n_hit, 1)))
+    level = np.searchsorted(np.asarray(LEVEL_CUTS), np.where(matched, score, -np.inf), side="right")
+    reason = np.where(
+        matched,
+        rules["条件"].to_numpy(str)[best] + " = " + rules["値"].to_numpy(str)[best]
+        + "（" + rules["レース数"].to_numpy().astype(str)[best] + "件・回収率"
+        + rules["回収率"].to_numpy(float)[best].round(1).astype(str) + "%、該当"
+        + n_hit.astype(str) + "条件で割引後 " + np.round(score, 1).astype(str) + "%）",
+        "",
+    )
+    return out.assign(
+        勝負度_再=level,
+        ラベル_再=[LABELS[int(lv)] for lv in level],
+        根拠=reason,
+        該当ルール数=n_hit,
+        縮小回収率=np.where(matched, best_score, np.nan),
+        評価回収率=np.where(matched, score, np.nan),
+    )
@@ -0,0 +1,166 @@
+"""勝率ベクトルから馬連・ワイド・馬単・3連複・3連単の確率を一括計算する（Harville モデル）。
+
+Harville: 1着 i の確率 p_i、i を除いた残りで j が勝つ確率 p_j / (1 - p_i)、… を掛け合わせて
+着順の同時確率を作る。複数レースは頭数を最大頭数にゼロ埋めした (R, N) 行列で扱い、
+(R, N, N) / (R, N, N, N) のテンソル演算 1 回で全組み合わせを出す（18頭で 3連単 4,896 通り）。
+大量レースはメモリを抑えるため BATCH レースずつ処理する。
+
+使い方:
+    python -m model.exotic_bets data/predictions   # アーカイブ全レースの計算時間を表示
+"""
+from __future__ import annotations
+
+import itertools
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+BET_TYPES = ("馬連", "ワイド", "馬単", "3連複", "3連単")
+BATCH = 256
+_EPS = 1e-12
+
+
+def prob_matrix(prob_lists: list[list[float]]) -> tuple[np.ndarray, np.ndarray]:
+    """レースごとの勝率リスト（% でも 0〜1 でも可）を行和1に正規化した (R, N) 行列と有効マスクにする。"""
+    n_max = max((len(p) for p in prob_lists), default=0)
+    probs = np.zeros((len(prob_lists), n_max))
+    for r, p in enumerate(prob_lists):
+        probs[r, :len(p)] = np.nan_to_num(np.asarray(p, dtype=float), nan=0.0).clip(min=0)
+    valid = probs > 0
+    total = probs.sum(axis=1, keepdims=True)
+    probs = np.divide(probs, total, out=np.zeros_like(probs), where=total > 0)
+    return probs, valid
+
+
+@lru_cache(maxsize=None)
+def _combo_index(n: int, bet_type: str) -> np.ndarray:
+    """頭数 n の組み合わせ添字（馬連・ワイド・3連複は昇順、馬単・3連単は順列）。"""
+    k = 2 if bet_type in ("馬連", "ワイド", "馬単") else 3
+    gen = itertools.permutations if bet_type in ("馬単", "3連単") else itertools.combinations
+    idx = np.array(list(gen(range(n), k)), dtype=np.intp)
+    return idx.reshape(-1, k)
+
+
+def harville(probs: np.ndarray) -> dict[str, np.ndarray]:
+    """(R, N) の正規化勝率から券種別の確率テンソルを返す。
+
+    Returns:
+        {"馬単": (R,N,N), "3連単": (R,N,N,N), "馬連"/"ワイド": (R,N,N) 対称, "3連複": (R,N,N,N) 対称}
+        同じ馬を含む要素は 0。
+    """
+    _, n = probs.shape
+    eye2 = np.eye(n, dtype=bool)
+    p_i = probs[:, :, None]
+    p_j = probs[:, None, :]
+    exacta = p_i * p_j / np.maximum(1 - p_i, _EPS)
+    exacta[:, eye2] = 0.0
+
+    rem2 = np.maximum(1 - p_i - p_j, _EPS)[..., None]
+    trifecta = exacta[..., None] * probs[:, None, None, :] / rem2
+    same = eye2[:, :, None] | eye2[:, None, :] | eye2[None, :, :]
+    trifecta[:, same] = 0.0
+
+    trio = sum(trifecta.transpose(0, *perm) for perm in itertools.permutations((1, 2, 3)))
+    return {
+        "馬単": exacta,
+        "馬連": exacta + exacta.transpose(0, 2, 1),
+        "ワイド": trio.sum(axis=3),
+        "3連単": trifecta,
+        "3連複": trio,
+    }
+
+
+def _flatten(tensors: dict[str, np.ndarray], bet_type: str) -> tuple[np.ndarray, np.ndarray]:
+    """券種テンソルを (R, 組み合わせ数) に平坦化し、組み合わせ添字と一緒に返す。"""
+    tensor = tensors[bet_type]
+    idx = _combo_index(tensor.shape[1], bet_type)
+    return tensor[(slice(None), *idx.T)], idx
+
+
+def combination_probs(
+    prob_lists: list[list[float]], bet_types=BET_TYPES,
+) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """全レース・全組み合わせの確率。{券種: ((R, C) 確率, (C, k) 組み合わせ添字)}。
+
+    ゼロ埋めした馬（頭数不足・勝率0）を含む組み合わせは確率 0 になる。
+    """
+    probs, _ = prob_matrix(prob_lists)
+    out: dict[str, list] = {b: [] for b in bet_types}
+    idx_map: dict[str, np.ndarray] = {}
+    for start in range(0, len(probs), BATCH):
+        tensors = harville(probs[start:start + BATCH])
+        for b in bet_types:
+            values, idx = _flatten(tensors, b)
+            out[b].append(values)
+            idx_map[b] = idx
+    n_max = probs.shape[1]
+    return {
+        b: (np.vstack(v) if v else np.zeros((0, 0)), idx_map.get(b, _combo_index(n_max, b)))
+        for b, v in out.items()
+    }
+
+
+def rank_race(
+    predictions: list[dict],
+    prob_key: str = "勝率(%)",
+    bet_types=BET_TYPES,
+    odds: dict[tuple[str, str], float] | None = None,
+    top: int = 10,
+) -> pd.DataFrame:
+    """1レースの全組み合わせを確率（オッズがあれば期待値）順に並べた上位 top 件。
+
+    Args:
+        odds: {(券種, 組番文字列): オッズ}。組番は "3-8"（馬連・ワイド・3連複は昇順）。
+    Returns:
+        [券種, 組番, 馬名, 確率(%), 理論オッズ, オッズ, 期待値]
+    """
+    runners = [p for p in predictions if p.get("馬番") is not None]
+    if len(runners) < 3:
+        return pd.DataFrame(columns=["券種", "組番", "馬名", "確率(%)", "理論オッズ", "オッズ", "期待値"])
+    umaban = np.array([int(p["馬番"]) for p in runners])
+    names = np.array([p.get("馬名", "") for p in runners], dtype=object)
+    probs = combination_probs([[p.get(prob_key) or 0 for p in runners]], bet_types)
+    frames = []
+    for b, (values, idx) in probs.items():
+        v = values[0]
+        if b in ("馬単", "3連単"):
+            horse_idx = idx
+        else:  # 順不同の券種は馬番の昇順で表記する
+            horse_idx = np.take_along_axis(idx, np.argsort(umaban[idx], axis=1), axis=1)
+        nums = umaban[horse_idx]
+        combo = ["-".join(map(str, row)) for row in nums]
+        df = pd.DataFrame({
+            "券種": b,
+            "組番": combo,
+            "馬名": [" / ".join(row) for row in names[horse_idx]],
+            "確率(%)": v * 100,
+        })
+        df = df[df["確率(%)"] > 0]
+        df["理論オッズ"] = (100 / df["確率(%)"]).round(1)
+        df["オッズ"] = [(odds or {}).get((b, c)) for c in df["組番"]]
+        df["オッズ"] = pd.to_numeric(df["オッズ"], errors="coerce")
+        df["期待値"] = (df["確率(%)"] / 100 * df["オッズ"]).round(2)
+        sort_col = "期待値" if df["期待値"].notna().any() else "確率(%)"
+        frames.append(df.sort_values(sort_col, ascending=False).head(top))
+    return pd.concat(frames, ignore_index=True)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from pathlib import Path
+
+    from model.pred_codec import find_prediction_files, load_prediction
+
+    pred_dir = Path(sys.argv[1] if len(sys.argv) > 1 else "data/predictions")
+    races = [
+        [p.get("勝率(%)") or 0 for p in race.get("predictions") or []]
+        for path in find_prediction_files(pred_dir).values()
+        for race in load_prediction(path).get("races") or []
+    ]
+    t0 = time.perf_counter()
+    result = combination_probs(races)
+    elapsed = time.perf_counter() - t0
+    n_combos = sum(v.shape[0] * v.shape[1] for v, _ in result.values())
+    print(f"{len(races)} races / {n_combos:,} combinations in {elapsed * 1000:.1f} ms")
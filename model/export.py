@@ -0,0 +1,227 @@
+"""予測アーカイブのフラットファイル書き出し（CSV / Parquet。1ファイルずつ流すのでメモリは一定）。
+
+data/predictions と data/ai_comments を1ファイルずつ読み、アプリと同じ展開
+（archive.day_race_rows / day_horse_rows・race_signals.scan_archive）で表にして、
+テーブルごとのファイルに1日分ずつ追記する。保持するのは常に1日分だけなので、
+ピークメモリはアーカイブの大きさによらない。
+    races        レース（archive.RACE_COLUMNS）
+    horses       出走馬（archive.HORSE_COLUMNS。着順・確定単勝を含む）
+    results      結果（着順表そのまま）
+    signals      シグナルのヒット（race_signals.HIT_COLUMNS + レース属性）
+    ai_comments  AIコメント（date, race_id, 馬名, コメント）
+列と型は SCHEMAS で固定（データに無い列は空、余分な列は捨てる）。日ごとに列がぶれないので
+CSV は追記でき、Parquet は1日 = 1 row group で書ける（Parquet は pyarrow が必要）。
+
+モード:
+    --from / --to    日付（ファイル名 YYYY-MM-DD）の範囲
+    --incremental    前回の書き出し（出力先の STATE_NAME）から追加・更新されたファイルだけを
+                     新しいパート（<テーブル>/part-<日時>.<拡張子>）に書く。後のパートにある日付は
+                     前のパートの同じ日付より新しい（結果の追記など）。
+    それ以外          全件を <テーブル>/full.<拡張子> に書き直す（増分の状態もリセット）
+
+使い方:
+    python -m model.export data/export                          # 全件 CSV
+    python -m model.export data/export --format parquet --from 2026-05-01 --to 2026-05-31
+    python -m model.export data/export --incremental
+"""
+from __future__ import annotations
+
+import argparse
+import datetime
+import json
+import os
+import resource
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+from model.archive import (
+    HORSE_COLUMNS, RACE_COLUMNS, day_horse_rows, day_race_rows, horse_frame, race_frame, race_summary,
+)
+from model.pred_codec import find_prediction_files, load_prediction
+from model.race_signals import HIT_COLUMNS, scan_archive
+
+STATE_NAME = "export_state.json"
+_STATE_VERSION = 1
+
+
+def _schema(columns: list[str], default: str, **types: str) -> dict[str, str]:
+    return {c: types.get(c, default) for c in columns}
+
+
+# テーブル → {列: pandas の型}（文字列は "string"、欠損ありの整数・真偽は Int64 / boolean）
+SCHEMAS: dict[str, dict[str, str]] = {
+    "races": _schema(RACE_COLUMNS, "string", 距離="Int64", 頭数="Int64", 勝負度="Int64", 結果あり="boolean"),
+    "horses": _schema(
+        HORSE_COLUMNS, "float64", date="string", race_id="string", 馬名="string", horse_id="string",
+        予測順位="Int64", 馬番="Int64", 人気="Int64", career="Int64", 着順="Int64",
+    ),
+    "results": _schema(
+        ["date", "race_id", "着順", "馬番", "馬名", "タイム", "単勝", "人気"], "string",
+        着順="Int64", 馬番="Int64", 単勝="float64", 人気="Int64",
+    ),
+    "signals": _schema(
+        HIT_COLUMNS + ["race_name", "grade", "venue", "distance"], "string",
+        的中="boolean", 払戻="float64",
+    ),
+    "ai_comments": _schema(["date", "race_id", "馬名", "コメント"], "string"),
+}
+
+
+def conform(df: pd.DataFrame, table: str) -> pd.DataFrame:
+    """df を SCHEMAS[table] の列・型にそろえる。"""
+    schema = SCHEMAS[table]
+    out = df.reindex(columns=list(schema))
+    for col, dtype in schema.items():
+        if dtype == "Int64":
+            out[col] = pd.to_numeric(out[col], errors="coerce").round().astype("Int64")
+        elif dtype == "float64":
+            out[col] = pd.to_numeric(out[col], errors="coerce").astype("float64")
+        elif dtype == "boolean":
+            out[col] = out[col].astype("boolean")
+        else:
+            out[col] = out[col].astype("string")
+    return out
+
+
+# ─── 1日分の表 ────────────────────────────────────────────
+def prediction_tables(date: str, data: dict) -> dict[str, pd.DataFrame]:
+    """予測ファイル1件分の races / horses / results / signals。"""
+    race_rows, horse_rows = day_race_rows(date, data), day_horse_rows(date, data)
+    races, horses = race_frame([race_rows]), horse_frame([horse_rows])
+    results = pd.DataFrame([
+        {"date": date, "race_id": race.get("race_id", ""), **r}
+        for race in data.get("races") or [] for r in race.get("result") or []
+    ])
+    signals = scan_archive(race_summary(races, horses), horses) if len(races) else pd.DataFrame()
+    return {"races": races, "horses": horses, "results": results, "signals": signals}
+
+
+def comment_table(date: str, data: dict) -> pd.DataFrame:
+    """AIコメントファイル1件分（{race_id: {馬名: コメント}}）。"""
+    return pd.DataFrame([
+        {"date": date, "race_id": race_id, "馬名": name, "コメント": text}
+        for race_id, horses in (data or {}).items() if isinstance(horses, dict)
+        for name, text in horses.items()
+    ])
+
+
+# ─── 書き出し先 ───────────────────────────────────────────
+class _TableWriter:
+    """1テーブル1ファイルへの追記（CSV はヘッダー1回、Parquet は1回の write = 1 row group）。"""
+
+    def __init__(self, path: Path, table: str, fmt: str):
+        self.path, self.table, self.fmt = path, table, fmt
+        self.rows = 0
+        self._tmp = path.with_name(path.name + ".tmp")
+        self._file = None
+        self._writer = None
+
+    def write(self, df: pd.DataFrame) -> None:
+        df = conform(df, self.table)
+        if self.fmt == "csv":
+            if self._file is None:
+                self._file = open(self._tmp, "w", encoding="utf-8-sig", newline="")
+                df.iloc[:0].to_csv(self._file, index=False)
+            df.to_csv(self._file, index=False, header=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            if self._writer is None:
+                schema = pa.Schema.from_pandas(conform(pd.DataFrame(), self.table), preserve_index=False)
+                self._writer = pq.ParquetWriter(self._tmp, schema)
+            if len(df):
+                self._writer.write_table(pa.Table.from_pandas(df, schema=self._writer.schema, preserve_index=False))
+        self.rows += len(df)
+
+    def close(self) -> None:
+        """書き終えたファイルを本来の名前に置く（途中で失敗したら前回のファイルは残る）。"""
+        if self._file is None and self._writer is None:
+            self.write(pd.DataFrame())  # 対象が0件でもヘッダー・スキーマだけのファイルを作る
+        if self._file is not None:
+            self._file.close()
+        if self._writer is not None:
+            self._writer.close()
+        os.replace(self._tmp, self.path)
+
+
+def _sig(path: Path) -> list[int]:
+    st = path.stat()
+    return [st.st_mtime_ns, st.st_size]
+
+
+def read_state(out_dir: Path) -> dict:
+    try:
+        with open(Path(out_dir) / STATE_NAME, encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {"version": _STATE_VERSION, "files": {}}
+    return state if state.get("version") == _STATE_VERSION else {"version": _STATE_VERSION, "files": {}}
+
+
+def export(data_dir: Path, out_dir: Path, fmt: str = "csv", start: str | None = None, end: str | None = None,
+           incremental: bool = False) -> dict:
+    """アーカイブを書き出して {テーブル: 行数, "files": 読んだファイル数, "path": 書いたパート名} を返す。
+
+    増分で変更が無ければ何も書かない（"path" は None）。
+    """
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("Parquet の書き出しには pyarrow が必要です（pip install pyarrow）")
+    data_dir, out_dir = Path(data_dir), Path(out_dir)
+    sources = [("pred", d, p) for d, p in sorted(find_prediction_files(data_dir / "predictions").items())]
+    sources += [("comment", p.stem, p) for p in sorted((data_dir / "ai_comments").glob("*.json"))]
+    sources = [s for s in sources if (start is None or s[1] >= start) and (end is None or s[1] <= end)]
+
+    state = read_state(out_dir) if incremental else {"version": _STATE_VERSION, "files": {}}
+    done = state["files"]
+    todo = [s for s in sources if done.get(s[2].relative_to(data_dir).as_posix()) != _sig(s[2])]
+
+    stamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    part = f"part-{stamp}" if incremental else "full"
+    if incremental and not todo:
+        return {**{t: 0 for t in SCHEMAS}, "files": 0, "path": None}
+    writers = {}
+    for table in SCHEMAS:
+        (out_dir / table).mkdir(parents=True, exist_ok=True)
+        writers[table] = _TableWriter(out_dir / table / f"{part}.{fmt}", table, fmt)
+    for kind, date, path in todo:
+        if kind == "pred":
+            for table, df in prediction_tables(date, load_prediction(path)).items():
+                writers[table].write(df)
+        else:
+            with open(path, encoding="utf-8") as f:
+                writers["ai_comments"].write(comment_table(date, json.load(f)))
+        done[path.relative_to(data_dir).as_posix()] = _sig(path)
+    for w in writers.values():
+        w.close()
+    if not incremental:  # 全件を書き直したので、以前の増分パートは不要
+        for table in SCHEMAS:
+            for old in (out_dir / table).glob(f"part-*.{fmt}"):
+                old.unlink()
+    state["last_export"] = stamp
+    with open(out_dir / STATE_NAME, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    return {**{t: w.rows for t, w in writers.items()}, "files": len(todo), "path": part}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("out_dir", type=Path)
+    parser.add_argument("--data", type=Path, default=Path("data"), help="data ディレクトリ")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--from", dest="start", help="開始日 YYYY-MM-DD（含む）")
+    parser.add_argument("--to", dest="end", help="終了日 YYYY-MM-DD（含む）")
+    parser.add_argument("--incremental", action="store_true", help="前回から追加・更新されたファイルだけ書く")
+    opts = parser.parse_args()
+    summary = export(opts.data, opts.out_dir, opts.format, opts.start, opts.end, opts.incremental)
+    files, part = summary.pop("files"), summary.pop("path")
+    print(f"{files} ファイル → {part}.{opts.format}" if part else "前回の書き出しから変更なし")
+    for table, rows in summary.items() if part else ():
+        print(f"  {table:<12}{rows:>8} 行")
+    print(f"最大 RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+    sys.exit(0)
@@ -0,0 +1,54 @@
+"""データファイルの変更検知（pure stdlib・public/ アプリと共有）。
+
+TTL で定期的に全件を読み直す代わりに、監視対象を stat でポーリングして
+前回から (mtime_ns, size) が変わった／増えた／消えたファイルだけを返す。
+呼び出し側はそのファイルに対応するキャッシュだけを破棄すればよい。
+"""
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+
+Signature = tuple[int, int]  # (st_mtime_ns, st_size)
+
+
+class FileWatcher:
+    """(ディレクトリ, globパターン) の組を監視し、poll() ごとに変更ファイルを返す。
+
+    初回 poll() は現状を記録するだけで空集合を返す（キャッシュが空なので破棄不要）。
+    複数セッションから呼ばれても 1 回の変更は 1 回だけ報告されるようロックで保護する。
+    """
+
+    def __init__(self, targets: list[tuple[Path, str]]):
+        self._targets = [(Path(d), pattern) for d, pattern in targets]
+        self._lock = threading.Lock()
+        self._sigs: dict[Path, Signature] | None = None
+
+    def _scan(self) -> dict[Path, Signature]:
+        sigs: dict[Path, Signature] = {}
+        for directory, pattern in self._targets:
+            if not directory.exists():
+                continue
+            for path in directory.glob(pattern):
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue  # 走査中に消えたファイル
+                sigs[path] = (st.st_mtime_ns, st.st_size)
+        return sigs
+
+    def poll(self) -> set[Path]:
+        """前回の poll() 以降に追加・更新・削除されたファイルの集合を返す。"""
+        with self._lock:
+            current = self._scan()
+            previous, self._sigs = self._sigs, current
+            if previous is None:
+                return set()
+            changed = {p for p, sig in current.items() if previous.get(p) != sig}
+            changed |= previous.keys() - current.keys()
+            return changed
+
+    def signature(self, path: Path) -> Signature | None:
+        """直近の poll() 時点でのファイルシグネチャ（未監視・未検出なら None）。"""
+        with self._lock:
+            return (self._sigs or {}).get(Path(path))
@@ -0,0 +1,127 @@
+"""馬名 → 出走履歴の転置インデックス（予測アーカイブ全日付を横断）。
+
+予測ファイル1件ごとに「その日に出た馬の出走行」を登録し、ファイルのシグネチャが
+変わった日・消えた日だけを差し替える（sync）。履歴の参照は辞書1回で、
+日付数が増えてもその馬の出走数にしか比例しない。馬名の前方一致検索は
+ソート済みの馬名リストに対する二分探索で行う。
+
+複数セッションから共有される前提なので、更新はロックで直列化し、読み手はロックを取らずに
+差し替え済みの表だけを見る。
+"""
+from __future__ import annotations
+
+import bisect
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Callable
+
+ENTRY_KEYS = ["date", "race_id", "race_name", "grade", "venue", "distance",
+              "予測順位", "勝率(%)", "単勝", "人気", "着順"]
+
+
+def normalize(name: str) -> str:
+    """検索キー用の正規化（全角英数・半角カナの揺れを吸収）。"""
+    return unicodedata.normalize("NFKC", name or "").strip()
+
+
+def day_entries(race_rows: list[dict], horse_rows: list[dict]) -> dict[str, list[dict]]:
+    """1日分の (レース行, 馬行) から {馬名: [出走行]} を作る。"""
+    races = {r["race_id"]: r for r in race_rows}
+    out: dict[str, list[dict]] = {}
+    for h in horse_rows:
+        name = normalize(h.get("馬名"))
+        if not name:
+            continue
+        race = races.get(h["race_id"], {})
+        entry = {**{k: race.get(k) for k in ("race_name", "grade", "venue", "distance")}, **h}
+        out.setdefault(name, []).append({k: entry.get(k) for k in ENTRY_KEYS})
+    return out
+
+
+class HorseIndex:
+    """予測ファイル単位で差分更新する 馬名 → 出走履歴 のインデックス。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sigs: dict[str, tuple | None] = {}              # ファイル → 登録時のシグネチャ
+        self._day_names: dict[str, list[str]] = {}            # ファイル → その日の馬名
+        # (馬名 → {ファイル: 出走行}, ソート済み馬名（前方一致用）)。sync は写しを更新してから
+        # 1回の代入で丸ごと差し替える（ロック外の読み手は最初に1回だけ参照する）
+        self._table: tuple[dict[str, dict[str, list[dict]]], list[str]] = ({}, [])
+
+    def sync(self, archive_sig: tuple, load_rows: Callable[[str], tuple[list[dict], list[dict]]]) -> int:
+        """archive_sig（(パス, シグネチャ) の並び）に合わせて増減分だけ登録し直す。変更ファイル数を返す。"""
+        wanted = dict(archive_sig)
+        with self._lock:
+            stale = [p for p, sig in self._sigs.items() if wanted.get(p, ...) != sig]
+            fresh = [p for p, sig in wanted.items() if self._sigs.get(p, ...) != sig]
+            if not stale and not fresh:
+                return 0
+            postings, names = dict(self._table[0]), list(self._table[1])
+            for path_str in stale:
+                self._remove(postings, names, path_str)
+            for path_str in fresh:
+                self._add(postings, names, path_str, wanted[path_str], day_entries(*load_rows(path_str)))
+            self._table = (postings, names)
+            return len(set(stale) | set(fresh))
+
+    def _add(self, postings: dict, names: list[str], path_str: str, sig: tuple | None,
+             entries: dict[str, list[dict]]) -> None:
+        for name, rows in entries.items():
+            if name not in postings:
+                bisect.insort(names, name)
+            postings[name] = {**postings.get(name, {}), path_str: rows}  # 内側の dict も写しにする
+        self._sigs[path_str] = sig
+        self._day_names[path_str] = list(entries)
+
+    def _remove(self, postings: dict, names: list[str], path_str: str) -> None:
+        for name in self._day_names.pop(path_str, []):
+            days = postings.get(name)
+            if days is None:
+                continue
+            days = {p: rows for p, rows in days.items() if p != path_str}
+            if days:
+                postings[name] = days
+            else:
+                del postings[name]
+                i = bisect.bisect_left(names, name)
+                if i < len(names) and names[i] == name:
+                    del names[i]
+        self._sigs.pop(path_str, None)
+
+    def __len__(self) -> int:
+        return len(self._table[1])
+
+    def history(self, name: str) -> list[dict]:
+        """その馬の全出走（新しい日付順）。前日予測と当日予測の両方にある同じレースは新しい方だけ残す。"""
+        days = self._table[0].get(normalize(name), {})
+        rows, seen = [], set()
+        for path_str in sorted(days, key=lambda p: Path(p).stem, reverse=True):
+            for r in days[path_str]:
+                if r["race_id"] not in seen:
+                    seen.add(r["race_id"])
+                    rows.append(r)
+        return rows
+
+    def search(self, prefix: str, limit: int = 30) -> list[str]:
+        """馬名の前方一致（辞書順・最大 limit 件）。"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        names = self._table[1]
+        start = bisect.bisect_left(names, prefix)
+        out = []
+        for name in names[start:start + limit]:
+            if not name.startswith(prefix):
+                break
+            out.append(name)
+        return out
+
+    def counts(self, names: list[str]) -> dict[str, int]:
+        """馬名ごとの出走レース数（候補一覧の表示用。重複レースは1回）。"""
+        postings = self._table[0]
+        return {
+            n: len({r["race_id"] for rows in postings.get(n, {}).values() for r in rows})
+            for n in names
+        }
@@ -0,0 +1,247 @@
+"""ライブオッズ（public/ アプリと共有）。
+
+オッズ配信の代わりに、ディレクトリ（data/live_odds/）に置かれたスナップショット JSON を取り込む:
+    {"race_id": "202604030207", "fetched_at": "2026-08-23T14:52:10",
+     "odds": {"1": 4.6, "2": 2.9, ...}}            # 馬番 → 単勝
+    （"odds": [{"馬番": 1, "単勝": 4.6, "人気": 2}, ...] の形も可。人気が無ければオッズ順で付ける）
+同じレースのファイルが複数あれば fetched_at（同じならファイル名）が最も新しいものを使う。
+
+LiveOddsFeed は専用スレッドで asyncio のループを回す:
+    _watch      ディレクトリを interval 秒ごとに走査し、シグネチャの変わったファイルだけ読む
+    _recompute  変わったレースの race_id をキューから受け取り、そのレースだけ recompute する
+recompute は期待値・ケリー比率（staking.kelly_fraction。上限も同じ）・オッズ急落（detect_odds_crash）と、
+予測ファイル時点のオッズと比べた推奨（期待値 ≥ EV_PICK_THRESHOLD）の増減を出す。結果はレースごとに version 付きで保持し、
+アプリ側は自動更新のフラグメントから results() を読むだけ（ページ全体はリランしない）。
+"""
+from __future__ import annotations
+
+import asyncio
+import datetime
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from model.odds_signals import detect_odds_crash
+from model.staking import kelly_fraction
+
+EV_PICK_THRESHOLD = 1.0   # ライブ期待値がこれ以上の馬を「推奨」とみなす
+KELLY_MULTIPLIER = 0.25   # 予測ファイルの kelly_f と同じ 1/4 ケリー
+
+
+def _popularity(odds: dict[int, float]) -> dict[int, int]:
+    """オッズの低い順の人気（同オッズは同順位）。"""
+    ordered = sorted(odds.values())
+    return {num: ordered.index(o) + 1 for num, o in odds.items()}
+
+
+def parse_snapshot(raw: dict) -> dict | None:
+    """スナップショット JSON を {race_id, fetched_at, odds: {馬番: 単勝}, 人気: {馬番: 人気}} にする。"""
+    race_id = str(raw.get("race_id") or "")
+    items = raw.get("odds")
+    if isinstance(items, dict):
+        items = [{"馬番": k, "単勝": v} for k, v in items.items()]
+    if not race_id or not isinstance(items, list):
+        return None
+    odds, pop = {}, {}
+    for item in items:
+        try:
+            num, o = int(item["馬番"]), float(item["単勝"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if o > 0:
+            odds[num] = o
+            if item.get("人気") is not None:
+                pop[num] = int(item["人気"])
+    if not odds:
+        return None
+    return {"race_id": race_id, "fetched_at": str(raw.get("fetched_at") or ""), "odds": odds,
+            "人気": pop or _popularity(odds)}
+
+
+def recompute(race: dict, snap: dict, previous: dict | None = None) -> dict:
+    """1レース分のライブ指標。previous は同じレースの前回結果（前回比の計算用）。"""
+    if previous is not None and previous["fetched_at"] == snap["fetched_at"]:
+        prev_ev = previous["_prev_ev"]  # 同じスナップショットの再計算（予測の再登録）では前回比を保つ
+    else:
+        prev_ev = {p["馬番"]: p.get("期待値") for p in (previous or {}).get("predictions", [])}
+    rows = []
+    for p in race.get("predictions") or []:
+        try:
+            num = int(p.get("馬番"))
+        except (TypeError, ValueError):
+            continue
+        row = {**p, "単勝_base": p.get("単勝"), "期待値_base": p.get("期待値")}
+        # 急落判定の基準: 前日夜のオッズ（前日予測ファイルでは単勝そのものが前日夜）
+        row["単勝_evening"] = p.get("単勝_evening", p.get("単勝"))
+        odds = snap["odds"].get(num)
+        prob = p.get("calibrated_prob(%)") or p.get("勝率(%)")
+        if odds is not None:
+            row["単勝"] = odds
+            row["人気"] = snap["人気"].get(num, p.get("人気"))
+            if prob is not None:
+                row["期待値"] = round(float(prob) / 100 * odds, 2)
+                row["kelly_f"] = round(float(kelly_fraction(np.float64(prob) / 100, np.float64(odds), KELLY_MULTIPLIER)), 4)
+        row["ΔEV"] = (
+            round(row["期待値"] - row["期待値_base"], 2)
+            if row.get("期待値") is not None and row["期待値_base"] is not None else None
+        )
+        row["ΔEV_前回"] = (
+            round(row["期待値"] - prev_ev[num], 2)
+            if num in prev_ev and row.get("期待値") is not None and prev_ev[num] is not None else None
+        )
+        rows.append(row)
+    rows.sort(key=lambda r: r.get("予測順位") or 99)
+    # 予測ファイル時点のオッズに同じ基準を当てた集合と比べる（オッズの動きだけが差分に出る）
+    base_picks = {r["馬番"] for r in rows if (r["期待値_base"] or 0) >= EV_PICK_THRESHOLD}
+    live_picks = {r["馬番"] for r in rows if (r.get("期待値") or 0) >= EV_PICK_THRESHOLD}
+    names = {r["馬番"]: r.get("馬名") for r in rows}
+    return {
+        "race_id": snap["race_id"],
+        "race_name": race.get("race_name", snap["race_id"]),
+        "fetched_at": snap["fetched_at"],
+        "updated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "predictions": rows,
+        "crash": detect_odds_crash(rows),
+        "picks": sorted(live_picks),
+        "added": [(n, names.get(n)) for n in sorted(live_picks - base_picks)],
+        "dropped": [(n, names.get(n)) for n in sorted(base_picks - live_picks)],
+        "_prev_ev": prev_ev,
+    }
+
+
+class LiveOddsFeed:
+    """スナップショットディレクトリを監視し、変わったレースだけ再計算する。"""
+
+    def __init__(self, directory: Path, interval: float = 2.0):
+        self.directory = Path(directory)
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._races: dict[str, dict] = {}             # race_id → 予測ファイルのレース
+        self._files: dict[str, tuple] = {}            # ファイル → シグネチャ
+        self._file_snaps: dict[str, dict] = {}        # ファイル → スナップショット
+        self._results: dict[str, dict] = {}           # race_id → recompute の結果
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._queue: asyncio.Queue | None = None
+        self._thread: threading.Thread | None = None
+        self.version = 0
+        self.stats = {"scans": 0, "files_read": 0, "recomputed": 0, "bad_files": 0}
+
+    # ── アプリ側（Streamlit のスレッド）から呼ぶ ──
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=lambda: asyncio.run(self._main()), name="live-odds", daemon=True)
+            self._thread.start()
+
+    def register(self, races: list[dict]) -> None:
+        """表示中の日のレースを登録する。スナップショットが既にあるレースは再計算する。"""
+        fresh = []
+        with self._lock:
+            for race in races:
+                race_id = str(race.get("race_id") or "")
+                if race_id and self._races.get(race_id) != race:
+                    self._races[race_id] = race
+                    fresh.append(race_id)
+        for race_id in fresh:
+            self._enqueue(race_id)
+
+    def results(self, race_ids) -> list[dict]:
+        """race_ids のうちライブオッズがあるレースの最新結果（race_ids の順）。"""
+        with self._lock:
+            return [self._results[r] for r in race_ids if r in self._results]
+
+    # ── ループ側 ──
+    def _enqueue(self, race_id: str) -> None:
+        loop, queue = self._loop, self._queue
+        if loop is not None and queue is not None:
+            loop.call_soon_threadsafe(queue.put_nowait, race_id)
+
+    async def _main(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        with self._lock:
+            pending = list(self._races)
+        for race_id in pending:  # start 前に register されたレース
+            self._queue.put_nowait(race_id)
+        await asyncio.gather(self._watch(), self._recompute())
+
+    async def _watch(self) -> None:
+        while True:
+            for race_id in await asyncio.to_thread(self._scan):
+                self._queue.put_nowait(race_id)
+            await asyncio.sleep(self.interval)
+
+    async def _recompute(self) -> None:
+        while True:
+            changed = {await self._queue.get()}
+            while not self._queue.empty():  # 溜まっている分はまとめて1回ずつ
+                changed.add(self._queue.get_nowait())
+            for race_id in changed:
+                self._recompute_race(race_id)
+
+    def _scan(self) -> set[str]:
+        """変わった・消えたファイルを読み直し、影響を受けた race_id を返す（ループとは別スレッドで動く）。"""
+        seen: dict[str, tuple] = {}
+        try:
+            entries = [e for e in os.scandir(self.directory) if e.name.endswith(".json")]
+        except OSError:
+            entries = []
+        for e in entries:
+            try:
+                st = e.stat()
+            except OSError:
+                continue
+            seen[e.path] = (st.st_mtime_ns, st.st_size)
+        changed: dict[str, dict | None] = {p: None for p in set(self._files) - set(seen)}
+        for path, sig in seen.items():
+            if self._files.get(path) == sig:
+                continue
+            try:
+                with open(path, encoding="utf-8") as f:
+                    snap = parse_snapshot(json.load(f))
+            except (OSError, ValueError):
+                snap = None  # 書き込み途中なら、書き終わってシグネチャが変わったときに読み直す
+            if snap is not None:
+                snap["_file"] = os.path.basename(path)
+            changed[path] = snap
+        affected = set()
+        with self._lock:
+            self.stats["scans"] += 1
+            for path, snap in changed.items():
+                if path in seen:
+                    self._files[path] = seen[path]
+                    self.stats["files_read"] += 1
+                    self.stats["bad_files"] += snap is None
+                else:
+                    self._files.pop(path, None)
+                old = self._file_snaps.pop(path, None)
+                if old is not None:
+                    affected.add(old["race_id"])
+                if snap is not None:
+                    self._file_snaps[path] = snap
+                    affected.add(snap["race_id"])
+        return affected
+
+    def _latest(self, race_id: str) -> dict | None:
+        snaps = [s for s in self._file_snaps.values() if s["race_id"] == race_id]
+        return max(snaps, key=lambda s: (s["fetched_at"], s["_file"]), default=None)
+
+    def _recompute_race(self, race_id: str) -> None:
+        with self._lock:
+            snap = self._latest(race_id)
+            race = self._races.get(race_id)
+            previous = self._results.get(race_id)
+        if race is None:
+            return
+        if snap is None:
+            with self._lock:
+                self._results.pop(race_id, None)
+            return
+        result = recompute(race, snap, previous)
+        with self._lock:
+            self.version += 1
+            result["version"] = self.version
+            self._results[race_id] = result
+            self.stats["recomputed"] += 1
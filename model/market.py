@@ -0,0 +1,73 @@
+"""単勝オッズから読む市場の確率（オーバーラウンド補正）とモデルとのエッジ。
+
+期待値（勝率 × 単勝）は控除率を含んだオッズとの比較なので、1.0 を超えるには
+控除ぶん（JRA 単勝は約20%）市場より強く評価している必要がある。ここではレースの全出走馬の
+単勝から市場の確率を作り、控除・過剰売れを除いた「市場との評価差」を別に出す:
+    implied       = 1 / 単勝
+    オーバーラウンド = レース内の implied の合計（控除率 ≈ 1 − 1/オーバーラウンド）
+    市場確率       = implied / オーバーラウンド（レース内の合計が 100%）
+    エッジ         = モデル確率 − 市場確率（%ポイント）
+    エッジ比       = モデル確率 / 市場確率（1 超 = 市場より高評価）
+    kelly_f       = staking.kelly_fraction（実際のオッズで払い戻されるので単勝そのもので計算）
+モデル確率は calibrated_prob(%)（無ければ勝率(%)）をレース内の合計が 100% になるよう正規化したもの。
+calibrated_prob(%) は馬ごとの補正でレース内の合計が 20〜240% とばらつくため、そのままでは
+正規化済みの市場確率と比べられない（レース全体が正エッジ／負エッジになる）。
+kelly_f だけは補正後の確率そのもの（正規化前）で計算する。単勝の無い馬は市場の計算から外す
+（カバー率 = 単勝のある頭数 / 頭数。1 未満のレースはオーバーラウンドが小さく出る）。
+
+日別の馬行（archive.day_horse_rows）を全レース一括の groupby で計算する（market_frame）。
+アプリは予測ファイル1件ごとの結果をキャッシュし、各タブは列を引くだけにする。
+"""
+from __future__ import annotations
+
+import pandas as pd
+
+from model.archive import RACE_KEY
+from model.staking import kelly_fraction
+
+HORSE_COLUMNS = ["馬番", "モデル確率(%)", "市場確率(%)", "エッジ(%)", "エッジ比", "エッジ順位", "kelly_f"]
+RACE_COLUMNS = ["オーバーラウンド", "控除率(%)", "カバー率", "正エッジ頭数",
+                "最大エッジ(%)", "最大エッジ馬番", "最大エッジ馬名"]
+
+
+def market_frame(horses: pd.DataFrame) -> pd.DataFrame:
+    """馬行（RACE_KEY・馬番・馬名・勝率(%)・calibrated_prob(%)・単勝）に市場列を付けて返す。"""
+    raw_pct = horses["calibrated_prob(%)"].fillna(horses["勝率(%)"]).astype(float)
+    odds = horses["単勝"].astype(float)
+    implied = (1 / odds).where(odds > 1)
+    groups = [horses[k] for k in RACE_KEY]
+    model_pct = raw_pct / raw_pct.groupby(groups).transform("sum") * 100
+    overround = implied.groupby(groups).transform("sum")
+    market_pct = implied / overround * 100
+    edge = model_pct - market_pct
+    out = horses[RACE_KEY + ["馬番", "馬名"]].assign(**{
+        "モデル確率(%)": model_pct,
+        "市場確率(%)": market_pct,
+        "エッジ(%)": edge,
+        "エッジ比": model_pct / market_pct,
+        "kelly_f": kelly_fraction(raw_pct.to_numpy() / 100, odds.to_numpy()),
+        "オーバーラウンド": overround.where(overround > 0),
+    })
+    out["エッジ順位"] = edge.groupby(groups).rank(ascending=False, method="min")
+    return out
+
+
+def race_market(market: pd.DataFrame) -> pd.DataFrame:
+    """market_frame をレース単位にまとめる（RACE_KEY + RACE_COLUMNS）。"""
+    if market.empty:
+        return pd.DataFrame(columns=RACE_KEY + RACE_COLUMNS)
+    g = market.groupby(RACE_KEY, sort=False)
+    races = g.agg(
+        オーバーラウンド=("オーバーラウンド", "first"),
+        カバー率=("市場確率(%)", lambda s: s.notna().mean()),
+        正エッジ頭数=("エッジ(%)", lambda s: int((s > 0).sum())),
+    ).reset_index()
+    races["控除率(%)"] = (1 - 1 / races["オーバーラウンド"]) * 100
+    best = (
+        market.dropna(subset=["エッジ(%)"])
+        .sort_values("エッジ(%)", ascending=False)
+        .drop_duplicates(RACE_KEY)[RACE_KEY + ["エッジ(%)", "馬番", "馬名"]]
+        .rename(columns={"エッジ(%)": "最大エッジ(%)", "馬番": "最大エッジ馬番", "馬名": "最大エッジ馬名"})
+    )
+    races = races.merge(best, on=RACE_KEY, how="left")
+    return races[RACE_KEY + RACE_COLUMNS]
@@ -0,0 +1,287 @@
+"""data/ をまとめた読み取り専用のコンパイル済みストア（mmap 共有・pure stdlib・public/ アプリと共有）。
+
+複数のアプリプロセス（レプリカ）が同じファイルを mmap すると、OS のページキャッシュ上の
+1 コピーを全員で共有できる。各プロセスは必要なエントリだけをオフセット指定で読む。
+
+ファイル形式（.mhs）:
+    ヘッダー  MAGIC(4B) + version(4B) + 索引オフセット(8B) + 索引長(8B)
+    本体      エントリの marshal（予測はレース単位・CSV/テキストは生バイト）を連結
+    索引      marshal(dict):
+        files:     {data/ からの相対パス: {sig: (mtime_ns, size), kind, off, len, races}}
+                   races は予測ファイルだけ: {race_id: (off, len)}（ファイル内の順）
+        dates:     {日付: 予測ファイルの相対パス}
+race(date, race_id, sig) は日付 → ファイル → race_id の順に引き、そのレースだけを読む。
+索引の sig は元ファイルの (mtime_ns, size)。読む側は現在のシグネチャと一致するときだけ
+ストアを使い、一致しなければ元ファイルを読む（古いストアが残っていても結果は変わらない）。
+
+再構築（build_if_stale）はストア横のロックファイルを排他ロック（fcntl.flock）してから、
+元ファイルと食い違うときだけ行う。複数のレプリカが同じ変更を見ても作り直すのは最初の1回だけで、
+後から来たプロセスはロックの解放を待ってから作り直し不要と判断し、できたストアを refresh() で拾う。
+書き込みは一時ファイルに書いてから os.replace で差し替える。読む側は refresh() で
+inode の変化を検知して開き直すので、プロセスを再起動せずに新しいデータに切り替わる。
+古い mmap は参照が消えた時点で解放される（読み込み途中のスレッドを壊さない）。
+
+使い方:
+    python -m model.mmap_store build data              # data/.store/myhorses.mhs を作る（古いときだけ）
+    python -m model.mmap_store info data/.store/myhorses.mhs
+"""
+from __future__ import annotations
+
+import datetime
+import fcntl
+import json
+import marshal
+import mmap
+import os
+import struct
+import sys
+import threading
+from pathlib import Path
+
+from model.pred_codec import find_prediction_files, load_prediction, share_strings
+
+MAGIC = b"MHS1"
+VERSION = 2
+DEFAULT_NAME = Path(".store") / "myhorses.mhs"
+_HEADER = struct.Struct(">4sIQQ")
+_MARSHAL_VERSION = 4
+
+
+def _dumps(obj) -> bytes:
+    """文字列を共有化してから marshal（json.loads の約3倍速く読める）。"""
+    return marshal.dumps(share_strings(obj, {}), _MARSHAL_VERSION)
+
+
+def _sig(path: Path) -> tuple[int, int]:
+    st = path.stat()
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _sources(data_dir: Path) -> list[tuple[str, Path, str]]:
+    """(相対パス, 実パス, 種類) の一覧。予測ファイルはアプリと同じ find_prediction_files で選ぶ。"""
+    out = [
+        (p.relative_to(data_dir).as_posix(), p, "day")
+        for p in find_prediction_files(data_dir / "predictions").values()
+    ]
+    out += [
+        (p.relative_to(data_dir).as_posix(), p, "json")
+        for p in sorted((data_dir / "ai_comments").glob("*.json"))
+    ]
+    out += [
+        (p.relative_to(data_dir).as_posix(), p, "raw")
+        for p in sorted((data_dir / "strategy").glob("*.csv")) + sorted(data_dir.glob("*.txt"))
+    ]
+    return out
+
+
+def build(data_dir: Path, out_path: Path | None = None) -> Path:
+    """data_dir をコンパイルして out_path に原子的に書き出す。"""
+    data_dir = Path(data_dir)
+    out_path = Path(out_path or data_dir / DEFAULT_NAME)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_path.with_name(out_path.name + f".tmp{os.getpid()}")
+    index: dict = {"version": VERSION, "built_at": datetime.datetime.now().isoformat(timespec="seconds"),
+                   "files": {}, "dates": {}}
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, 0, 0))
+
+        def _put(blob: bytes) -> tuple[int, int]:
+            off = f.tell()
+            f.write(blob)
+            return off, len(blob)
+
+        for rel, path, kind in _sources(data_dir):
+            sig = _sig(path)  # 読む前に取る（読んでいる間の更新は次回の build で拾う）
+            entry = {"sig": sig, "kind": kind}
+            if kind == "day":
+                data = load_prediction(path)
+                races = data.get("races") or []
+                meta = {k: v for k, v in data.items() if k != "races"}
+                entry["off"], entry["len"] = _put(_dumps(meta))
+                entry["races"] = {}
+                for race in races:
+                    key = str(race.get("race_id", ""))
+                    if key in entry["races"]:  # 同じ race_id が2回あっても get() では全件返す
+                        key = f"{key}#{len(entry['races'])}"
+                    entry["races"][key] = _put(_dumps(race))
+                index["dates"][path.stem] = rel
+            elif kind == "json":
+                with open(path, encoding="utf-8") as src:
+                    entry["off"], entry["len"] = _put(_dumps(json.load(src)))
+            else:
+                entry["off"], entry["len"] = _put(path.read_bytes())
+            index["files"][rel] = entry
+
+        index_blob = marshal.dumps(index, _MARSHAL_VERSION)
+        index_off, _ = _put(index_blob)
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, VERSION, index_off, len(index_blob)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, out_path)
+    return out_path
+
+
+def _read_index(path: Path) -> dict | None:
+    """ストアの索引だけを読む（mmap しない）。無い・壊れているときは None。"""
+    try:
+        with open(path, "rb") as f:
+            magic, version, index_off, index_len = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                return None
+            f.seek(index_off)
+            return marshal.loads(f.read(index_len))
+    except (OSError, ValueError, EOFError, TypeError, struct.error):
+        return None
+
+
+def is_current(data_dir: Path, out_path: Path | None = None) -> bool:
+    """ストアが data_dir の今のファイル一覧・シグネチャと一致しているか。"""
+    data_dir = Path(data_dir)
+    index = _read_index(Path(out_path or data_dir / DEFAULT_NAME))
+    if index is None:
+        return False
+    try:
+        wanted = {rel: _sig(path) for rel, path, _ in _sources(data_dir)}
+    except OSError:
+        return False
+    return wanted == {rel: tuple(e["sig"]) for rel, e in index["files"].items()}
+
+
+def build_if_stale(data_dir: Path, out_path: Path | None = None) -> bool:
+    """ロックを取ってから、ストアが古いときだけ build する。作り直したら True。
+
+    ロック中は他のプロセスの build が終わるのを待つ。待った後はたいてい is_current が真になるので、
+    同じ変更で複数のレプリカがストアを書き直すことはない。
+    """
+    data_dir = Path(data_dir)
+    out_path = Path(out_path or data_dir / DEFAULT_NAME)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(out_path.with_name(out_path.name + ".lock"), "a") as lock:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        if is_current(data_dir, out_path):
+            return False
+        build(data_dir, out_path)
+        return True
+
+
+class _Mapping:
+    """1 世代分の mmap と索引。"""
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.ident = (st.st_ino, st.st_mtime_ns, st.st_size)
+        magic, version, index_off, index_len = _HEADER.unpack_from(self.mm)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"mhs: 不明な形式 {magic!r} v{version}")
+        self.view = memoryview(self.mm)
+        self.index = marshal.loads(self.view[index_off:index_off + index_len])
+
+    def load(self, off: int, length: int):
+        return marshal.loads(self.view[off:off + length])
+
+    def raw(self, off: int, length: int) -> bytes:
+        return bytes(self.view[off:off + length])
+
+
+class MappedStore:
+    """コンパイル済みストアの読み手。ファイルが無い・壊れている間は常に None を返す（元ファイルを読む）。"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._current: _Mapping | None = None
+        self.remaps = 0
+
+    def refresh(self) -> bool:
+        """ストアが差し替わっていれば開き直す。開き直したら True。"""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            self._current = None
+            return False
+        ident = (st.st_ino, st.st_mtime_ns, st.st_size)
+        current = self._current
+        if current is not None and current.ident == ident:
+            return False
+        with self._lock:
+            if self._current is not None and self._current.ident == ident:
+                return False
+            try:
+                self._current = _Mapping(self.path)
+            except (OSError, ValueError, EOFError, TypeError):
+                self._current = None
+                return False
+            self.remaps += 1
+            return True
+
+    @property
+    def active(self) -> bool:
+        return self._current is not None
+
+    def _entry(self, rel: str, sig) -> tuple[_Mapping, dict] | None:
+        current = self._current
+        if current is None:
+            return None
+        entry = current.index["files"].get(rel)
+        if entry is None or sig is None or tuple(entry["sig"]) != tuple(sig):
+            return None
+        return current, entry
+
+    def get(self, rel: str, sig):
+        """相対パス rel のエントリ（予測・コメントは dict、CSV 等は bytes）。鮮度が合わなければ None。"""
+        found = self._entry(rel, sig)
+        if found is None:
+            return None
+        current, entry = found
+        if entry["kind"] == "raw":
+            return current.raw(entry["off"], entry["len"])
+        data = current.load(entry["off"], entry["len"])
+        if entry["kind"] == "day":
+            data["races"] = [current.load(off, length) for off, length in entry["races"].values()]
+        return data
+
+    def race(self, date: str, race_id: str, sig) -> dict | None:
+        """date の予測ファイルのうち race_id のレースだけを読む。鮮度が合わない・無ければ None。"""
+        current = self._current
+        rel = current.index["dates"].get(date) if current is not None else None
+        found = self._entry(rel, sig) if rel is not None else None
+        if found is None:
+            return None
+        current, entry = found
+        loc = entry["races"].get(race_id)
+        return current.load(*loc) if loc is not None else None
+
+    def info(self) -> dict:
+        current = self._current
+        if current is None:
+            return {}
+        index = current.index
+        return {
+            "built_at": index["built_at"],
+            "files": len(index["files"]),
+            "dates": len(index["dates"]),
+            "races": sum(len(e.get("races", ())) for e in index["files"].values()),
+            "bytes": len(current.mm),
+            "remaps": self.remaps,
+        }
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "build"
+    if cmd == "build":
+        data_root = Path(sys.argv[2] if len(sys.argv) > 2 else "data")
+        out = Path(sys.argv[3]) if len(sys.argv) > 3 else data_root / DEFAULT_NAME
+        built = build_if_stale(data_root, out)
+        store = MappedStore(out)
+        store.refresh()
+        print(f"{'built' if built else 'up to date'} {out}: {store.info()}")
+    elif cmd == "info":
+        store = MappedStore(Path(sys.argv[2]))
+        store.refresh()
+        print(store.info() or "store not found")
+    else:
+        print(__doc__)
+        sys.exit(1)
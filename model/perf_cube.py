@@ -0,0 +1,119 @@
+"""予測アーカイブの成績キューブ（競馬場 × 芝ダ × 距離帯 × グレード × 勝負度 × パターン × 月）。
+
+結果の出たレースについて、Top1（予測順位1位）の単勝を100円ずつ買ったときの
+レース数・的中数・払戻額を、全次元（DIMENSIONS）の組み合わせごとのセルに事前集計する。
+予測ファイル1件ごとに部分キューブ（day_cells）を作り、全体のキューブには
+シグネチャの変わった日・消えた日の部分キューブだけを引いて足し直す（sync）。
+結果が追加された日も「その日のファイルが変わった」として同じ経路で反映される。
+
+ドリルダウン・ピボットはセル表（frame）の groupby だけで済み、セル数はレース数以下なので
+アーカイブ全体を展開し直すより桁違いに速い。
+
+複数セッションから共有される前提なので、更新はロックで直列化する。
+"""
+from __future__ import annotations
+
+import threading
+from typing import Callable
+
+import pandas as pd
+
+from model.calibration import distance_band
+
+DIMENSIONS = ["venue", "芝ダ", "距離帯", "grade", "勝負度", "パターン", "月"]
+MEASURES = ["レース数", "的中数", "払戻額"]
+UNKNOWN = "不明"  # 値が空の次元
+
+
+def day_cells(race_rows: list[dict], horse_rows: list[dict]) -> dict[tuple, list]:
+    """1日分の (レース行, 馬行) から部分キューブ {次元の値: [レース数, 的中数, 払戻額]} を作る。"""
+    top1 = {}
+    for h in horse_rows:
+        if h.get("予測順位") == 1 and h["race_id"] not in top1:
+            top1[h["race_id"]] = h
+    cells: dict[tuple, list] = {}
+    for r in race_rows:
+        pick = top1.get(r["race_id"])
+        if not r.get("結果あり") or pick is None:
+            continue
+        key = (
+            r.get("venue") or UNKNOWN,
+            r.get("芝ダ") or UNKNOWN,
+            distance_band(r.get("距離")) or UNKNOWN,
+            r.get("grade") or UNKNOWN,
+            int(r.get("勝負度") or 0),
+            r.get("パターン") or UNKNOWN,
+            str(r["date"])[:7],
+        )
+        won = pick.get("着順") == 1
+        cell = cells.setdefault(key, [0, 0, 0.0])
+        cell[0] += 1
+        cell[1] += won
+        cell[2] += (pick.get("確定単勝") or 0) * 100 if won else 0.0
+    return cells
+
+
+class PerfCube:
+    """予測ファイル単位で差分更新する成績キューブ。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._days: dict[str, tuple] = {}          # ファイル → (シグネチャ, 部分キューブ)
+        self._cells: dict[tuple, list] = {}        # 全体のキューブ
+        self._frame: pd.DataFrame | None = None    # セル表（sync で変わったら作り直す）
+        self.version = 0
+
+    def sync(self, archive_sig: tuple, load_rows: Callable[[str], tuple[list[dict], list[dict]]]) -> int:
+        """archive_sig（(パス, シグネチャ) の並び）に合わせて増減分だけ足し引きする。変更ファイル数を返す。"""
+        wanted = dict(archive_sig)
+        with self._lock:
+            stale = [p for p, (sig, _) in self._days.items() if wanted.get(p, ...) != sig]
+            fresh = [p for p, sig in wanted.items() if self._days.get(p, (...,))[0] != sig]
+            for path_str in stale:
+                self._merge(self._days.pop(path_str)[1], -1)
+            for path_str in fresh:
+                cells = day_cells(*load_rows(path_str))
+                self._days[path_str] = (wanted[path_str], cells)
+                self._merge(cells, 1)
+            if stale or fresh:
+                self._frame = None
+                self.version += 1
+            return len(set(stale) | set(fresh))
+
+    def _merge(self, cells: dict[tuple, list], sign: int) -> None:
+        for key, (races, hits, payout) in cells.items():
+            total = self._cells.setdefault(key, [0, 0, 0.0])
+            total[0] += sign * races
+            total[1] += sign * hits
+            total[2] += sign * payout
+            if total[0] <= 0:
+                del self._cells[key]
+
+    def frame(self) -> pd.DataFrame:
+        """セル表（DIMENSIONS + MEASURES）。"""
+        with self._lock:
+            if self._frame is None:
+                self._frame = pd.DataFrame(
+                    [(*key, *vals) for key, vals in self._cells.items()], columns=DIMENSIONS + MEASURES,
+                )
+            return self._frame
+
+    def rollup(self, dims: list[str], filters: dict[str, list] | None = None) -> pd.DataFrame:
+        """dims ごとの集計（filters {次元: 値のリスト} で絞ってから）。的中率・回収率（%）付き。"""
+        cells = self.frame()
+        for dim, values in (filters or {}).items():
+            if values:
+                cells = cells[cells[dim].isin(values)]
+        if dims:
+            out = cells.groupby(dims, as_index=False, observed=True)[MEASURES].sum()
+        else:
+            out = cells[MEASURES].sum().to_frame().T
+        out["的中率"] = out["的中数"] / out["レース数"] * 100
+        out["回収率"] = out["払戻額"] / (out["レース数"] * 100) * 100
+        return out
+
+    def pivot(self, rows: list[str], column: str, measure: str,
+              filters: dict[str, list] | None = None) -> pd.DataFrame:
+        """rows × column のピボット表（measure は MEASURES か 的中率・回収率）。"""
+        flat = self.rollup(rows + [column], filters)
+        return flat.pivot_table(index=rows, columns=column, values=measure, aggfunc="sum", observed=True)
@@ -0,0 +1,201 @@
+"""予測ファイルのコンパクト形式（.mhp）と JSON 互換リーダー（pure stdlib・public/ アプリと共有）。
+
+.mhp = MAGIC(4B) + 元JSONのバイト数(8B) + 元JSONの crc32(4B) + zlib(marshal v4)。
+エンコード前に文字列を共有化するため、予測順位・勝率(%)・calibrated_prob(%) などの
+繰り返しキーや馬名は marshal の参照テーブルに 1 回だけ書かれ（辞書エンコード）、
+数値は固定長バイナリ（int32 / float64）で格納される。
+読み込み結果は json.load と同一の dict/list なので、アプリ側はそのまま扱える。
+
+使い方:
+    python -m model.pred_codec convert data/predictions   # *.json → *.mhp
+    python -m model.pred_codec bench data/predictions     # json.load との比較
+"""
+from __future__ import annotations
+
+import json
+import marshal
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from pathlib import Path
+
+MAGIC = b"MHP2"
+SUFFIX = ".mhp"
+_HEADER = struct.Struct(">4sQI")
+_OLD_MAGIC, _OLD_HEADER = b"MHP1", struct.Struct(">4sQ")  # バイト数だけの旧形式（読めるが常に鮮度切れ扱い）
+_MARSHAL_VERSION = 4
+
+
+def share_strings(obj, memo: dict):
+    """同じ内容の文字列を同一オブジェクトにそろえ、marshal の参照で重複を消す。"""
+    if isinstance(obj, str):
+        return memo.setdefault(obj, obj)
+    if isinstance(obj, dict):
+        return {memo.setdefault(k, k): share_strings(v, memo) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [share_strings(v, memo) for v in obj]
+    return obj
+
+
+def encode(data: dict, source: bytes = b"") -> bytes:
+    """予測データを .mhp バイト列に変換する。source は元JSONのバイト列（鮮度判定用にバイト数と crc32 を記録）。"""
+    payload = marshal.dumps(share_strings(data, {}), _MARSHAL_VERSION)
+    return _HEADER.pack(MAGIC, len(source), zlib.crc32(source)) + zlib.compress(payload, 6)
+
+
+def decode(blob: bytes) -> dict:
+    """.mhp バイト列を json.load と同じ形の dict に戻す。形式不一致は ValueError。"""
+    magic = blob[:4]
+    header = _HEADER if magic == MAGIC else _OLD_HEADER if magic == _OLD_MAGIC else None
+    if header is None:
+        raise ValueError(f"mhp: 不明な形式 {magic!r}")
+    if len(blob) < header.size:
+        raise ValueError("mhp: ヘッダーが短すぎます")
+    data = marshal.loads(zlib.decompress(blob[header.size:]))
+    if not isinstance(data, dict):
+        raise ValueError("mhp: ルートが dict ではありません")
+    return data
+
+
+def _source_stamp(path: Path) -> tuple[int, int] | None:
+    """.mhp に記録された元JSONの (バイト数, crc32)。旧形式・読めないときは None。"""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(_HEADER.size)
+    except OSError:
+        return None
+    if len(head) < _HEADER.size:
+        return None
+    magic, size, crc = _HEADER.unpack(head)
+    return (size, crc) if magic == MAGIC else None
+
+
+def _stamp_of(raw: bytes) -> tuple[int, int]:
+    return len(raw), zlib.crc32(raw)
+
+
+_fresh_memo: dict[str, tuple[tuple, bool]] = {}  # .mhp のパス → (両ファイルの (mtime_ns, size), 判定結果)
+_fresh_lock = threading.Lock()
+
+
+def _is_fresh(mhp_path: Path, json_path: Path) -> bool:
+    """.mhp が同名 JSON の今の中身から作られたものか（バイト数と crc32 の一致）。JSON が無ければ常に有効。
+
+    同じバイト数の書き換え（オッズの桁が変わらない更新など）も crc32 で見分ける。
+    JSON を読んで crc32 を取るのは、どちらかのファイルの mtime・サイズが変わったときだけ。
+    """
+    try:
+        js = json_path.stat()
+    except FileNotFoundError:
+        return True
+    try:
+        ms = mhp_path.stat()
+    except OSError:
+        return False
+    sig = (ms.st_mtime_ns, ms.st_size, js.st_mtime_ns, js.st_size)
+    with _fresh_lock:
+        hit = _fresh_memo.get(str(mhp_path))
+    if hit is not None and hit[0] == sig:
+        return hit[1]
+    stamp = _source_stamp(mhp_path)
+    fresh = stamp is not None and stamp[0] == js.st_size and stamp == _stamp_of(json_path.read_bytes())
+    with _fresh_lock:
+        _fresh_memo[str(mhp_path)] = (sig, fresh)
+    return fresh
+
+
+def find_prediction_files(pred_dir: Path) -> dict[str, Path]:
+    """{日付: 読み込むべきパス}（日付昇順）。鮮度の合う .mhp があればそれを優先する。"""
+    if not pred_dir.exists():
+        return {}
+    found: dict[str, Path] = {p.stem: p for p in pred_dir.glob("*.json")}
+    for mhp in pred_dir.glob(f"*{SUFFIX}"):
+        if _is_fresh(mhp, mhp.with_suffix(".json")):
+            found[mhp.stem] = mhp
+    return dict(sorted(found.items()))
+
+
+def load_prediction(path: Path) -> dict:
+    """予測ファイルを読み込む（.json / .mhp どちらでも同じ dict を返す）。"""
+    path = Path(path)
+    if path.suffix == SUFFIX:
+        try:
+            return decode(path.read_bytes())
+        except (ValueError, EOFError, TypeError, zlib.error):
+            json_path = path.with_suffix(".json")
+            if not json_path.exists():
+                raise
+            path = json_path
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def convert_dir(pred_dir: Path) -> list[Path]:
+    """pred_dir の *.json から鮮度の合わない .mhp だけを書き直す。書いたパスを返す。"""
+    written = []
+    for json_path in sorted(Path(pred_dir).glob("*.json")):
+        mhp_path = json_path.with_suffix(SUFFIX)
+        raw = json_path.read_bytes()
+        if mhp_path.exists() and _source_stamp(mhp_path) == _stamp_of(raw):
+            continue
+        blob = encode(json.loads(raw), source=raw)
+        tmp = mhp_path.with_suffix(SUFFIX + ".tmp")
+        tmp.write_bytes(blob)
+        tmp.replace(mhp_path)
+        written.append(mhp_path)
+    return written
+
+
+def bench(pred_dir: Path, repeat: int = 5) -> dict:
+    """data/predictions 全体で json.load と .mhp デコードのサイズ・時間を比較する。"""
+    json_paths = sorted(Path(pred_dir).glob("*.json"))
+    raws = [p.read_bytes() for p in json_paths]
+    blobs = [encode(json.loads(r), r) for r in raws]
+    tmp_dir = tempfile.TemporaryDirectory()
+    mhp_paths = []
+    for p, blob in zip(json_paths, blobs):
+        mhp_paths.append(Path(tmp_dir.name) / f"{p.stem}{SUFFIX}")
+        mhp_paths[-1].write_bytes(blob)
+
+    def _best(fn) -> float:
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - t0)
+        return best * 1000
+
+    def _json_load():
+        for p in json_paths:
+            with open(p, encoding="utf-8") as f:
+                json.load(f)
+
+    json_ms = _best(_json_load)
+    mhp_ms = _best(lambda: [load_prediction(p) for p in mhp_paths])
+    tmp_dir.cleanup()
+    json_bytes = sum(len(r) for r in raws)
+    mhp_bytes = sum(len(b) for b in blobs)
+    return {
+        "files": len(json_paths),
+        "json_bytes": json_bytes,
+        "mhp_bytes": mhp_bytes,
+        "size_ratio": round(json_bytes / mhp_bytes, 2) if mhp_bytes else None,
+        "json_load_ms": round(json_ms, 2),
+        "mhp_decode_ms": round(mhp_ms, 2),
+        "speedup": round(json_ms / mhp_ms, 2) if mhp_ms else None,
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] not in ("convert", "bench"):
+        print("usage: python -m model.pred_codec {convert|bench} <predictions_dir>")
+        sys.exit(2)
+    target = Path(sys.argv[2])
+    if sys.argv[1] == "convert":
+        for p in convert_dir(target):
+            print(f"wrote {p}")
+    else:
+        print(json.dumps(bench(target), ensure_ascii=False, indent=2))
@@ -0,0 +1,255 @@
+"""予測ファイルの版管理（前日 → 10時 → 13時。pure stdlib・public/ アプリと共有）。
+
+当日更新は data/predictions/<日付>.json を上書きするため、前日予測の順位・確率・推奨は残らない。
+公開のたびに record() で内容を版として記録し、日付ごとに 1 ファイル（VERSIONS_DIR/<日付>.mhv）に持つ:
+    版0     全体（share_strings + marshal + zlib。pred_codec の .mhp と同じ符号化）
+    版1以降 直前の版からの構造差分（同じ符号化）
+差分はレースを race_id、馬を馬番で対応付けて、変わった値だけを持つ（diff / patch）。
+1日の容量は「圧縮した全体 1 つ + 小さな差分」に収まる。
+
+読み込みは版0から差分を順に当てて復元する（versions_of / load_version / as_of）。
+horse_changes は2つの版の馬ごとの予測順位・勝率・オッズ・期待値の変化表を作る。
+
+使い方:
+    python -m model.pred_versions record data/predictions    # 変わった日付だけ新しい版を追加
+    python -m model.pred_versions info data/predictions
+"""
+from __future__ import annotations
+
+import datetime
+import marshal
+import os
+import sys
+import zlib
+from pathlib import Path
+
+from model.pred_codec import find_prediction_files, load_prediction, share_strings
+
+VERSIONS_DIR = ".versions"  # 予測ディレクトリ直下
+SUFFIX = ".mhv"
+FORMAT = 1
+ID_KEYS = ("race_id", "馬番", "馬名")  # リスト要素の対応付けに使うキー（先に見つかったもの）
+_MARSHAL_VERSION = 4
+
+
+# ─── 構造差分 ────────────────────────────────────────────
+def _list_key(items: list) -> str | None:
+    """全要素が dict で、値が重複しない ID キーを持つならそのキー。"""
+    if not items or not all(isinstance(x, dict) for x in items):
+        return None
+    for key in ID_KEYS:
+        ids = [x.get(key) for x in items]
+        if None not in ids and len(set(map(repr, ids))) == len(ids):
+            return key
+    return None
+
+
+def diff(old, new):
+    """old → new の差分（同じなら None）。
+
+    {"$set": 値} 置き換え / {"$d": {キー: 差分}, "$del": [キー]} dict /
+    {"$l": IDキー, "order": [ID], "items": {ID: 差分}} ID で対応付けたリスト
+    """
+    if old == new:
+        return None
+    if isinstance(old, dict) and isinstance(new, dict):
+        changes = {}
+        for k, v in new.items():
+            d = diff(old[k], v) if k in old else {"$set": v}
+            if d is not None:
+                changes[k] = d
+        out = {"$d": changes}
+        removed = [k for k in old if k not in new]
+        if removed:
+            out["$del"] = removed
+        return out
+    if isinstance(old, list) and isinstance(new, list):
+        key = _list_key(old)
+        if key is not None and _list_key(new) == key:
+            prev = {x[key]: x for x in old}
+            items = {}
+            for x in new:
+                d = diff(prev[x[key]], x) if x[key] in prev else {"$set": x}
+                if d is not None:
+                    items[x[key]] = d
+            return {"$l": key, "order": [x[key] for x in new], "items": items}
+    return {"$set": new}
+
+
+def patch(old, delta):
+    """diff の逆。old は変更しない（変わらない部分は old と共有する）。"""
+    if delta is None:
+        return old
+    if "$set" in delta:
+        return delta["$set"]
+    if "$d" in delta:
+        removed = set(delta.get("$del", ()))
+        out = {k: v for k, v in old.items() if k not in removed}
+        for k, d in delta["$d"].items():
+            out[k] = patch(old.get(k), d)
+        return out
+    key, items = delta["$l"], delta["items"]
+    prev = {x[key]: x for x in old}
+    return [patch(prev.get(i), items[i]) if i in items else prev[i] for i in delta["order"]]
+
+
+# ─── 版ファイル ──────────────────────────────────────────
+def _pack(obj) -> bytes:
+    return zlib.compress(marshal.dumps(share_strings(obj, {}), _MARSHAL_VERSION), 6)
+
+
+def _unpack(blob: bytes):
+    return marshal.loads(zlib.decompress(blob))
+
+
+def snapshot_label(data: dict) -> str:
+    """版の呼び名（shap_factors.SNAPSHOTS と同じ表記）。当日更新は生成時刻の午前/午後で分ける。"""
+    if data.get("mode") == "evening":
+        return "🌙 前日"
+    if data.get("mode") == "morning":
+        try:
+            hour = datetime.datetime.fromisoformat(str(data.get("generated_at"))).hour
+        except ValueError:
+            return "🌅 当日"
+        return "☀️ 10時" if hour < 12 else "🌅 13時"
+    return "版"
+
+
+def versions_path(pred_dir: Path, date: str) -> Path:
+    return Path(pred_dir) / VERSIONS_DIR / f"{date}{SUFFIX}"
+
+
+def read_file(path: Path) -> dict:
+    """版ファイル（無ければ空）。{"format", "date", "versions": [{meta..., "full", "blob"}]}"""
+    try:
+        with open(path, "rb") as f:
+            store = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return {"format": FORMAT, "versions": []}
+    return store if isinstance(store, dict) and store.get("format") == FORMAT else {"format": FORMAT, "versions": []}
+
+
+def versions_of(store: dict) -> list[dict]:
+    """版のメタ情報（index, label, mode, generated_at, recorded_at, bytes）。"""
+    return [
+        {k: v for k, v in entry.items() if k not in ("blob", "full")} | {"index": i, "bytes": len(entry["blob"])}
+        for i, entry in enumerate(store["versions"])
+    ]
+
+
+def load_version(store: dict, index: int = -1) -> dict | None:
+    """index 番目の版を復元する（負の index は末尾から）。"""
+    entries = store["versions"]
+    if not entries:
+        return None
+    index = index % len(entries)
+    data = None
+    for entry in entries[:index + 1]:
+        data = _unpack(entry["blob"]) if entry["full"] else patch(data, _unpack(entry["blob"]))
+    return data
+
+
+def as_of(store: dict, label: str) -> dict | None:
+    """呼び名が label の版のうち最後のもの（「前日時点」「10時時点」）。無ければ None。"""
+    matches = [v["index"] for v in versions_of(store) if v["label"] == label]
+    return load_version(store, matches[-1]) if matches else None
+
+
+def record(pred_path: Path, pred_dir: Path | None = None) -> bool:
+    """予測ファイルの現在の内容を版として追加する。最新の版と同じなら何もしない（False）。"""
+    pred_path = Path(pred_path)
+    pred_dir = Path(pred_dir or pred_path.parent)
+    path = versions_path(pred_dir, pred_path.stem)
+    store = read_file(path)
+    data = load_prediction(pred_path)
+    latest = load_version(store)
+    if latest == data:
+        return False
+    meta = {
+        "label": snapshot_label(data),
+        "mode": data.get("mode", ""),
+        "generated_at": data.get("generated_at", ""),
+        "recorded_at": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+    if latest is None:
+        entry = {**meta, "full": True, "blob": _pack(data)}
+    else:
+        delta = diff(latest, data)
+        if patch(latest, delta) != data:  # 念のため。復元できない差分は全体で持つ
+            entry = {**meta, "full": True, "blob": _pack(data)}
+        else:
+            entry = {**meta, "full": False, "blob": _pack(delta)}
+    store = {"format": FORMAT, "date": pred_path.stem, "versions": store["versions"] + [entry]}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + f".tmp{os.getpid()}")
+    with open(tmp, "wb") as f:
+        marshal.dump(store, f, _MARSHAL_VERSION)
+    os.replace(tmp, path)
+    return True
+
+
+# ─── 比較 ────────────────────────────────────────────────
+_CHANGE_FIELDS = ["予測順位", "勝率(%)", "calibrated_prob(%)", "単勝", "期待値"]
+
+
+def horse_changes(old: dict, new: dict) -> list[dict]:
+    """2つの版の馬ごとの変化（race_id・馬番で対応付け）。片方にしか無い馬は片側が None。"""
+    old_races = {r.get("race_id"): r for r in old.get("races") or []}
+    rows = []
+    for race in new.get("races") or []:
+        prev_race = old_races.get(race.get("race_id"), {})
+        prev = {p.get("馬番"): p for p in prev_race.get("predictions") or []}
+        cur = {p.get("馬番"): p for p in race.get("predictions") or []}
+        for num in sorted(set(prev) | set(cur), key=lambda n: (n is None, n)):
+            a, b = prev.get(num, {}), cur.get(num, {})
+            row = {"race_id": race.get("race_id"), "race_name": race.get("race_name", ""), "馬番": num,
+                   "馬名": b.get("馬名") or a.get("馬名")}
+            for field in _CHANGE_FIELDS:
+                row[f"{field}_前"], row[f"{field}_後"] = a.get(field), b.get(field)
+            rows.append(row)
+    return rows
+
+
+def race_changes(old: dict, new: dict) -> list[dict]:
+    """レースごとの勝負度・推奨（ev_picks の馬番）の変化。"""
+    old_races = {r.get("race_id"): r for r in old.get("races") or []}
+    rows = []
+    for race in new.get("races") or []:
+        prev = old_races.get(race.get("race_id"), {})
+
+        def _picks(r):
+            return ", ".join(str(p.get("馬番")) for p in (r.get("recommendation") or {}).get("ev_picks") or [])
+
+        rows.append({
+            "race_id": race.get("race_id"),
+            "race_name": race.get("race_name", ""),
+            "勝負度_前": (prev.get("confidence") or {}).get("label"),
+            "勝負度_後": (race.get("confidence") or {}).get("label"),
+            "EV推奨_前": _picks(prev),
+            "EV推奨_後": _picks(race),
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "record"
+    pred_root = Path(sys.argv[2] if len(sys.argv) > 2 else "data/predictions")
+    files = find_prediction_files(pred_root)
+    if cmd == "record":
+        added = [date for date, p in files.items() if record(p, pred_root)]
+        print(f"recorded {len(added)} / {len(files)}: {', '.join(added)}")
+    elif cmd == "info":
+        total_json = total_store = 0
+        for date in files:
+            path = versions_path(pred_root, date)
+            if not path.exists():
+                continue
+            vs = versions_of(read_file(path))
+            size = path.stat().st_size
+            total_store += size
+            total_json += (pred_root / f"{date}.json").stat().st_size if (pred_root / f"{date}.json").exists() else 0
+            print(f"{date}: {len(vs)} 版 {size:,}B  " + " → ".join(f"{v['label']}({v['bytes']:,}B)" for v in vs))
+        print(f"版ファイル合計 {total_store:,}B / 現行 JSON 合計 {total_json:,}B")
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,96 @@
+"""バックグラウンド先読み（pure stdlib・public/ アプリと共有）。
+
+ThreadPoolExecutor（同時実行数 max_workers）に「キー → 読み込み関数」のタスクを投げ、
+呼び出し側のキャッシュ（st.cache_data など）を先に温めておく。
+    - request(owner, tasks): owner（= セッション）ごとの「今ほしいタスク一覧」を丸ごと差し替える。
+      一覧から外れた未着手タスクは cancel する（遠くへ移動したら古い先読みは捨てる）。
+    - 同じキー・同じトークン（ファイルシグネチャ等）で完了済み／実行中のタスクは再投入しない。
+    - 待ち行列は max_pending 件まで。超えた分は捨てる（一覧の先頭ほど優先）。
+    - owner_ttl 秒 request の無い owner は終わったセッションとみなして要求ごと取り下げる
+      （Streamlit にはセッション終了のフックが無いので、release() が呼ばれなくても溜まらない）。
+タスク内の例外は握りつぶす（先読みの失敗は本読み込みで改めて表面化する）。
+"""
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Hashable
+
+Task = tuple[Hashable, Hashable, Callable[[], object]]  # (キー, トークン, 関数)
+
+
+class Prefetcher:
+    """セッション単位でキャンセルできる、同時実行数上限付きの先読みキュー。"""
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 16, owner_ttl: float = 300.0):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._max_pending = max_pending
+        self._owner_ttl = owner_ttl
+        self._lock = threading.Lock()
+        self._futures: dict[Hashable, tuple[Hashable, Future]] = {}   # キー → (トークン, Future)
+        self._owners: dict[Hashable, set[Hashable]] = {}              # owner → 要求中のキー
+        self._seen: dict[Hashable, float] = {}                        # owner → 最後の request の時刻
+        self.stats = {"submitted": 0, "cancelled": 0, "done": 0, "failed": 0}
+
+    def request(self, owner: Hashable, tasks: list[Task]) -> None:
+        """owner の先読み要求を tasks に差し替える。"""
+        with self._lock:
+            self._expire_owners(owner)
+            wanted = {key for key, _, _ in tasks}
+            self._withdraw(owner, self._owners.get(owner, set()) - wanted)
+            self._owners[owner] = wanted
+            self._seen[owner] = time.monotonic()
+            pending = sum(1 for _, f in self._futures.values() if not f.done())
+            for key, token, fn in tasks:
+                current = self._futures.get(key)
+                if current is not None and current[0] == token and not current[1].cancelled():
+                    continue  # 完了済み or 実行中
+                if pending >= self._max_pending:
+                    break
+                self._futures[key] = (token, self._pool.submit(self._run, fn))
+                self.stats["submitted"] += 1
+                pending += 1
+
+    def _expire_owners(self, current: Hashable) -> None:
+        """owner_ttl 秒 request の無い owner の要求を取り下げる（ロック内で呼ぶ）。"""
+        limit = time.monotonic() - self._owner_ttl
+        for owner in [o for o, seen in self._seen.items() if seen < limit and o != current]:
+            self._withdraw(owner, self._owners.pop(owner, set()))
+            del self._seen[owner]
+
+    def _withdraw(self, owner: Hashable, keys: set[Hashable]) -> None:
+        """owner が要らなくなった keys のうち、他の owner も要求していない未着手タスクを cancel する。"""
+        for key in keys:
+            if not self._wanted_by_others(owner, key):
+                self._cancel(key)
+
+    def _wanted_by_others(self, owner: Hashable, key: Hashable) -> bool:
+        return any(key in keys for o, keys in self._owners.items() if o != owner)
+
+    def _cancel(self, key: Hashable) -> None:
+        entry = self._futures.get(key)
+        if entry is not None and entry[1].cancel():
+            del self._futures[key]
+            self.stats["cancelled"] += 1
+
+    def _run(self, fn: Callable[[], object]) -> None:
+        try:
+            fn()
+            outcome = "done"
+        except Exception:
+            outcome = "failed"
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def is_ready(self, key: Hashable, token: Hashable) -> bool:
+        """key がトークン token で先読み完了済みか（計測・表示用）。"""
+        entry = self._futures.get(key)
+        return entry is not None and entry[0] == token and entry[1].done() and not entry[1].cancelled()
+
+    def release(self, owner: Hashable) -> None:
+        """owner の要求を取り下げる（他の owner が要求していない未着手タスクは cancel）。"""
+        self.request(owner, [])
+        with self._lock:
+            self._owners.pop(owner, None)
+            self._seen.pop(owner, None)
@@ -0,0 +1,162 @@
+"""リラン単位の軽量プロファイラ（pure stdlib・public/ アプリと共有）。
+
+1回のリランごとに RerunProfiler を作り、activate() でスレッドに紐付ける。
+    - span(name): 区間の実行時間を積算（同名は回数・合計・最大を集計）
+    - cache_probe(name): キャッシュ関数の呼び出し回数とミス回数（= 本体実行）を数える
+無効時の span() は共有の nullcontext を返すだけなので、計測を仕込んだままでも
+本番のオーバーヘッドは属性参照1回程度に収まる。
+
+有効化: 環境変数 MYHORSES_PROFILE=1（構造化ログ出力）、またはアプリを ?admin=<MYHORSES_ADMIN_TOKEN の値>
+で開く（管理パネル。MYHORSES_ADMIN_TOKEN が未設定なら管理パネルは開けない）。
+"""
+from __future__ import annotations
+
+import contextlib
+import functools
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+ENV_FLAG = "MYHORSES_PROFILE"
+ADMIN_TOKEN_ENV = "MYHORSES_ADMIN_TOKEN"
+LOGGER_NAME = "myhorses.profile"
+
+_NULL = contextlib.nullcontext()
+_local = threading.local()
+
+
+def env_enabled() -> bool:
+    return os.environ.get(ENV_FLAG, "") not in ("", "0", "false")
+
+
+def admin_allowed(token: str | None) -> bool:
+    """?admin= の値が環境変数 ADMIN_TOKEN_ENV と一致するか（未設定なら常に False）。"""
+    expected = os.environ.get(ADMIN_TOKEN_ENV, "")
+    return bool(expected) and token is not None and hmac.compare_digest(token.encode(), expected.encode())
+
+
+class RerunProfiler:
+    """1回のリランの計測値を保持する。"""
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.spans: dict[str, list[float]] = defaultdict(lambda: [0, 0.0, 0.0])  # [回数, 合計ms, 最大ms]
+        self.cache: dict[str, list[int]] = defaultdict(lambda: [0, 0])  # [呼び出し, ミス]
+
+    def span(self, name: str):
+        if not self.enabled:
+            return _NULL
+        return self._span(name)
+
+    @contextlib.contextmanager
+    def _span(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            ms = (time.perf_counter() - t0) * 1000
+            rec = self.spans[name]
+            rec[0] += 1
+            rec[1] += ms
+            rec[2] = max(rec[2], ms)
+
+    def record_call(self, name: str) -> None:
+        if self.enabled:
+            self.cache[name][0] += 1
+
+    def record_miss(self, name: str) -> None:
+        if self.enabled:
+            self.cache[name][1] += 1
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def span_rows(self) -> list[dict]:
+        rows = [
+            {"区間": k, "回数": int(n), "合計ms": round(total, 2), "最大ms": round(mx, 2)}
+            for k, (n, total, mx) in self.spans.items()
+        ]
+        return sorted(rows, key=lambda r: -r["合計ms"])
+
+    def cache_rows(self) -> list[dict]:
+        return [
+            {"キャッシュ": k, "呼び出し": calls, "ヒット": calls - misses, "ミス": misses}
+            for k, (calls, misses) in sorted(self.cache.items())
+        ]
+
+    def as_record(self) -> dict:
+        """構造化ログ用の1行レコード。"""
+        return {
+            "event": "rerun",
+            "total_ms": round(self.total_ms(), 2),
+            "spans": {r["区間"]: {"n": r["回数"], "ms": r["合計ms"], "max_ms": r["最大ms"]}
+                      for r in self.span_rows()},
+            "cache": {r["キャッシュ"]: {"calls": r["呼び出し"], "misses": r["ミス"]}
+                      for r in self.cache_rows()},
+        }
+
+    def log(self) -> None:
+        if self.enabled:
+            _logger().info(json.dumps(self.as_record(), ensure_ascii=False))
+
+
+_DISABLED = RerunProfiler(enabled=False)
+
+
+def _logger() -> logging.Logger:
+    logger = logging.getLogger(LOGGER_NAME)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+def activate(enabled: bool) -> RerunProfiler:
+    """現在のスレッド（= このリラン）用のプロファイラを作って返す。"""
+    prof = RerunProfiler(enabled) if enabled else _DISABLED
+    _local.profiler = prof
+    return prof
+
+
+def current() -> RerunProfiler:
+    return getattr(_local, "profiler", _DISABLED)
+
+
+def record_miss(name: str) -> None:
+    """キャッシュ関数の本体先頭で呼ぶ（本体が走った = ミス）。"""
+    current().record_miss(name)
+
+
+def cache_probe(name: str):
+    """キャッシュ済み関数の外側に付け、呼び出し回数と所要時間を数えるデコレータ。.clear は素通し。"""
+    def decorator(cached_fn):
+        @functools.wraps(cached_fn)
+        def wrapper(*args, **kwargs):
+            prof = current()
+            if not prof.enabled:
+                return cached_fn(*args, **kwargs)
+            prof.record_call(name)
+            with prof.span(f"cache.{name}"):
+                return cached_fn(*args, **kwargs)
+        wrapper.clear = cached_fn.clear
+        return wrapper
+    return decorator
+
+
+def timed(name: str):
+    """関数全体を span で囲むデコレータ。"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with current().span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
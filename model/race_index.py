@@ -0,0 +1,154 @@
+"""レース単位の範囲インデックス（日付 × 勝負度 × グレード × 芝ダ × 結果の有無）。
+
+「今月の ★★★ 全レース」「勝負度2以上で結果が未確定のレース」のような複数日にまたがる
+検索を、予測ファイルを全部読まずに返すためのインデックス。予測ファイル1件ごとに
+レース行（ROW_KEYS）を登録し、シグネチャの変わった日・消えた日だけを差し替える（sync）。
+中身は DEFAULT_DIR/index.marshal に保存するので、プロセスを起動し直しても
+読み直すのは前回から変わった日の予測ファイルだけ。
+
+レース行は (date, race_id) 順のリストで持ち、期間は日付列の二分探索で切り出してから
+残りの条件で絞る（コストは期間内のレース数に比例し、シーズン数が増えても変わらない）。
+勝負度は予測ファイルに記録された予測時点の値（confidence.level）。
+
+複数セッションから共有される前提なので、更新はロックで直列化する。
+"""
+from __future__ import annotations
+
+import bisect
+import marshal
+import os
+import threading
+from pathlib import Path
+from typing import Callable
+
+from model.archive import parse_surface
+
+DEFAULT_DIR = ".race_index"  # data/ 直下
+INDEX_NAME = "index.marshal"
+ROW_KEYS = ["date", "race_id", "level", "label", "grade", "芝ダ", "status",
+            "race_name", "venue", "distance", "reason"]
+STATUSES = ["確定", "未確定"]  # 結果（race.result）の有無
+_VERSION = 1
+_MARSHAL_VERSION = 4
+
+
+def day_rows(date: str, data: dict) -> list[tuple]:
+    """予測ファイル1件分のレース行（ROW_KEYS 順のタプル）。"""
+    rows = []
+    for race in data.get("races") or []:
+        conf = race.get("confidence") or {}
+        rows.append((
+            date,
+            str(race.get("race_id") or ""),
+            int(conf.get("level") or 0),
+            conf.get("label") or "−",
+            race.get("grade") or "",
+            parse_surface(race.get("distance", "")),
+            STATUSES[0] if race.get("result") else STATUSES[1],
+            race.get("race_name") or "",
+            race.get("venue") or "",
+            race.get("distance") or "",
+            conf.get("reason") or "",
+        ))
+    return rows
+
+
+class RaceIndex:
+    """予測ファイル単位で差分更新し、ディスクに保存するレース範囲インデックス。"""
+
+    def __init__(self, directory: Path | None = None):
+        self.path = Path(directory) / INDEX_NAME if directory is not None else None
+        self._lock = threading.Lock()
+        self._days: dict[str, tuple] = {}   # 日付 → (ファイル名, シグネチャ, レース行)
+        # (全レース行（date, race_id 順）, その日付列（二分探索用）)。sync はロック外の読み手と
+        # 食い違わないよう、1回の代入で丸ごと差し替える（読み手は最初に1回だけ参照する）
+        self._table: tuple[list[tuple], list[str]] = ([], [])
+        self.stats = {"loaded": 0, "files_read": 0}
+        self._load()
+
+    def _load(self) -> None:
+        if self.path is None:
+            return
+        try:
+            with open(self.path, "rb") as f:
+                saved = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return
+        if isinstance(saved, dict) and saved.get("version") == _VERSION:
+            self._days = saved["days"]
+            self.stats["loaded"] = len(self._days)
+            self._rebuild()
+
+    def _save(self) -> None:
+        if self.path is None:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + f".tmp{os.getpid()}")
+            with open(tmp, "wb") as f:
+                marshal.dump({"version": _VERSION, "days": self._days}, f, _MARSHAL_VERSION)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass  # 書き込めない環境ではメモリ上のインデックスだけ使う
+
+    def _rebuild(self) -> None:
+        rows = sorted(row for _, _, day in self._days.values() for row in day)
+        self._table = (rows, [row[0] for row in rows])
+
+    def sync(self, archive_sig: tuple, load_pred: Callable[[str], dict]) -> int:
+        """archive_sig（(パス, シグネチャ) の並び）に合わせて変わった日だけ読み直す。変更日数を返す。"""
+        wanted = {Path(p).stem: (Path(p).name, sig, p) for p, sig in archive_sig}
+        with self._lock:
+            stale = [d for d in self._days if d not in wanted]
+            fresh = [
+                d for d, (name, sig, _) in wanted.items()
+                if self._days.get(d, (None, None))[:2] != (name, sig)
+            ]
+            if not stale and not fresh:
+                return 0
+            for date in stale:
+                del self._days[date]
+            for date in fresh:
+                name, sig, path_str = wanted[date]
+                self._days[date] = (name, sig, day_rows(date, load_pred(path_str)))
+                self.stats["files_read"] += 1
+            self._rebuild()
+            self._save()
+            return len(stale) + len(fresh)
+
+    def __len__(self) -> int:
+        return len(self._table[0])
+
+    def date_range(self) -> tuple[str, str] | None:
+        dates = self._table[1]
+        return (dates[0], dates[-1]) if dates else None
+
+    def values(self, key: str) -> list[str]:
+        """列 key に現れる値（選択肢の表示用）。"""
+        i = ROW_KEYS.index(key)
+        return sorted({row[i] for row in self._table[0]})
+
+    def query(self, start: str | None = None, end: str | None = None, min_level: int = 0,
+              grades=None, surfaces=None, status: str | None = None,
+              offset: int = 0, limit: int | None = None) -> tuple[int, list[dict]]:
+        """条件に合うレース（勝負度の高い順・同じなら新しい日付順）の件数と offset から limit 件。
+
+        start / end は 'YYYY-MM-DD'（両端を含む。None は制限なし）。
+        grades / surfaces は許す値の集合（None は制限なし）。status は STATUSES のどれか。
+        """
+        rows, dates = self._table
+        lo = bisect.bisect_left(dates, start) if start else 0
+        hi = bisect.bisect_right(dates, end) if end else len(rows)
+        grades = set(grades) if grades is not None else None
+        surfaces = set(surfaces) if surfaces is not None else None
+        hits = [
+            row for row in reversed(rows[lo:hi])
+            if row[2] >= min_level
+            and (grades is None or row[4] in grades)
+            and (surfaces is None or row[5] in surfaces)
+            and (status is None or row[6] == status)
+        ]
+        hits.sort(key=lambda row: -row[2])  # 安定ソートなので同じ勝負度の中は新しい日付順のまま
+        page = hits[offset:offset + limit] if limit is not None else hits[offset:]
+        return len(hits), [dict(zip(ROW_KEYS, row)) for row in page]
+
@@ -0,0 +1,203 @@
+"""レースシグナル（有望パターン・ダート中距離一致・オッズ急落・AIの死角）の判定と全期間スキャン。
+
+単レース判定（is_promising など）はカレンダー・予測一覧の表示用。
+scan_archive は同じ条件を archive.race_summary / horse_frame 上の列演算で全レース一括評価し、
+的中・払戻付きのヒット表を返す。閾値はモジュール定数で、両者で共有する。
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from model.archive import RACE_KEY, parse_distance_m, parse_surface
+from model.odds_signals import ODDS_CRASH_THRESHOLD
+
+PROMISING_MIN_DIST = 1800      # 芝×1800m以上
+PROMISING_MIN_FAV_RANK = 4     # 1番人気のモデル順位が 4位以下で「乖離」
+DIRT_AGREE_DIST = (1801, 2200)  # ダート中距離
+DIRT_AGREE_MAX_FAV_RANK = 2    # 1番人気がモデル Top2 以内で「一致」
+BLIND_SPOT_MAX_POP = 5         # 5番人気以内
+BLIND_SPOT_MIN_GAP = 7         # 予測順位 − 人気 が 7 以上
+BLIND_SPOT_MAX_CAREER = 5      # キャリア 5戦未満
+
+HIT_COLUMNS = RACE_KEY + ["signal", "馬券", "買い目", "着順", "的中", "払戻"]
+
+
+def _fav_rank(pred_race: dict) -> int | None:
+    for p in pred_race.get("predictions", []):
+        if p.get("人気") == 1:
+            return p.get("予測順位") or 99
+    return None
+
+
+def is_promising(pred_race: dict) -> bool:
+    """芝×1800m以上×乖離（1番人気がモデル4位以下）シグナル判定。"""
+    dist_str = pred_race.get("distance", "")
+    if parse_surface(dist_str) != "芝" or parse_distance_m(dist_str) < PROMISING_MIN_DIST:
+        return False
+    fav_rank = _fav_rank(pred_race)
+    return fav_rank is not None and fav_rank >= PROMISING_MIN_FAV_RANK
+
+
+def is_dirt_chusho_agree(pred_race: dict) -> bool:
+    """ダート×1801〜2200m×一致（1番人気がモデルTop2以内）シグナル判定。"""
+    dist_str = pred_race.get("distance", "")
+    if parse_surface(dist_str) != "ダート":
+        return False
+    lo, hi = DIRT_AGREE_DIST
+    if not (lo <= parse_distance_m(dist_str) <= hi):
+        return False
+    fav_rank = _fav_rank(pred_race)
+    return fav_rank is not None and fav_rank <= DIRT_AGREE_MAX_FAV_RANK
+
+
+def blind_spot_check(predictions: list[dict]) -> list[dict]:
+    """AIの死角レース判定: キャリア5戦未満・5番人気以内なのにAI予測順位が著しく低い馬を返す。"""
+    result = []
+    for p in predictions:
+        try:
+            pop = int(p.get("人気") or 99)
+        except (TypeError, ValueError):
+            continue
+        if pop <= 0 or pop > BLIND_SPOT_MAX_POP:
+            continue
+        try:
+            pred_rank = int(p.get("予測順位") or 99)
+        except (TypeError, ValueError):
+            continue
+        if pred_rank - pop < BLIND_SPOT_MIN_GAP:
+            continue
+        career = p.get("career", 99)
+        if career >= BLIND_SPOT_MAX_CAREER:
+            continue
+        result.append({**p, "_career": career, "_gap": pred_rank - pop})
+    return sorted(result, key=lambda x: x["_gap"], reverse=True)
+
+
+# ─── 全期間スキャン（列演算） ─────────────────────────────────
+def _int_str(col: pd.Series) -> pd.Series:
+    """馬番・着順の数値列を表示用文字列に（欠損は '?'）。"""
+    return col.astype("Int64").astype(str).replace("<NA>", "?")
+
+
+def _wide_hits(summary: pd.DataFrame, mask: pd.Series, a: str, b: str) -> pd.DataFrame:
+    """ワイド a-b のヒット行。払戻は結果データに無いため NaN（的中のみ判定）。"""
+    hit = summary[mask.fillna(False)]
+    both_in = (hit[f"{a}着順"] <= 3) & (hit[f"{b}着順"] <= 3)
+    return hit[RACE_KEY].assign(
+        馬券="ワイド",
+        買い目=_int_str(hit[f"{a}馬番"]) + "-" + _int_str(hit[f"{b}馬番"]),
+        着順=_int_str(hit[f"{a}着順"]) + "/" + _int_str(hit[f"{b}着順"]),
+        的中=both_in.where(hit["結果あり"]),
+        払戻=np.nan,
+    )
+
+
+def _win_hits(horses: pd.DataFrame, summary: pd.DataFrame, mask: pd.Series, order: pd.Series) -> pd.DataFrame:
+    """単勝（レース内で order 最大の1頭）のヒット行。払戻は確定単勝 × 100。"""
+    mask = mask.fillna(False)
+    cand = horses[mask].assign(_order=order[mask])  # 空の frame に全体の order を渡すと NaN 行ができる
+    cand = cand.sort_values("_order", ascending=False).drop_duplicates(RACE_KEY)
+    cand = cand.merge(summary[RACE_KEY + ["結果あり"]], on=RACE_KEY, how="left")
+    won = cand["着順"] == 1
+    return cand[RACE_KEY].assign(
+        馬券="単勝",
+        買い目=_int_str(cand["馬番"]) + " " + cand["馬名"],
+        着順=_int_str(cand["着順"]),
+        的中=won.where(cand["結果あり"]),
+        払戻=(won * cand["確定単勝"].fillna(0) * 100).where(cand["結果あり"]),
+    )
+
+
+def _scan_promising(summary, horses):
+    mask = (
+        (summary["芝ダ"] == "芝") & (summary["距離"] >= PROMISING_MIN_DIST)
+        & (summary["1人気予測順位"] >= PROMISING_MIN_FAV_RANK)
+    )
+    return _wide_hits(summary, mask, "Top1", "1人気")
+
+
+def _scan_dirt_agree(summary, horses):
+    lo, hi = DIRT_AGREE_DIST
+    mask = (
+        (summary["芝ダ"] == "ダート") & summary["距離"].between(lo, hi)
+        & (summary["1人気予測順位"] <= DIRT_AGREE_MAX_FAV_RANK)
+    )
+    return _wide_hits(summary, mask, "1人気", "2人気")
+
+
+def _scan_odds_crash(summary, horses):
+    drop = (horses["単勝_evening"] - horses["単勝"]) / horses["単勝_evening"]
+    mask = (
+        (horses["単勝_evening"] > 0) & (horses["単勝"] > 0)
+        & (drop >= ODDS_CRASH_THRESHOLD) & (horses["予測順位"] > 3)
+    )
+    return _win_hits(horses, summary, mask, drop)
+
+
+def _scan_blind_spot(summary, horses):
+    gap = horses["予測順位"] - horses["人気"]
+    mask = (
+        horses["人気"].between(1, BLIND_SPOT_MAX_POP) & (gap >= BLIND_SPOT_MIN_GAP)
+        & (horses["career"].fillna(99) < BLIND_SPOT_MAX_CAREER)
+    )
+    return _win_hits(horses, summary, mask, gap)
+
+
+SIGNALS: dict[str, dict] = {
+    "promising": {
+        "name": "🔥 芝×1800m以上×乖離",
+        "bet": "ワイド Top1-1番人気",
+        "claim": "回収率124%（125件・的中率35%）",
+        "scan": _scan_promising,
+    },
+    "dirt_agree": {
+        "name": "💎 ダート×中距離×一致",
+        "bet": "ワイド 1番人気-2番人気",
+        "claim": "ワイド回収率113%（99件・的中率44%）",
+        "scan": _scan_dirt_agree,
+    },
+    "odds_crash": {
+        "name": "📉 オッズ急落（AI4位以下）",
+        "bet": "単勝 急落馬",
+        "claim": "",
+        "scan": _scan_odds_crash,
+    },
+    "blind_spot": {
+        "name": "👀 AIの死角",
+        "bet": "単勝 死角馬",
+        "claim": "",
+        "scan": _scan_blind_spot,
+    },
+}
+
+
+def scan_archive(summary: pd.DataFrame, horses: pd.DataFrame, keys: list[str] | None = None) -> pd.DataFrame:
+    """登録シグナルを全レースに一括適用し、ヒット表（HIT_COLUMNS + レース属性）を返す。"""
+    parts = []
+    for key in keys or list(SIGNALS):
+        hits = SIGNALS[key]["scan"](summary, horses)
+        parts.append(hits.assign(signal=SIGNALS[key]["name"]))
+    if not parts:
+        return pd.DataFrame(columns=HIT_COLUMNS)
+    hits = pd.concat(parts, ignore_index=True)[HIT_COLUMNS]
+    info = summary[RACE_KEY + ["race_name", "grade", "venue", "distance"]]
+    return hits.merge(info, on=RACE_KEY, how="left").sort_values(["date", "race_id"], ascending=False)
+
+
+def summarize_hits(hits: pd.DataFrame) -> pd.DataFrame:
+    """シグナル別の件数・的中率・回収率（払戻が分かる馬券のみ）。"""
+    settled = hits[hits["的中"].notna()]
+    g = settled.groupby("signal")
+    out = pd.DataFrame({
+        "件数": hits.groupby("signal").size(),
+        "結果確定": g.size(),
+        "的中数": g["的中"].sum(),
+    }).fillna(0).astype({"件数": int, "結果確定": int, "的中数": int})
+    settled_n = out["結果確定"].replace(0, np.nan)
+    out["的中率"] = (out["的中数"] / settled_n * 100).round(1)
+    payout = g["払戻"].agg(lambda s: s.sum() if s.notna().all() else np.nan)
+    out["回収率"] = (payout / (settled_n * 100) * 100).round(1)
+    claims = {s["name"]: s["claim"] for s in SIGNALS.values()}
+    out["バックテスト公称"] = [claims.get(name, "") for name in out.index]
+    return out.reset_index().rename(columns={"signal": "シグナル"})
@@ -0,0 +1,215 @@
+"""race_analysis.csv の追記専用カラムナストア。
+
+race_analysis.csv はレースが末尾に追記されるだけなので、前回取り込んだバイト位置を
+manifest.json に記録し、次回はそれ以降の新しい行だけを読んで
+    - race_date 範囲をファイル名に持つ列指向チャンク（.npz・pickle 不使用）を1つ追加し、
+    - 月別・各「帯」カテゴリ別の集計（レース数・的中数・払戻額）を加算更新する。
+CSV が追記以外の形で書き換えられた（縮んだ・既読部分が変わった・ヘッダーが変わった）
+ときだけ全件を作り直す。バックテストタブの読み込みコストは新規行の量に比例する。
+
+複数プロセスが同じストアを同期してもよいように、チャンクは一意な名前の一時ファイルに書いてから
+置き換え、読み手は manifest に載ったチャンクだけを読む。manifest のチャンクが欠けていれば作り直す。
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import os
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+MANIFEST = "manifest.json"
+BAND_COLUMNS = ["人気帯", "勝率差帯", "頭数帯", "芝ダ", "オッズ帯", "距離帯", "パターン"]
+_FINGERPRINT_BYTES = 4096
+_NULL_PREFIX = "__null__:"  # 文字列列の欠損マスクを入れる .npz のキー接頭辞
+_VERSION = 2
+
+
+def _empty_manifest(header: list[str]) -> dict:
+    return {
+        "version": _VERSION,
+        "header": header,
+        "offset": 0,
+        "fingerprint": "",
+        "rows": 0,
+        "chunks": [],
+        "total": {"races": 0, "hits": 0, "payout": 0.0},
+        "month": {},
+        "bands": {c: {} for c in BAND_COLUMNS},
+    }
+
+
+def _fingerprint(f, offset: int) -> str:
+    """既読部分の先頭と末尾のハッシュ。追記以外の書き換え検出に使う（全体は読まない）。"""
+    f.seek(0)
+    head = f.read(_FINGERPRINT_BYTES)
+    start = max(0, offset - _FINGERPRINT_BYTES)
+    f.seek(start)
+    tail = f.read(offset - start)
+    return hashlib.sha1(head + b"|" + tail).hexdigest()
+
+
+def read_manifest(store_dir: Path) -> dict | None:
+    path = Path(store_dir) / MANIFEST
+    if not path.exists():
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("version") == _VERSION else None
+
+
+def _write_manifest(store_dir: Path, manifest: dict) -> None:
+    tmp = Path(store_dir) / (MANIFEST + f".tmp{os.getpid()}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    tmp.replace(Path(store_dir) / MANIFEST)
+
+
+def _add(bucket: dict, key: str, races: int, hits: int, payout: float) -> None:
+    cur = bucket.setdefault(key, {"races": 0, "hits": 0, "payout": 0.0})
+    cur["races"] += races
+    cur["hits"] += hits
+    cur["payout"] += payout
+
+
+def _accumulate(manifest: dict, df: pd.DataFrame) -> None:
+    """新規行の集計を manifest の累計に加算する。"""
+    _add(manifest, "total", len(df), int(df["的中"].sum()), float(df["払戻額"].sum()))
+    month = df["race_date"].astype(str).str[:7]
+    for key, g in df.groupby(month):
+        _add(manifest["month"], key, len(g), int(g["的中"].sum()), float(g["払戻額"].sum()))
+    for col in BAND_COLUMNS:
+        if col not in df.columns:
+            continue
+        for key, g in df.groupby(col):
+            _add(manifest["bands"][col], str(key), len(g), int(g["的中"].sum()), float(g["払戻額"].sum()))
+
+
+def append(store_dir: Path, df: pd.DataFrame, manifest: dict) -> dict:
+    """新規レース df を列指向チャンクとして追加し、集計を更新した manifest を返す（書き込みは呼び出し側）。"""
+    if df.empty:
+        return manifest
+    dates = df["race_date"].astype(str)
+    # 同時に同期する別プロセスと名前がぶつからないよう一意な接尾辞を付ける
+    name = f"chunk_{dates.min()}_{dates.max()}_{len(manifest['chunks']):04d}_{uuid.uuid4().hex[:12]}.npz"
+    arrays = {}
+    for col in df.columns:
+        values = df[col]
+        if values.dtype == object or pd.api.types.is_string_dtype(values):
+            # 文字列は幅を明示した固定長（dtype=str の推論だと欠損のある列が1文字幅になる）。欠損は別のマスクで持つ
+            null = values.isna().to_numpy()
+            text = values.astype(object).where(~null, "").astype(str)
+            arrays[col] = text.to_numpy(dtype=f"U{max(1, int(text.str.len().max()))}")
+            if null.any():
+                arrays[_NULL_PREFIX + col] = null
+        else:
+            arrays[col] = values.to_numpy()
+    path = Path(store_dir) / name
+    tmp = path.with_name(name + f".tmp{os.getpid()}")
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)  # 読み手に書きかけのチャンクを見せない
+    manifest["chunks"].append({"file": name, "date_min": dates.min(), "date_max": dates.max(), "rows": len(df)})
+    manifest["rows"] += len(df)
+    _accumulate(manifest, df)
+    return manifest
+
+
+def sync(csv_path: Path, store_dir: Path) -> dict:
+    """CSV の未取り込み部分だけをストアに追加し、最新の manifest を返す。"""
+    csv_path, store_dir = Path(csv_path), Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    size = csv_path.stat().st_size
+    with open(csv_path, "rb") as f:
+        header_line = f.readline()
+        header = header_line.decode("utf-8-sig").strip().split(",")
+
+        manifest = read_manifest(store_dir)
+        rebuild = (
+            manifest is None
+            or manifest["header"] != header
+            or size < manifest["offset"]
+            or _fingerprint(f, manifest["offset"]) != manifest["fingerprint"]
+            or any(not (store_dir / c["file"]).exists() for c in manifest["chunks"])
+        )
+        if rebuild:
+            manifest = _empty_manifest(header)
+            manifest["offset"] = len(header_line)
+
+        f.seek(manifest["offset"])
+        tail = f.read(size - manifest["offset"])
+        end = manifest["offset"] + tail.rfind(b"\n") + 1  # 書き込み途中の最終行は次回に回す
+        if end > manifest["offset"]:
+            new = pd.read_csv(io.BytesIO(tail[:end - manifest["offset"]]), header=None, names=header)
+            manifest = append(store_dir, new, manifest)
+        elif not rebuild:
+            return manifest
+        manifest["offset"] = max(end, manifest["offset"])
+        manifest["fingerprint"] = _fingerprint(f, manifest["offset"])
+    _write_manifest(store_dir, manifest)
+    if rebuild:
+        # 旧 manifest のチャンクは新しい manifest を置いてから消す（読み途中の相手は CSV に戻る）
+        keep = {c["file"] for c in manifest["chunks"]}
+        for old in store_dir.glob("chunk_*.npz"):
+            if old.name not in keep:
+                old.unlink(missing_ok=True)
+    return manifest
+
+
+def _restore_nulls(npz, col: str):
+    values = npz[col]
+    if _NULL_PREFIX + col not in npz.files:
+        return values
+    return pd.Series(values).where(~npz[_NULL_PREFIX + col])
+
+
+def load_frame(store_dir: Path, manifest: dict, date_from: str | None = None) -> pd.DataFrame:
+    """manifest に載ったチャンクを連結して DataFrame に戻す。date_from 指定時はそれ以降を含むチャンクだけ読む。"""
+    frames = []
+    for chunk in manifest["chunks"]:
+        if date_from and chunk["date_max"] < date_from:
+            continue
+        with np.load(Path(store_dir) / chunk["file"]) as npz:
+            frames.append(pd.DataFrame({
+                col: _restore_nulls(npz, col) for col in manifest["header"] if col in npz.files
+            }))
+    if not frames:
+        return pd.DataFrame(columns=manifest["header"])
+    df = pd.concat(frames, ignore_index=True)
+    return df[df["race_date"] >= date_from] if date_from else df
+
+
+def summarize_frame(df: pd.DataFrame) -> dict:
+    """ストアを使えない環境（読み取り専用など）向けに、DataFrame から同じ形の集計を作る。"""
+    manifest = _empty_manifest(list(df.columns))
+    manifest["rows"] = len(df)
+    _accumulate(manifest, df)
+    return manifest
+
+
+def _agg_frame(bucket: dict, key_name: str) -> pd.DataFrame:
+    df = pd.DataFrame([
+        {key_name: k, "レース数": v["races"], "的中数": v["hits"], "払戻額": v["payout"]}
+        for k, v in sorted(bucket.items())
+    ], columns=[key_name, "レース数", "的中数", "払戻額"])
+    df["投資額"] = df["レース数"] * 100
+    df["回収率"] = (df["払戻額"] / df["投資額"] * 100).round(1)
+    df["的中率"] = (df["的中数"] / df["レース数"] * 100).round(1)
+    return df
+
+
+def monthly_frame(manifest: dict) -> pd.DataFrame:
+    """月別集計（月・レース数・的中数・払戻額・投資額・回収率・的中率）。"""
+    return _agg_frame(manifest["month"], "月")
+
+
+def band_frame(manifest: dict, column: str) -> pd.DataFrame:
+    """帯カテゴリ別集計。column は BAND_COLUMNS のいずれか。"""
+    return _agg_frame(manifest["bands"].get(column, {}), column)
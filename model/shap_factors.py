@@ -0,0 +1,132 @@
+"""SHAP 要因（shap_factors_evening / _morning_early / _morning）の全期間集計。
+
+予測データの SHAP 要因はレースごとに {馬名: {"positive": [{label, value}], "negative": [...]}}
+（各上位5項目・value は表示用文字列）で、3つの時点（SNAPSHOTS）がある。
+day_factor_rows で 1日分を 1要因1行の列指向 dict に平らにし（着順を埋め込み結果から付与）、
+呼び出し側はファイル単位でキャッシュして factor_frame で連結する。集計は groupby / merge のみ。
+    - label_summary:  要因ラベルごとのプラス/マイナス出現数と、その時の1着率・3着内率
+    - snapshot_drift: 2時点間で同じ馬・同じ要因が「符号反転・新規・圏外へ・順位変化」した量
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+SNAPSHOTS = {
+    "evening": ("🌙 前日", ("shap_factors_evening", "shap_factors")),
+    "morning_early": ("☀️ 10時", ("shap_factors_morning_early",)),
+    "morning": ("🌅 13時", ("shap_factors_morning",)),
+}
+FACTOR_COLUMNS = ["date", "race_id", "馬名", "snapshot", "sign", "rank", "label", "value", "予測順位", "着順"]
+_FACTOR_KEY = ["race_id", "馬名", "label"]
+
+
+def _finish_map(race: dict) -> dict[str, float]:
+    out = {}
+    for r in race.get("result") or []:
+        try:
+            out[r.get("馬名")] = float(r.get("着順"))
+        except (TypeError, ValueError):
+            continue
+    return out
+
+
+def day_factor_rows(date: str, data: dict) -> dict[str, list]:
+    """1日分の SHAP 要因を 1要因1行の列指向 dict（キーは FACTOR_COLUMNS）にする。
+
+    sign はプラス +1 / マイナス −1、rank はリスト内の順位（0 が最も寄与が大きい）。
+    """
+    cols: dict[str, list] = {c: [] for c in FACTOR_COLUMNS}
+    for race in data.get("races") or []:
+        race_id = race.get("race_id", "")
+        finish = _finish_map(race)
+        pred_rank = {p.get("馬名"): p.get("予測順位") for p in race.get("predictions") or []}
+        for snap, (_, keys) in SNAPSHOTS.items():
+            factors = next((race[k] for k in keys if race.get(k)), None)
+            if not isinstance(factors, dict):
+                continue
+            for horse, f in factors.items():
+                if not isinstance(f, dict):
+                    continue
+                for sign_key, sign in (("positive", 1), ("negative", -1)):
+                    for rank, item in enumerate(f.get(sign_key) or []):
+                        cols["date"].append(date)
+                        cols["race_id"].append(race_id)
+                        cols["馬名"].append(horse)
+                        cols["snapshot"].append(snap)
+                        cols["sign"].append(sign)
+                        cols["rank"].append(rank)
+                        cols["label"].append(item.get("label", ""))
+                        cols["value"].append(str(item.get("value", "")))
+                        cols["予測順位"].append(pred_rank.get(horse))
+                        cols["着順"].append(finish.get(horse, np.nan))
+    return cols
+
+
+def factor_frame(days) -> pd.DataFrame:
+    """日別の day_factor_rows を連結した DataFrame。"""
+    days = list(days)
+    df = pd.DataFrame({c: [v for d in days for v in d[c]] for c in FACTOR_COLUMNS})
+    return df.astype({"sign": "int8", "rank": "int8", "着順": "float", "予測順位": "float"})
+
+
+def label_summary(df: pd.DataFrame, snapshot: str = "evening") -> pd.DataFrame:
+    """要因ラベルごとの出現数とプラス率、プラス時/マイナス時の1着率・3着内率（結果確定分）。"""
+    snap = df[df["snapshot"] == snapshot]
+    if snap.empty:
+        return pd.DataFrame()
+    settled = snap[snap["着順"].notna()].assign(
+        win=lambda d: (d["着順"] == 1).astype(float),
+        top3=lambda d: (d["着順"] <= 3).astype(float),
+    )
+    counts = snap.pivot_table(index="label", columns="sign", values="rank", aggfunc="size", fill_value=0)
+    counts = counts.reindex(columns=[1, -1], fill_value=0)
+    rates = settled.pivot_table(index="label", columns="sign", values=["win", "top3"], aggfunc="mean")
+    rates = rates.reindex(columns=pd.MultiIndex.from_product([["win", "top3"], [1, -1]]))
+    out = pd.DataFrame({
+        "出現数": counts[1] + counts[-1],
+        "プラス": counts[1],
+        "マイナス": counts[-1],
+        "プラス率(%)": counts[1] / (counts[1] + counts[-1]) * 100,
+        "1着率_プラス時(%)": rates[("win", 1)] * 100,
+        "1着率_マイナス時(%)": rates[("win", -1)] * 100,
+        "3着内率_プラス時(%)": rates[("top3", 1)] * 100,
+        "3着内率_マイナス時(%)": rates[("top3", -1)] * 100,
+    })
+    out["3着内率の差(pt)"] = out["3着内率_プラス時(%)"] - out["3着内率_マイナス時(%)"]
+    return out.sort_values("出現数", ascending=False).reset_index()
+
+
+def snapshot_drift(df: pd.DataFrame, a: str = "evening", b: str = "morning") -> tuple[pd.DataFrame, dict]:
+    """時点 a → b での要因の入れ替わり（ラベル別表と全体の割合）。
+
+    両時点とも SHAP がある馬だけを対象に、(レース, 馬, 要因) を外部結合して
+    同じ向き・符号反転・新規（b だけ）・圏外へ（a だけ）に分類し、同じ向きの順位変化も測る。
+    同じレースが複数の日付のファイルにあるときは最新の日付の分だけを使う（結合で行が重複しないように）。
+    """
+    df = df[df["date"] == df.groupby("race_id")["date"].transform("max")]
+    horses = df[df["snapshot"].isin([a, b])].groupby(["race_id", "馬名"])["snapshot"].nunique()
+    both = horses[horses == 2].index
+    if both.empty:
+        return pd.DataFrame(), {}
+    keyed = df.set_index(["race_id", "馬名"])
+    keyed = keyed[keyed.index.isin(both)].reset_index()
+    left = keyed[keyed["snapshot"] == a][_FACTOR_KEY + ["sign", "rank"]]
+    right = keyed[keyed["snapshot"] == b][_FACTOR_KEY + ["sign", "rank"]]
+    m = left.merge(right, on=_FACTOR_KEY, how="outer", suffixes=("_a", "_b"))
+    status = np.select(
+        [m["sign_a"].isna(), m["sign_b"].isna(), m["sign_a"] != m["sign_b"]],
+        ["新規", "圏外へ", "符号反転"],
+        default="同じ向き",
+    )
+    m = m.assign(状態=status, 順位変化=(m["rank_b"] - m["rank_a"]).abs().where(status == "同じ向き"))
+    by_label = m.pivot_table(index="label", columns="状態", values="race_id", aggfunc="size", fill_value=0)
+    by_label = by_label.reindex(columns=["同じ向き", "符号反転", "新規", "圏外へ"], fill_value=0)
+    by_label["変動率(%)"] = (1 - by_label["同じ向き"] / by_label.sum(axis=1)) * 100
+    by_label["平均順位変化"] = m.groupby("label")["順位変化"].mean()
+    overall = {
+        "対象馬": int(len(both)),
+        **{k: float(v) for k, v in (pd.Series(status).value_counts(normalize=True) * 100).items()},
+        "平均順位変化": float(m["順位変化"].mean()) if m["順位変化"].notna().any() else 0.0,
+    }
+    return by_label.sort_values("変動率(%)", ascending=False).reset_index(), overall
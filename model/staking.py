@@ -0,0 +1,209 @@
+"""資金管理（ステーキング）シミュレータ。Top1 単勝を買い続けたときの資金推移を比べる。
+
+対象の賭けは 1レース1行の表（bets_from_race_analysis / bets_from_archive）:
+    prob（モデル勝率 0〜1）, odds（購入判断時の単勝）, payout_odds（払戻に使う確定単勝）,
+    won（的中 0/1）, level（勝負度。race_analysis には無いので NaN）
+賭け方（POLICIES）は 2 種類に分かれる:
+    - 定額型（flat / level）: 1レースの賭け金が円で決まる → 資金 = 初期資金 + 損益の累積和
+    - 比例型（kelly）:       資金に対する割合が決まる   → 資金 = 初期資金 × 成長率の累積積
+どちらも (パス数, レース数) の行列演算で、Python のレースループなしに数千パスを計算する。
+モンテカルロは履歴のレースを復元抽出して並べ替えたパスを作る。
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+BET_COLUMNS = ["date", "prob", "odds", "payout_odds", "won", "level"]
+RUIN_LEVEL = 0.1      # 資金が初期の 10% を下回ったら「破産」とみなす
+N_PATHS = 2000
+HORIZON = 500
+MAX_CELLS = 2_500_000     # パス数 × レース数の上限（資金推移 float32 で約 10MB）
+BATCH_CELLS = 250_000     # 一度に資金推移を作るセル数（途中の float64 配列のピークを抑える）
+SEED = 7
+
+POLICIES: dict[str, dict] = {
+    "flat": {"name": "定額（1レース100円）", "kind": "fixed"},
+    "kelly": {"name": "分数ケリー", "kind": "proportional"},
+    "level": {"name": "勝負度別の定額", "kind": "fixed"},
+}
+DEFAULT_LEVEL_STAKES = {0: 0, 1: 100, 2: 200, 3: 300}
+
+
+# ─── 賭けの表 ─────────────────────────────────────────────
+def bets_from_race_analysis(df: pd.DataFrame) -> pd.DataFrame:
+    """race_analysis.csv（Top1 単勝の全レース結果）を賭けの表にする。"""
+    odds = pd.to_numeric(df["Top1単勝"], errors="coerce")
+    bets = pd.DataFrame({
+        "date": df["race_date"].astype(str),
+        "prob": pd.to_numeric(df["Top1勝率"], errors="coerce") / 100,
+        "odds": odds,
+        "payout_odds": odds,
+        "won": pd.to_numeric(df["的中"], errors="coerce"),
+        "level": np.nan,
+    })
+    return bets.dropna(subset=["prob", "odds", "won"]).sort_values("date", kind="stable").reset_index(drop=True)
+
+
+def bets_from_archive(summary: pd.DataFrame) -> pd.DataFrame:
+    """予測アーカイブ（archive.race_summary）の結果確定レースを賭けの表にする。"""
+    done = summary[summary["結果あり"] & summary["Top1単勝"].notna()]
+    odds = done["Top1単勝"].astype(float)
+    bets = pd.DataFrame({
+        "date": done["date"].astype(str),
+        "prob": done["Top1勝率(%)"].astype(float) / 100,
+        "odds": odds,
+        "payout_odds": done["Top1確定単勝"].astype(float).fillna(odds),
+        "won": (done["Top1着順"] == 1).astype(int),
+        "level": done["勝負度"].astype(float),
+    })
+    return bets.sort_values("date", kind="stable").reset_index(drop=True)
+
+
+# ─── 賭け金 ───────────────────────────────────────────────
+def kelly_fraction(prob: np.ndarray, odds: np.ndarray, multiplier: float = 0.25, cap: float = 0.05) -> np.ndarray:
+    """分数ケリーの賭け率 = multiplier × (p × o − 1) / (o − 1)。期待値マイナスは 0、上限 cap。"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        full = (prob * odds - 1) / (odds - 1)
+    return np.clip(np.nan_to_num(full * multiplier, nan=0.0), 0.0, cap)
+
+
+def stake_vector(bets: pd.DataFrame, policy: str, **params) -> np.ndarray:
+    """レースごとの賭け金（定額型は円、比例型は資金に対する割合）。"""
+    if policy == "flat":
+        return np.full(len(bets), float(params.get("stake", 100)))
+    if policy == "kelly":
+        return kelly_fraction(
+            bets["prob"].to_numpy(float), bets["odds"].to_numpy(float),
+            params.get("multiplier", 0.25), params.get("cap", 0.05),
+        )
+    if policy == "level":
+        stakes = params.get("level_stakes", DEFAULT_LEVEL_STAKES)
+        return bets["level"].map(lambda lv: stakes.get(int(lv), 0) if pd.notna(lv) else 0).to_numpy(float)
+    raise KeyError(f"未知の賭け方: {policy}")
+
+
+# ─── シミュレーション ─────────────────────────────────────
+def _equity_paths(
+    returns: np.ndarray, stakes: np.ndarray, kind: str, bankroll: float,
+) -> np.ndarray:
+    """(P, T) の倍率 returns（払戻倍率。外れは 0）と賭け金から (P, T+1) の資金推移を作る。
+
+    定額型は資金が賭け金を下回った時点で以後の賭けを止める（その時点の資金で横ばい）。
+    """
+    paths = returns.shape[0]
+    if kind == "proportional":
+        growth = 1 + stakes * (returns - 1)
+        equity = bankroll * np.cumprod(growth, axis=1)
+    else:
+        equity = bankroll + np.cumsum(stakes * (returns - 1), axis=1)
+        # 各時点で「その賭けの前に資金が足りていたか」。一度足りなくなったら以降は凍結
+        before = np.hstack([np.full((paths, 1), bankroll), equity[:, :-1]])
+        short = np.logical_or.accumulate((before < stakes) & (stakes > 0), axis=1)
+        if short.any():
+            first = np.where(short.any(axis=1), short.argmax(axis=1), equity.shape[1])
+            frozen = np.take_along_axis(before, np.minimum(first, equity.shape[1] - 1)[:, None], axis=1)
+            equity = np.where(short, frozen, equity)
+    return np.hstack([np.full((paths, 1), bankroll), equity]).astype(np.float32)
+
+
+def max_drawdown(equity: np.ndarray) -> np.ndarray:
+    """パスごとの最大ドローダウン（ピークからの下落率 %）。"""
+    peak = np.maximum.accumulate(equity, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dd = np.where(peak > 0, 1 - equity / peak, 0.0)
+    return dd.max(axis=1) * 100
+
+
+def _stats(equity: np.ndarray, bankroll: float) -> dict:
+    final = equity[:, -1]
+    return {
+        "最終資金(中央値)": float(np.median(final)),
+        "最終資金(5%)": float(np.percentile(final, 5)),
+        "最終資金(95%)": float(np.percentile(final, 95)),
+        "増加確率(%)": float((final > bankroll).mean() * 100),
+        "最大DD(中央値%)": float(np.median(max_drawdown(equity))),
+        "破産確率(%)": float((equity.min(axis=1) < bankroll * RUIN_LEVEL).mean() * 100),
+    }
+
+
+def replay(bets: pd.DataFrame, policy: str, bankroll: float = 10_000, **params) -> pd.DataFrame:
+    """履歴の順番どおりに賭けた1本の資金推移（レース番号・日付・資金）。"""
+    stakes = stake_vector(bets, policy, **params)
+    returns = (bets["won"].to_numpy(float) * bets["payout_odds"].to_numpy(float))
+    equity = _equity_paths(returns[None, :], stakes[None, :], POLICIES[policy]["kind"], bankroll)[0]
+    return pd.DataFrame({
+        "レース": np.arange(len(equity)),
+        "日付": [""] + bets["date"].tolist(),
+        "資金": equity,
+    })
+
+
+def capped_paths(n_paths: int, horizon: int) -> int:
+    """パス数 × レース数が MAX_CELLS に収まるよう減らしたパス数。"""
+    return max(1, min(n_paths, MAX_CELLS // max(1, horizon)))
+
+
+def monte_carlo(
+    bets: pd.DataFrame,
+    policy: str,
+    bankroll: float = 10_000,
+    n_paths: int = N_PATHS,
+    horizon: int = HORIZON,
+    seed: int = SEED,
+    **params,
+) -> tuple[pd.DataFrame, dict]:
+    """履歴レースを復元抽出した n_paths 本 × horizon レースの資金推移。
+
+    n_paths は capped_paths で MAX_CELLS 以内に減らし、パスは BATCH_CELLS ずつまとめて作る。
+
+    Returns:
+        (資金の分位点バンド [レース, 5%, 25%, 中央値, 75%, 95%], 統計 dict)
+    """
+    if bets.empty:
+        return pd.DataFrame(columns=["レース", "5%", "25%", "中央値", "75%", "95%"]), {}
+    stakes = stake_vector(bets, policy, **params)
+    returns = bets["won"].to_numpy(float) * bets["payout_odds"].to_numpy(float)
+    n_paths = capped_paths(n_paths, horizon)
+    rng = np.random.default_rng(seed)
+    equity = np.empty((n_paths, horizon + 1), dtype=np.float32)
+    step = max(1, BATCH_CELLS // max(1, horizon))
+    for start in range(0, n_paths, step):
+        stop = min(start + step, n_paths)
+        idx = rng.integers(0, len(bets), size=(stop - start, horizon))
+        equity[start:stop] = _equity_paths(returns[idx], stakes[idx], POLICIES[policy]["kind"], bankroll)
+    q = np.percentile(equity, [5, 25, 50, 75, 95], axis=0)
+    band = pd.DataFrame(q.T, columns=["5%", "25%", "中央値", "75%", "95%"])
+    band.insert(0, "レース", np.arange(equity.shape[1]))
+    return band, _stats(equity, bankroll)
+
+
+def compare_policies(
+    bets: pd.DataFrame,
+    policies: dict[str, dict],
+    bankroll: float = 10_000,
+    n_paths: int = N_PATHS,
+    horizon: int = HORIZON,
+    seed: int = SEED,
+) -> pd.DataFrame:
+    """{policy: params} をすべて同じ乱数（同じ並べ替えパス）で比較した統計表。"""
+    rows = []
+    for policy, params in policies.items():
+        _, stats = monte_carlo(bets, policy, bankroll, n_paths, horizon, seed, **params)
+        rows.append({"賭け方": POLICIES[policy]["name"], **stats})
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from pathlib import Path
+
+    strategy_dir = Path(sys.argv[1] if len(sys.argv) > 1 else "data/strategy")
+    bets = bets_from_race_analysis(pd.read_csv(strategy_dir / "race_analysis.csv"))
+    t0 = time.perf_counter()
+    n_paths = capped_paths(5000, len(bets))
+    table = compare_policies(bets, {"flat": {}, "kelly": {}}, n_paths=n_paths, horizon=len(bets))
+    elapsed = time.perf_counter() - t0
+    print(f"{len(bets)} races x {n_paths} paths x 2 policies in {elapsed:.2f} s")
+    print(table.round(1).to_string(index=False))
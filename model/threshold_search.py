@@ -0,0 +1,268 @@
+"""シグナル閾値のグリッドサーチ（予測アーカイブの結果確定レースで評価）。
+
+race_signals の各シグナルの閾値を PARAM_GRIDS の全組み合わせで評価する。
+    - 評価はベクトル化: 「組み合わせ × レース（または馬）」の bool 行列を1回のブロードキャストで作り、
+      件数・的中・払戻を行列の集計で出す。単勝系はレースごとに並び順最大の1頭（scan_archive と同じ）を
+      セグメント内の累積和で選ぶ。
+    - 組み合わせをチャンクに分け、ProcessPoolExecutor で並列に評価する（workers=1 ならその場で）。
+    - 日付順に学習（前半 train_frac）と検証（後半）に分け、学習期間で選んだ閾値を検証期間で採点する。
+ワイドの払戻は結果データに無いため、ワイド系（promising / dirt_agree）は的中率のみ・回収率は NaN。
+選択基準は単勝系が回収率、ワイド系が的中率。
+
+使い方:
+    python -m model.threshold_search data/predictions --workers 4
+    python -m model.threshold_search data/predictions --signal odds_crash --train 0.6 --min-n 5
+"""
+from __future__ import annotations
+
+import itertools
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from model import race_signals as rs
+
+PARAM_GRIDS: dict[str, dict[str, list]] = {
+    "promising": {
+        "min_dist": [1400, 1600, 1800, 2000, 2200, 2400],
+        "min_fav_rank": [2, 3, 4, 5, 6, 7, 8],
+    },
+    "dirt_agree": {
+        "dist_lo": [1000, 1200, 1400, 1600, 1700, 1801],
+        "dist_hi": [1600, 1800, 2000, 2200, 2400, 2600],
+        "max_fav_rank": [1, 2, 3, 4],
+    },
+    "odds_crash": {
+        "threshold": [round(0.10 + 0.05 * i, 2) for i in range(11)],
+        "min_pred_rank": [1, 2, 3, 4, 5, 6, 7],
+    },
+    "blind_spot": {
+        "max_pop": [1, 2, 3, 4, 5, 6, 7, 8],
+        "min_gap": [2, 3, 4, 5, 6, 7, 8, 9, 10],
+        "max_career": [3, 4, 5, 6, 8, 10, 99],
+    },
+}
+# 現行のハードコード値（race_signals の定数）。odds_crash の「AI4位以下」は min_pred_rank=4
+CURRENT: dict[str, dict] = {
+    "promising": {"min_dist": rs.PROMISING_MIN_DIST, "min_fav_rank": rs.PROMISING_MIN_FAV_RANK},
+    "dirt_agree": {"dist_lo": rs.DIRT_AGREE_DIST[0], "dist_hi": rs.DIRT_AGREE_DIST[1],
+                   "max_fav_rank": rs.DIRT_AGREE_MAX_FAV_RANK},
+    "odds_crash": {"threshold": rs.ODDS_CRASH_THRESHOLD, "min_pred_rank": 4},
+    "blind_spot": {"max_pop": rs.BLIND_SPOT_MAX_POP, "min_gap": rs.BLIND_SPOT_MIN_GAP,
+                   "max_career": rs.BLIND_SPOT_MAX_CAREER},
+}
+WIN_SIGNALS = {"odds_crash", "blind_spot"}
+CHUNK = 64  # 1タスクあたりの組み合わせ数
+METRICS = ["件数", "的中数", "的中率", "回収率"]
+
+
+def grid(signal: str) -> list[dict]:
+    """signal の全組み合わせ（矛盾する範囲 dist_lo > dist_hi は除く）。"""
+    names = list(PARAM_GRIDS[signal])
+    points = [dict(zip(names, values)) for values in itertools.product(*PARAM_GRIDS[signal].values())]
+    return [p for p in points if p.get("dist_lo", 0) <= p.get("dist_hi", math.inf)]
+
+
+def prepare(summary: pd.DataFrame, horses: pd.DataFrame, signal: str) -> dict[str, np.ndarray]:
+    """結果確定レースだけを取り出し、signal の評価に使う列を numpy 配列にする。
+
+    単勝系は馬をレース順・並び順（急落率 / 予測順位−人気）の降順に並べ、
+    seg_start に各馬が属するレースの先頭位置を持たせる。
+    """
+    settled = summary[summary["結果あり"].fillna(False).astype(bool)]
+    if signal not in WIN_SIGNALS:
+        both = {"promising": ("Top1", "1人気"), "dirt_agree": ("1人気", "2人気")}[signal]
+        hit = (settled[f"{both[0]}着順"] <= 3) & (settled[f"{both[1]}着順"] <= 3)
+        return {
+            "date": settled["date"].to_numpy(str),
+            "surface": settled["芝ダ"].to_numpy(object),
+            "dist": settled["距離"].to_numpy(float),
+            "fav_rank": settled["1人気予測順位"].to_numpy(float),
+            "hit": hit.to_numpy(bool),
+            "payout": np.full(len(settled), np.nan),
+        }
+    h = horses.merge(settled[rs.RACE_KEY], on=rs.RACE_KEY)
+    if signal == "odds_crash":
+        order = (h["単勝_evening"] - h["単勝"]) / h["単勝_evening"]
+    else:
+        order = h["予測順位"] - h["人気"]
+    h = h.assign(_order=order).sort_values(rs.RACE_KEY + ["_order"], ascending=[True, True, False],
+                                           kind="stable").reset_index(drop=True)
+    race_no = h.groupby(rs.RACE_KEY, sort=False).ngroup().to_numpy()
+    first = np.r_[True, race_no[1:] != race_no[:-1]]
+    won = (h["着順"] == 1).to_numpy(bool)
+    return {
+        "date": h["date"].to_numpy(str),
+        "seg_start": np.maximum.accumulate(np.where(first, np.arange(len(h)), 0)),
+        "evening": h["単勝_evening"].to_numpy(float),
+        "odds": h["単勝"].to_numpy(float),
+        "drop": h["_order"].to_numpy(float) if signal == "odds_crash" else np.full(len(h), np.nan),
+        "gap": h["_order"].to_numpy(float) if signal == "blind_spot" else np.full(len(h), np.nan),
+        "pop": h["人気"].to_numpy(float),
+        "pred_rank": h["予測順位"].to_numpy(float),
+        "career": h["career"].fillna(99).to_numpy(float),
+        "hit": won,
+        "payout": np.where(won, h["確定単勝"].fillna(0).to_numpy(float) * 100, 0.0),
+    }
+
+
+def _col(points: list[dict], name: str) -> np.ndarray:
+    return np.array([p[name] for p in points], dtype=float)[:, None]
+
+
+def _masks(signal: str, points: list[dict], d: dict[str, np.ndarray]) -> np.ndarray:
+    """組み合わせ × 行 の bool 行列（race_signals の各 _scan_* と同じ条件）。"""
+    with np.errstate(invalid="ignore"):
+        if signal == "promising":
+            return (d["surface"] == "芝") & (d["dist"] >= _col(points, "min_dist")) \
+                & (d["fav_rank"] >= _col(points, "min_fav_rank"))
+        if signal == "dirt_agree":
+            return (d["surface"] == "ダート") & (d["dist"] >= _col(points, "dist_lo")) \
+                & (d["dist"] <= _col(points, "dist_hi")) & (d["fav_rank"] <= _col(points, "max_fav_rank"))
+        if signal == "odds_crash":
+            return (d["evening"] > 0) & (d["odds"] > 0) & (d["drop"] >= _col(points, "threshold")) \
+                & (d["pred_rank"] >= _col(points, "min_pred_rank"))
+        return (d["pop"] >= 1) & (d["pop"] <= _col(points, "max_pop")) & (d["gap"] >= _col(points, "min_gap")) \
+            & (d["career"] < _col(points, "max_career"))
+
+
+def _first_per_race(mask: np.ndarray, seg_start: np.ndarray) -> np.ndarray:
+    """各レースで条件を満たす最初の馬（= 並び順最大の1頭）だけ True にする。"""
+    cs = np.cumsum(mask, axis=1)
+    before = np.where(seg_start > 0, cs[:, np.maximum(seg_start - 1, 0)], 0)
+    return mask & (cs - before == 1)
+
+
+def _score(bets: np.ndarray, d: dict[str, np.ndarray], period: np.ndarray, prefix: str) -> dict[str, np.ndarray]:
+    b = bets & period
+    n = b.sum(axis=1)
+    hits = (b & d["hit"]).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rate = np.where(n > 0, hits / n * 100, np.nan)
+        roi = np.where(n > 0, (b * np.nan_to_num(d["payout"])).sum(axis=1) / (n * 100) * 100, np.nan)
+    if np.isnan(d["payout"]).all():
+        roi = np.full(len(n), np.nan)
+    return {f"{prefix}_件数": n, f"{prefix}_的中数": hits, f"{prefix}_的中率": rate, f"{prefix}_回収率": roi}
+
+
+def evaluate(signal: str, points: list[dict], d: dict[str, np.ndarray], cut: str) -> pd.DataFrame:
+    """組み合わせごとの学習（日付が cut より前）・検証（cut 以降）・全期間の成績。"""
+    bets = _masks(signal, points, d)
+    if signal in WIN_SIGNALS:
+        bets = _first_per_race(bets, d["seg_start"])
+    train = d["date"] < cut
+    out = pd.DataFrame(points)
+    for prefix, period in (("学習", train), ("検証", ~train), ("全期間", np.ones_like(train))):
+        out = out.assign(**_score(bets, d, period, prefix))
+    return out
+
+
+_WORKER_DATA: dict = {}
+
+
+def _init_worker(signal: str, data: dict, cut: str) -> None:
+    _WORKER_DATA.update(signal=signal, data=data, cut=cut)
+
+
+def _evaluate_chunk(points: list[dict]) -> pd.DataFrame:
+    return evaluate(_WORKER_DATA["signal"], points, _WORKER_DATA["data"], _WORKER_DATA["cut"])
+
+
+def split_date(dates, train_frac: float) -> str:
+    """日付順に train_frac の割合を学習に回すときの、検証期間の最初の日付。"""
+    uniq = sorted(set(dates))
+    if not uniq:
+        return ""
+    k = min(len(uniq) - 1, max(1, math.ceil(len(uniq) * train_frac)))
+    return uniq[k]
+
+
+def search(summary: pd.DataFrame, horses: pd.DataFrame, signal: str, train_frac: float = 0.7,
+           workers: int | None = 1) -> tuple[pd.DataFrame, str]:
+    """signal の全組み合わせを評価した表と、学習/検証の境目の日付を返す。"""
+    data = prepare(summary, horses, signal)
+    cut = split_date(data["date"], train_frac)
+    points = grid(signal)
+    chunks = [points[i:i + CHUNK] for i in range(0, len(points), CHUNK)]
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(chunks) <= 1:
+        parts = [evaluate(signal, c, data, cut) for c in chunks]
+    else:
+        with ProcessPoolExecutor(min(workers, len(chunks)), initializer=_init_worker,
+                                 initargs=(signal, data, cut)) as pool:
+            parts = list(pool.map(_evaluate_chunk, chunks))
+    return pd.concat(parts, ignore_index=True), cut
+
+
+def objective(signal: str) -> str:
+    return "回収率" if signal in WIN_SIGNALS else "的中率"
+
+
+def pick_best(table: pd.DataFrame, signal: str, min_n: int = 10) -> pd.Series | None:
+    """学習期間の件数が min_n 以上の組み合わせのうち、学習期間の目的指標が最大のもの（同点は件数の多い方）。"""
+    metric = f"学習_{objective(signal)}"
+    ok = table[(table["学習_件数"] >= min_n) & table[metric].notna()]
+    if ok.empty:
+        return None
+    return ok.sort_values([metric, "学習_件数"], ascending=False).iloc[0]
+
+
+def current_row(table: pd.DataFrame, signal: str) -> pd.Series | None:
+    """現行の閾値の行（グリッドに含まれない場合は None）。"""
+    m = np.ones(len(table), dtype=bool)
+    for name, value in CURRENT[signal].items():
+        m &= np.isclose(table[name].to_numpy(float), float(value))
+    return table[m].iloc[0] if m.any() else None
+
+
+def surface(table: pd.DataFrame, x: str, y: str, value: str, fixed: dict | None = None) -> pd.DataFrame:
+    """2つのパラメータ（y 行 × x 列）に対する value の表。残りのパラメータは fixed の値で固定。"""
+    sub = table
+    for name, v in (fixed or {}).items():
+        if name not in (x, y):
+            sub = sub[np.isclose(sub[name].to_numpy(float), float(v))]
+    return sub.pivot_table(index=y, columns=x, values=value, aggfunc="first")
+
+
+def load_frames(pred_dir: Path) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """予測ディレクトリから (レースサマリー, 馬テーブル) を作る（CLI 用。アプリはキャッシュ済みのものを渡す）。"""
+    from model.archive import day_horse_rows, day_race_rows, horse_frame, race_frame, race_summary
+    from model.pred_codec import find_prediction_files, load_prediction
+
+    race_rows, horse_rows = [], []
+    for date, path in sorted(find_prediction_files(Path(pred_dir)).items()):
+        data = load_prediction(path)
+        race_rows.append(day_race_rows(date, data))
+        horse_rows.append(day_horse_rows(date, data))
+    races, horses = race_frame(race_rows), horse_frame(horse_rows)
+    return race_summary(races, horses), horses
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="シグナル閾値のグリッドサーチ")
+    parser.add_argument("pred_dir", type=Path, nargs="?", default=Path("data/predictions"))
+    parser.add_argument("--signal", choices=list(PARAM_GRIDS), action="append")
+    parser.add_argument("--train", type=float, default=0.7, help="学習に使う日付の割合（日付順の前半）")
+    parser.add_argument("--min-n", type=int, default=10, help="学習期間の最低件数")
+    parser.add_argument("--workers", type=int, default=0, help="プロセス数（0 = CPU 数）")
+    parser.add_argument("--csv", type=Path, help="全組み合わせの表を書き出すディレクトリ")
+    opts = parser.parse_args()
+    summary, horses = load_frames(opts.pred_dir)
+    for sig in opts.signal or list(PARAM_GRIDS):
+        t0 = time.perf_counter()
+        table, cut = search(summary, horses, sig, opts.train, opts.workers or None)
+        print(f"\n== {rs.SIGNALS[sig]['name']}  {len(table)} 通り  学習 <{cut}≤ 検証  "
+              f"({time.perf_counter() - t0:.2f}s)")
+        cols = list(PARAM_GRIDS[sig]) + [f"{p}_{m}" for p in ("学習", "検証") for m in METRICS]
+        rows = {"現行": current_row(table, sig), "最良(学習)": pick_best(table, sig, opts.min_n)}
+        print(pd.DataFrame({k: v[cols] for k, v in rows.items() if v is not None}).T.to_string())
+        if opts.csv:
+            opts.csv.mkdir(parents=True, exist_ok=True)
+            table.to_csv(opts.csv / f"threshold_{sig}.csv", index=False)
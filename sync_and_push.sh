@@ -10,6 +10,12 @@ PUBLIC_DIR="$PROJECT_DIR/public"
 # 予測JSONをコピー
 cp "$PROJECT_DIR/data/predictions/"*.json "$PUBLIC_DIR/data/predictions/" 2>/dev/null || true
 
+# コンパクト形式（.mhp）を再生成（鮮度の合うものはスキップ。アプリは .mhp を優先して読む）
+(cd "$PUBLIC_DIR" && python3 -m model.pred_codec convert data/predictions > /dev/null) || true
+
+# 予測の版を記録（前日 → 10時 → 13時。変わった日付だけ直前の版との差分を追加する）
+(cd "$PUBLIC_DIR" && python3 -m model.pred_versions record data/predictions > /dev/null) || true
+
 # AIコメントをコピー
 mkdir -p "$PUBLIC_DIR/data/ai_comments"
 cp "$PROJECT_DIR/data/ai_comments/"*.json "$PUBLIC_DIR/data/ai_comments/" 2>/dev/null || true
@@ -22,6 +28,9 @@ mkdir -p "$PUBLIC_DIR/data/strategy"
 cp "$PROJECT_DIR/data/strategy/filter_results.csv" "$PUBLIC_DIR/data/strategy/" 2>/dev/null || true
 cp "$PROJECT_DIR/data/strategy/race_analysis.csv" "$PUBLIC_DIR/data/strategy/" 2>/dev/null || true
 
+# mmap ストアを作り直す（起動中のアプリは次のリランで新しいストアに切り替わる）
+(cd "$PUBLIC_DIR" && python3 -m model.mmap_store build data > /dev/null) || true
+
 # git push
 cd "$PUBLIC_DIR"
 git add -A
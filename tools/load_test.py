@@ -0,0 +1,266 @@
+"""app.py の同時セッション負荷試験（開発用。streamlit.testing の AppTest を使うローカル負荷生成器）。
+
+本番の Streamlit サーバーは 1プロセスの中でセッションごとにスレッドを立てて
+スクリプトを再実行する。ここでも同じく、1ワーカー（= 1プロセス = 1レプリカ相当）の中で
+--sessions 本のスレッドがそれぞれ AppTest を持ち、キャッシュ（st.cache_data /
+st.cache_resource）はプロセス内で共有される。ワーカーは multiprocessing で --workers 個。
+
+各セッションはアプリを開いたあと、重み付きの操作（STEPS）をランダムに --steps 回行う。
+操作の間には --think 秒（一様乱数の上限）の待ちを入れる。1操作 = 1リランの所要時間を記録し、
+操作別・全体の p50 / p95 / p99 と、ワーカーごとの CPU 時間・CPU 使用率・RSS を出す。
+
+    - レースの展開（st.expander）は AppTest では常に中身まで描画されるため、
+      「レースを開く」はレース単位の表示を切り替える組み合わせ確率の入力で代用している。
+    - 計測値には AppTest 自体のオーバーヘッド（要素ツリーの組み立て）も含まれる。
+      キャッシュや描画の変更の前後比較に使う（絶対値の目安ではない）。
+
+使い方:
+    python tools/load_test.py --workers 2 --sessions 4 --steps 10
+    python tools/load_test.py --workers 1 --sessions 8 --json /tmp/load.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from pathlib import Path
+
+APP_PATH = Path(__file__).resolve().parent.parent / "app.py"
+RERUN_TIMEOUT = 600  # 秒（同時実行が多いと1リランが長くなる）
+
+
+def _pick(rng: random.Random, options: list):
+    return options[rng.randrange(len(options))] if options else None
+
+
+def _widget(getter, key: str):
+    try:
+        return getter(key=key)
+    except (KeyError, IndexError):
+        return None
+
+
+def _step_pick_date(at, rng):
+    w = _widget(at.selectbox, "pred_date")
+    return w is not None and w.select(_pick(rng, w.options))
+
+
+def _step_race_detail(at, rng):
+    w = _widget(at.radio, "pred_exotic_src")
+    return w is not None and w.set_value(_pick(rng, w.options))
+
+
+def _step_fight_date(at, rng):
+    w = _widget(at.selectbox, "fight_date")
+    return w is not None and w.select(_pick(rng, w.options))
+
+
+def _step_cal_day(at, rng):
+    # カレンダーはカスタムコンポーネントで AppTest から押せないので、選択結果（cal_selected）を直接入れる。
+    # 月の移動はブラウザ内で完結しリランしないため、操作としては計測しない
+    w = _widget(at.selectbox, "pred_date")
+    if w is None or not w.options:
+        return False
+    at.session_state["cal_selected"] = _pick(rng, w.options)
+    return at
+
+
+def _step_bt_slider(at, rng):
+    key, lo, hi = rng.choice([("bt_min_races", 10, 200), ("bt_top_n", 10, 100), ("bt_min_lower", 0, 120)])
+    w = _widget(at.slider, key)
+    if w is None:
+        return False
+    step = 5 if key == "bt_min_lower" else 1
+    return w.set_value(lo + step * rng.randrange((hi - lo) // step + 1))
+
+
+def _step_bt_ci(at, rng):
+    w = _widget(at.toggle, "bt_ci")
+    return w is not None and w.set_value(not w.value)
+
+
+# 操作名 → (重み, 関数)。関数は AppTest の入力を変更し、実行できなければ False を返す
+STEPS = {
+    "pick_date": (4, _step_pick_date),
+    "race_detail": (3, _step_race_detail),
+    "fight_date": (2, _step_fight_date),
+    "cal_day": (3, _step_cal_day),
+    "bt_slider": (3, _step_bt_slider),
+    "bt_ci": (1, _step_bt_ci),
+}
+
+
+def _rss_mb() -> float:
+    """現在の RSS（MB）。/proc が無い環境では最大 RSS で代用する。"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _pin_runtime() -> None:
+    """AppTest はリランごとにモックの Runtime を差し込み、終わると None に戻す。
+    同じプロセスで複数セッションを同時に走らせると、他のセッションのリラン中に
+    Runtime が消えてしまうので、最後に見えたものを使い続けるようにする（このワーカー内だけ）。
+    Streamlit の内部（Runtime._instance）に依存するので、Streamlit を上げたら動作を確かめ直す。
+    """
+    from streamlit.runtime import Runtime
+
+    pinned: dict = {}
+
+    def _current(cls):
+        if cls._instance is not None:
+            pinned["runtime"] = cls._instance
+        return pinned.get("runtime")
+
+    def instance(cls):
+        runtime = _current(cls)
+        if runtime is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return runtime
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: _current(cls) is not None)
+
+
+def _session(app_path: str, seed: int, steps: int, think: float, samples: list, lock: threading.Lock) -> None:
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed)
+    at = AppTest.from_file(app_path, default_timeout=RERUN_TIMEOUT)
+
+    def _timed(name: str, run) -> None:
+        t0 = time.perf_counter()
+        try:
+            run()
+            ok = not at.exception
+        except Exception:
+            ok = False
+        with lock:
+            samples.append((name, time.perf_counter() - t0, ok))
+
+    _timed("open", at.run)
+    names = list(STEPS)
+    weights = [STEPS[n][0] for n in names]
+    for _ in range(steps):
+        if think > 0:
+            time.sleep(rng.uniform(0, think))
+        name = rng.choices(names, weights)[0]
+        try:
+            widget = STEPS[name][1](at, rng)
+        except Exception:
+            widget = False
+        if widget:
+            _timed(name, widget.run)
+
+
+def _worker(args: tuple) -> dict:
+    """1ワーカー（プロセス）分のセッションを同時に走らせ、計測値を返す。"""
+    worker_id, app_path, sessions, steps, think, seed = args
+    samples: list[tuple[str, float, bool]] = []
+    lock = threading.Lock()
+    _pin_runtime()
+    wall0, cpu0 = time.perf_counter(), os.times()
+    threads = [
+        threading.Thread(target=_session, args=(app_path, seed + worker_id * 1000 + i, steps, think, samples, lock))
+        for i in range(sessions)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    cpu1 = os.times()
+    wall = time.perf_counter() - wall0
+    cpu = (cpu1.user - cpu0.user) + (cpu1.system - cpu0.system)
+    return {
+        "worker": worker_id,
+        "samples": samples,
+        "wall_s": wall,
+        "cpu_s": cpu,
+        "cpu_pct": cpu / wall * 100 if wall else 0.0,
+        "rss_mb": _rss_mb(),
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def percentile(values: list[float], q: float) -> float:
+    """最近順位法のパーセンタイル（q は 0〜100）。"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(-(-q * len(ordered) // 100)) - 1))]
+
+
+def latency_table(samples: list[tuple[str, float, bool]]) -> list[dict]:
+    """操作別と全体（"ALL"。初回表示 open は除く）のリラン時間の分布（ms）。"""
+    by_step: dict[str, list[float]] = {}
+    errors: dict[str, int] = {}
+    for name, sec, ok in samples:
+        by_step.setdefault(name, []).append(sec * 1000)
+        errors[name] = errors.get(name, 0) + (not ok)
+    by_step["ALL"] = [sec * 1000 for name, sec, _ in samples if name != "open"]
+    errors["ALL"] = sum(n for k, n in errors.items() if k != "open")
+    return [
+        {
+            "操作": name,
+            "回数": len(v),
+            "エラー": errors.get(name, 0),
+            "p50(ms)": percentile(v, 50),
+            "p95(ms)": percentile(v, 95),
+            "p99(ms)": percentile(v, 99),
+            "最大(ms)": max(v) if v else float("nan"),
+        }
+        for name, v in by_step.items()
+    ]
+
+
+def run(workers: int, sessions: int, steps: int, think: float = 1.0, seed: int = 0,
+        app_path: Path = APP_PATH) -> dict:
+    """負荷試験を実行して {latency, workers, config} を返す。"""
+    jobs = [(w, str(app_path), sessions, steps, think, seed) for w in range(workers)]
+    ctx = multiprocessing.get_context("spawn")  # 親プロセスの Streamlit 状態を引き継がない
+    with ctx.Pool(workers) as pool:
+        results = pool.map(_worker, jobs)
+    samples = [s for r in results for s in r["samples"]]
+    return {
+        "config": {"workers": workers, "sessions": sessions, "steps": steps, "think": think, "seed": seed},
+        "latency": latency_table(samples),
+        "workers": [{k: v for k, v in r.items() if k != "samples"} for r in results],
+    }
+
+
+def _print_report(report: dict) -> None:
+    cfg = report["config"]
+    print(f"workers={cfg['workers']} sessions/worker={cfg['sessions']} steps/session={cfg['steps']} "
+          f"think<= {cfg['think']}s")
+    print(f"{'操作':<12}{'回数':>6}{'エラー':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'最大':>10}  (ms)")
+    for row in report["latency"]:
+        print(f"{row['操作']:<12}{row['回数']:>6}{row['エラー']:>6}"
+              f"{row['p50(ms)']:>10.0f}{row['p95(ms)']:>10.0f}{row['p99(ms)']:>10.0f}{row['最大(ms)']:>10.0f}")
+    for w in report["workers"]:
+        print(f"worker {w['worker']}: wall {w['wall_s']:.1f}s  CPU {w['cpu_s']:.1f}s ({w['cpu_pct']:.0f}%)  "
+              f"RSS {w['rss_mb']:.0f}MB (max {w['max_rss_mb']:.0f}MB)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=1, help="プロセス数（レプリカ相当）")
+    parser.add_argument("--sessions", type=int, default=4, help="1ワーカーあたりの同時セッション数")
+    parser.add_argument("--steps", type=int, default=10, help="1セッションあたりの操作回数")
+    parser.add_argument("--think", type=float, default=1.0, help="操作間の待ち時間の上限（秒）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--app", type=Path, default=APP_PATH)
+    parser.add_argument("--json", type=Path, help="結果を JSON で書き出す")
+    opts = parser.parse_args()
+    report = run(opts.workers, opts.sessions, opts.steps, opts.think, opts.seed, opts.app)
+    _print_report(report)
+    if opts.json:
+        opts.json.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    sys.exit(1 if any(row["エラー"] for row in report["latency"]) else 0)
@@ -0,0 +1,54 @@
+"""データ更新後のリランの確認（開発用。streamlit.testing の AppTest を使う）。
+
+mmap ストアを用意してアプリを開き、予測ファイル・AIコメントの mtime を1秒進めてからリランする。
+変更検知（_invalidate_changed_files）→ ストアの裏での作り直し → ファイル単位キャッシュの破棄、
+の経路で例外が出ないことを確かめる。進めた mtime は最後に元に戻す。
+
+使い方:
+    python tools/rerun_check.py
+"""
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+RERUN_TIMEOUT = 300
+
+
+def _bump(path: Path) -> tuple[int, int]:
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    return st.st_atime_ns, st.st_mtime_ns
+
+
+def main() -> int:
+    from streamlit.testing.v1 import AppTest
+
+    subprocess.run([sys.executable, "-m", "model.mmap_store", "build", "data"], cwd=ROOT, check=True)
+    targets = [
+        max((ROOT / "data" / "predictions").glob("*.json"), default=None),
+        max((ROOT / "data" / "ai_comments").glob("*.json"), default=None),
+    ]
+    targets = [p for p in targets if p is not None]
+    at = AppTest.from_file(str(ROOT / "app.py"), default_timeout=RERUN_TIMEOUT).run()
+    failures = [f"初回: {e.value}" for e in at.exception]
+    saved = {p: _bump(p) for p in targets}
+    try:
+        at.run()
+        failures += [f"変更後: {e.value}" for e in at.exception]
+        at.run()
+        failures += [f"変更後2回目: {e.value}" for e in at.exception]
+    finally:
+        for p, times in saved.items():
+            os.utime(p, ns=times)
+    for line in failures:
+        print(line)
+    print("OK" if not failures else f"{len(failures)} 件の例外")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())